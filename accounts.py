@@ -0,0 +1,426 @@
+"""
+Multi-account sync: refresh many accounts' sources in parallel processes.
+
+Each account has its own OAuth token cache and its own DuckDB file (or a
+schema inside a shared file) and snapshot directory. Accounts are sharded
+across a process pool by database file, since a DuckDB file can only be
+written by one process; within a worker, accounts that share a file
+share one connection.
+
+Every worker draws from one global rate limiter (a token bucket in shared
+memory), so adding processes does not add 429s, and from one catalogue
+cache (a SQLite file in WAL mode, safe for concurrent processes) in front
+of the track / album / artist lookups, so a track popular across accounts
+is fetched once per max_age, not once per account. Cache hits are not
+counted as API calls in the sync catalog.
+
+accounts.json is a list of accounts:
+[
+  {"name": "alice"},
+  {"name": "bob", "database": "household.duckdb", "schema": "bob",
+   "sources": ["my_liked_songs", "recently_played"],
+   "extra_sources": {"Adele": ["artist", "4dpARuHxo51G3z768sgnrY"]}}
+]
+Defaults: database <name>.duckdb, token cache .cache-<name>, snapshots
+under snapshots/<name>, every source in sync.SOURCES.
+
+Example:
+python accounts.py accounts.json --workers 4 --rate 20
+results = run_accounts(load_accounts("accounts.json"), workers=4)
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urlsplit, parse_qsl
+
+
+CATALOG_CACHE_PATH = os.environ.get("SPOTIFYDB_CATALOG_CACHE", "catalog_cache.sqlite")
+
+# catalogue objects are shared across accounts for this long (popularity drifts)
+CATALOG_MAX_AGE = 24 * 60 * 60
+
+# GET /v1/{tracks,albums,artists}/{id} and GET /v1/{tracks,albums,artists}?ids=...
+_CATALOG_PATH = re.compile(r"/v1/(tracks|albums|artists)(?:/([0-9A-Za-z]{22}))?/?$")
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every process it is handed to at pool start-up:
+    at most `rate` requests per second overall, with bursts of `burst`.
+
+    Example:
+    limiter = RateLimiter(rate=20)
+    limiter.wait()  # before each request
+    """
+
+    def __init__(self, rate, burst=1):
+        self.interval = 1.0 / rate
+        self.burst = max(1, burst)
+        # earliest time the next request may start (epoch seconds)
+        self._next = multiprocessing.Value("d", 0.0)
+
+    def wait(self):
+        """
+        Block until this caller's slot comes up.
+        """
+        with self._next.get_lock():
+            now = time.time()
+            slot = max(self._next.value, now - (self.burst - 1) * self.interval)
+            self._next.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CatalogCache:
+    """
+    Track, album and artist objects keyed by (kind, id, market), in a
+    SQLite file that any number of processes can read and write.
+    The connection is opened per process on first use.
+    """
+
+    def __init__(self, path=CATALOG_CACHE_PATH, max_age=CATALOG_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._con = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path, "max_age": self.max_age}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self._con is None or self._pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS catalog (
+                kind TEXT,
+                id TEXT,
+                market TEXT,
+                body TEXT,
+                fetched_at REAL,
+                PRIMARY KEY (kind, id, market)
+            );
+            """)
+            con.commit()
+            self._con, self._pid = con, os.getpid()
+        return self._con
+
+    def get_many(self, kind, ids, market=""):
+        """
+        Return {id: object} for the ids cached less than max_age ago.
+        """
+        found = {}
+        with self._lock:
+            con = self._connect()
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = con.execute(f"""
+                    SELECT id, body FROM catalog
+                    WHERE kind = ? AND market = ? AND fetched_at >= ?
+                      AND id IN ({", ".join("?" for _ in batch)});
+                """, [kind, market, time.time() - self.max_age, *batch]).fetchall()
+                found.update((id_, json.loads(body)) for id_, body in rows)
+            self.hits += sum(1 for i in set(ids) if i in found)
+            self.misses += sum(1 for i in set(ids) if i not in found)
+        return found
+
+    def put_many(self, kind, objects, market=""):
+        """
+        Store {id: object}; None objects (unknown ids) are skipped.
+        """
+        now = time.time()
+        rows = [(kind, id_, market, json.dumps(obj), now) for id_, obj in objects.items() if obj]
+        if not rows:
+            return
+        with self._lock:
+            con = self._connect()
+            con.executemany("INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?);", rows)
+            con.commit()
+
+    def stats(self):
+        return {"cache_hits": self.hits, "cache_misses": self.misses}
+
+
+def _json_response(url, body):
+    import requests
+
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = url
+    response.encoding = "utf-8"
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps(body).encode()
+    return response
+
+
+def share_session(session, limiter=None, cache=None):
+    """
+    Route a requests.Session through the shared rate limiter and serve
+    catalogue lookups from the shared cache, fetching only missing ids.
+
+    Install after instrument_session so cache hits are not counted as calls.
+
+    Example:
+    instrument_spotify(sp, stats)
+    share_session(sp._session, RateLimiter(20), CatalogCache())
+    """
+    request = session.request
+
+    def limited_request(method, url, *args, **kwargs):
+        if limiter is not None:
+            limiter.wait()
+        return request(method, url, *args, **kwargs)
+
+    def shared_request(method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        match = _CATALOG_PATH.search(parts.path)
+        if cache is None or method.upper() != "GET" or match is None or args:
+            return limited_request(method, url, *args, **kwargs)
+
+        params = {k: v for k, v in parse_qsl(parts.query)}
+        params.update({k: v for k, v in (kwargs.get("params") or {}).items() if v is not None})
+        kind, one = match.groups()
+        market = str(params.pop("market", "") or "")
+        ids = [one] if one else [i for i in str(params.pop("ids", "")).split(",") if i]
+        if not ids or params:
+            return limited_request(method, url, *args, **kwargs)
+
+        found = cache.get_many(kind, ids, market)
+        missing = [i for i in dict.fromkeys(ids) if i not in found]
+
+        if one and missing:
+            response = limited_request(method, url, *args, **kwargs)
+            if response.status_code == 200:
+                cache.put_many(kind, {one: response.json()}, market)
+            return response
+
+        if missing:
+            fetch_params = {"ids": ",".join(missing)}
+            if market:
+                fetch_params["market"] = market
+            response = limited_request(
+                method, parts._replace(query="").geturl(), **{**kwargs, "params": fetch_params}
+            )
+            if response.status_code != 200:
+                return response
+            fetched = dict(zip(missing, response.json()[kind]))
+            cache.put_many(kind, fetched, market)
+            found.update(fetched)
+
+        if one:
+            return _json_response(url, found[one])
+        return _json_response(url, {kind: [found.get(i) for i in ids]})
+
+    session.request = shared_request
+    return session
+
+
+def load_accounts(path):
+    """
+    Read an accounts JSON file (a list of account dicts).
+    """
+    with open(path) as f:
+        accounts = json.load(f)
+    names = [a["name"] for a in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate account names in {path}")
+    return accounts
+
+
+def account_sources(account):
+    """
+    Return table_name -> (source_type, source_id) for an account.
+    """
+    import sync
+
+    names = account.get("sources") or list(sync.SOURCES)
+    unknown = [n for n in names if n not in sync.SOURCES]
+    if unknown:
+        raise ValueError(f"{account['name']}: unknown source(s) {unknown}")
+    sources = {n: sync.SOURCES[n] for n in names}
+    sources.update({n: tuple(s) for n, s in (account.get("extra_sources") or {}).items()})
+    return sources
+
+
+def account_client(account):
+    """
+    Spotify client for one account: its own token cache, or a fixed access
+    token ("auth"); "prefix" points the client at another API base URL.
+    """
+    import transport
+
+    if account.get("auth"):
+        sp = transport.spotify_client(auth=account["auth"])
+    else:
+        sp = transport.oauth_client(
+            account.get("client_id"),
+            account.get("client_secret"),
+            cache_path=account.get("cache_path", f".cache-{account['name']}"),
+            open_browser=False,
+        )
+    if account.get("prefix"):
+        sp.prefix = account["prefix"]
+    return sp
+
+
+def shards(accounts):
+    """
+    Group accounts by database file: one shard is synced by one process.
+    """
+    groups = {}
+    for account in accounts:
+        database = os.path.abspath(account.get("database", f"{account['name']}.duckdb"))
+        groups.setdefault(database, []).append(account)
+    return list(groups.values())
+
+
+# ---- worker processes ----
+
+_limiter = None
+_cache = None
+_connections = {}  # database path -> connection, reused by every account in it
+
+
+def _init_worker(limiter, cache):
+    global _limiter, _cache
+    _limiter, _cache = limiter, cache
+
+
+def _connect(database):
+    import duckdb
+
+    con = _connections.get(database)
+    if con is None:
+        con = _connections[database] = duckdb.connect(database)
+    return con
+
+
+def sync_account(account, max_age_days=1.0):
+    """
+    Sync every source of one account in this process. Returns a summary dict.
+    """
+    import snapshots
+    import sync
+    from instrumentation import ApiStats, instrument_spotify
+
+    start = time.perf_counter()
+    cache_before = _cache.stats() if _cache else {}
+    summary = {"account": account["name"], "pid": os.getpid(), "sources": {}, "error": None}
+
+    try:
+        sources = account_sources(account)
+        con = _connect(os.path.abspath(account.get("database", f"{account['name']}.duckdb")))
+        if account.get("schema"):
+            con.execute(f'CREATE SCHEMA IF NOT EXISTS "{account["schema"]}";')
+            con.execute(f'USE "{account["schema"]}";')
+        else:
+            con.execute("USE main;")
+
+        sp = account_client(account)
+        api_stats = ApiStats()
+        instrument_spotify(sp, api_stats)
+        share_session(sp._session, _limiter, _cache)
+
+        syncer = sync.Syncer(
+            sp, con, api_stats=api_stats,
+            snapshot_root=account.get("snapshot_root", os.path.join(snapshots.SNAPSHOT_ROOT, account["name"])),
+        )
+        try:
+            for table_name, (source_type, source_id) in sources.items():
+                try:
+                    result = syncer.sync(table_name, source_type, source_id, max_age_days=max_age_days)
+                except Exception as e:
+                    result = {"table_name": table_name, "error": f"{type(e).__name__}: {e}"}
+                summary["sources"][table_name] = result
+        finally:
+            syncer.close()
+        summary["api"] = api_stats.totals()
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    if _cache:
+        summary.update({k: v - cache_before[k] for k, v in _cache.stats().items()})
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def _sync_shard(accounts, max_age_days):
+    return [sync_account(account, max_age_days) for account in accounts]
+
+
+def run_accounts(accounts, workers=None, rate=20.0, burst=10,
+                 cache_path=CATALOG_CACHE_PATH, cache_max_age=CATALOG_MAX_AGE,
+                 max_age_days=1.0, on_result=None):
+    """
+    Sync every account, one shard per task on a pool of `workers` processes
+    (default: one per core, at most one per shard). rate / burst bound the
+    API requests of all workers together; cache_path=None disables the
+    shared catalogue cache. Returns one summary per account.
+    """
+    groups = shards(accounts)
+    workers = min(workers or os.cpu_count() or 1, len(groups)) or 1
+    limiter = RateLimiter(rate, burst) if rate else None
+    cache = CatalogCache(cache_path, cache_max_age) if cache_path else None
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(limiter, cache)) as pool:
+        futures = [pool.submit(_sync_shard, group, max_age_days) for group in groups]
+        for future in as_completed(futures):
+            for summary in future.result():
+                results.append(summary)
+                if on_result:
+                    on_result(summary)
+    return results
+
+
+def _print_summary(summary):
+    api = summary.get("api") or {}
+    failed = [t for t, r in summary["sources"].items() if r.get("error")]
+    line = (f"{summary['account']}: {len(summary['sources'])} sources in {summary['seconds']:.2f}s, "
+            f"{api.get('calls', 0)} API calls")
+    if "cache_hits" in summary:
+        line += f", catalogue cache {summary['cache_hits']} hits / {summary['cache_misses']} misses"
+    if summary["error"] or failed:
+        line += f" [error: {summary['error'] or ', '.join(failed)}]"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync many SpotifyDB accounts on a process pool.")
+    parser.add_argument("accounts", help="accounts JSON file")
+    parser.add_argument("--workers", type=int, help="processes (default: one per core)")
+    parser.add_argument("--rate", type=float, default=20.0, help="API requests per second, all workers together")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--max-age-days", type=float, default=1.0, help="skip tables synced more recently")
+    parser.add_argument("--cache", default=CATALOG_CACHE_PATH, help="shared catalogue cache file")
+    parser.add_argument("--no-cache", action="store_true", help="do not share catalogue lookups")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_accounts(
+        load_accounts(args.accounts),
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        cache_path=None if args.no_cache else args.cache,
+        max_age_days=args.max_age_days,
+        on_result=_print_summary,
+    )
+    print(f"{len(results)} accounts in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    sys.exit(1 if any(r["error"] for r in results) else 0)
@@ -0,0 +1,393 @@
+"""
+Offline end-to-end benchmarks for every loader and the main.py recipes.
+
+Runs against fake_spotify.FakeSpotifyServer, so no network or credentials
+are needed. Reports wall time, API calls and peak memory per step, and
+the memory retained by the in-memory track representations.
+
+Example:
+python benchmark.py --sizes 100 1000 10000
+python benchmark.py --sizes 100000 --latency-ms 20 --out bench.csv
+python benchmark.py --startup
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+
+import duckdb
+import pandas as pd
+
+import functions as fn
+import features
+import history
+import materialize
+import sync
+from recipes import RECIPES, build_recipe, recipe_sql
+from similarity import SimilarityIndex, more_like_recent_likes
+from fake_spotify import make_library, FakeSpotifyServer
+from instrumentation import ApiStats, instrument_spotify
+from trackstore import TrackPool, TrackStore
+from writer import DuckDBWriter
+from transport import make_session
+
+
+def measure(step, func, stats, memory=True):
+    """
+    Run func once for wall time and API calls, and (optionally) once more
+    under tracemalloc for peak memory. Returns (result, row dict).
+    """
+    before = stats.totals()
+    start = time.perf_counter()
+    result = func()
+    wall = time.perf_counter() - start
+    after = stats.totals()
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    rows = len(result) if hasattr(result, "__len__") else None
+    return result, {
+        "step": step,
+        "rows": rows,
+        "wall_s": round(wall, 4),
+        "api_calls": after["calls"] - before["calls"],
+        "api_bytes": after["bytes"] - before["bytes"],
+        "peak_mb": None if peak_mb is None else round(peak_mb, 2),
+    }
+
+
+def bench_loaders(sp, lib, stats, memory=True):
+    first_album = next(iter(lib.albums))
+    first_track = lib.saved[0][1]
+
+    loaders = {
+        "load_my_saved_tracks": lambda: fn.load_my_saved_tracks(sp),
+        "load_tracks_from_playlist": lambda: fn.load_tracks_from_playlist(sp, lib.playlist_ids["Big Mix"]),
+        "load_tracks_from_album": lambda: fn.load_tracks_from_album(sp, first_album),
+        "load_tracks_from_artist": lambda: fn.load_tracks_from_artist(sp, lib.prolific_artist_id),
+        "load_any(track)": lambda: fn.load_any(sp, f"spotify:track:{first_track}"),
+        "load_my_top_tracks": lambda: fn.load_my_top_tracks(sp),
+        "load_my_recently_played": lambda: fn.load_my_recently_played(sp),
+        "get_followed_artists_df": lambda: fn.get_followed_artists_df(sp),
+        "get_artist_top_tracks_df": lambda: fn.get_artist_top_tracks_df(sp, lib.prolific_artist_id),
+    }
+
+    return [measure(name, func, stats, memory)[1] for name, func in loaders.items()]
+
+
+def bench_recipes(sp, lib, stats, memory=True):
+    con = duckdb.connect()
+    fn.duckdb_init_catalog(con)
+
+    sources = {
+        "my_liked_songs": lambda: fn.load_my_saved_tracks(sp),
+        "recently_played": lambda: fn.load_my_recently_played(sp),
+        "Covers": lambda: fn.load_tracks_from_playlist(sp, lib.playlist_ids["Covers"]),
+        "AI_Covers": lambda: fn.load_tracks_from_playlist(sp, lib.playlist_ids["AI_Covers"]),
+        "NTS_Covers": lambda: fn.load_tracks_from_playlist(sp, lib.playlist_ids["NTS_Covers"]),
+    }
+    for table_name, load in sources.items():
+        fn.df_to_duckdb(con, load(), table_name)
+
+    results = []
+
+    def write(table_name, df):
+        fn.df_to_duckdb(con, df, table_name)
+        return df
+
+    # first fill fetches everything, the second only what is missing (nothing)
+    source = features.spotify_source(sp)
+    for step in ("fill_audio_features(cold)", "fill_audio_features(warm)"):
+        results.append(measure(step, lambda: features.fill_audio_features(con, source), stats, memory=False)[1])
+
+    # the write path on its own, for the largest table
+    liked = fn.duckdb_to_df(con, "my_liked_songs")
+    results.append(measure("df_to_duckdb(my_liked_songs)", lambda: write("my_liked_songs", liked), stats, memory)[1])
+
+    for name, recipe in RECIPES.items():
+        if not all(t in sources for t in recipe["tables"]):
+            continue
+
+        def run_pandas(recipe=recipe, name=name):
+            # the old path: tables read back into pandas, scanned on a separate connection
+            scan = duckdb.connect()
+            for table_name in recipe["tables"]:
+                scan.register(table_name, fn.duckdb_to_df(con, table_name))
+            return scan.execute(recipe_sql(con, name)).df()["uri"].tolist()
+
+        def run_duckdb(name=name):
+            return fn.duckdb_query_uris(con, recipe_sql(con, name))
+
+        def run_build(name=name):
+            return build_recipe(con, sp, name)
+
+        results.append(measure(f"recipe_query(pandas):{name}", run_pandas, stats, memory)[1])
+        results.append(measure(f"recipe_query(duckdb):{name}", run_duckdb, stats, memory)[1])
+        results.append(measure(f"recipe:{name}", run_build, stats, memory)[1])
+
+    # similarity index: cold build, incremental rebuild (nothing changed), recipe query
+    cache_path = os.path.join(tempfile.mkdtemp(), "similarity.npz")
+    fn.df_to_duckdb(con, fn.load_tracks_from_playlist(sp, lib.playlist_ids["Big Mix"]), "Big_Mix")
+    index, row = measure("similarity_build(cold)", lambda: SimilarityIndex.build(con, cache_path=cache_path), stats, memory=False)
+    results.append(row)
+    index, row = measure("similarity_build(warm)", lambda: SimilarityIndex.build(con, cache_path=cache_path), stats, memory)
+    results.append(row)
+    results.append(measure("recipe_query:more_like_recent_likes", lambda: more_like_recent_likes(con, index), stats, memory)[1])
+
+    con.close()
+    return results
+
+
+def bench_sync(sp, lib, stats, memory=True):
+    """
+    Sync the saved library and Big Mix into an on-disk database, first
+    fetch-then-write per source, then pipelined through DuckDBWriter.
+    Then poll recently_played through sync.Syncer: the first sync keeps
+    every play fetched, the next one fetches only what is new.
+    """
+    playlist_id = lib.playlist_ids["Big Mix"]
+    path = os.path.join(tempfile.mkdtemp(), "bench.duckdb")
+    con = duckdb.connect(path)
+    fn.duckdb_init_catalog(con)
+
+    def sequential():
+        fn.df_to_duckdb(con, fn.load_my_saved_tracks(sp), "my_liked_songs")
+        fn.df_to_duckdb(con, fn.load_tracks_from_playlist(sp, playlist_id), "Big_Mix")
+        return range(len(con.table("my_liked_songs")) + len(con.table("Big_Mix")))
+
+    def pipelined():
+        with DuckDBWriter(con) as writer:
+            fn.load_my_saved_tracks(sp, on_page=writer.chunk_callback("my_liked_songs"))
+            liked = writer.finish("my_liked_songs")
+            fn.load_tracks_from_playlist(sp, playlist_id, on_page=writer.chunk_callback("Big_Mix"))
+            mix = writer.finish("Big_Mix")
+            return range(liked.result() + mix.result())
+
+    results = [
+        measure("sync(sequential)", sequential, stats, memory)[1],
+        measure("sync(pipelined)", pipelined, stats, memory)[1],
+    ]
+
+    syncer = sync.Syncer(sp, con, api_stats=stats, snapshot_root=os.path.join(os.path.dirname(path), "snapshots"))
+
+    def poll():
+        result = syncer.sync("recently_played", "recently_played", max_age_days=0)
+        if result.get("error") or result["rows"] < result["new_rows"]:
+            raise RuntimeError(f"recently_played lost appended plays: {result}")
+        return range(result["rows"])
+
+    results.append(measure("sync(recently_played,first)", poll, stats, memory=False)[1])
+    results.append(measure("sync(recently_played,poll)", poll, stats, memory=False)[1])
+    syncer.close()
+    con.close()
+    return results
+
+
+def _paged_tracks(sp, page):
+    tracks = []
+    while page:
+        tracks.extend(item["track"] for item in page["items"] if item.get("track"))
+        page = sp.next(page) if page.get("next") else None
+    return tracks
+
+
+def retained_mb(func):
+    """
+    Run func under tracemalloc and return (result, MB still allocated
+    while the result is alive).
+    """
+    tracemalloc.start()
+    result = func()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, round(current / 1e6, 2)
+
+
+def bench_track_store(sp, lib, stats, memory=True):
+    """
+    Hold the saved library plus the Big Mix playlist in memory, as
+    normalize_track_item dicts and as TrackStores sharing one TrackPool.
+    Responses are kept as JSON text and decoded inside the measured step,
+    so strings the rows keep alive are counted, as in a live sync.
+    """
+    playlist_id = lib.playlist_ids["Big Mix"]
+    sources = [
+        ("saved", "user", json.dumps(_paged_tracks(sp, sp.current_user_saved_tracks(limit=50)))),
+        ("playlist", playlist_id, json.dumps(_paged_tracks(sp, sp.playlist_items(playlist_id, limit=100)))),
+    ]
+    n_rows = sum(len(json.loads(raw)) for _, _, raw in sources)
+
+    def as_dicts():
+        return [
+            [fn.normalize_track_item(t, source_type, source_id) for t in json.loads(raw)]
+            for source_type, source_id, raw in sources
+        ]
+
+    def as_stores():
+        pool = TrackPool()
+        return [
+            TrackStore(pool).extend(json.loads(raw), source_type, source_id)
+            for source_type, source_id, raw in sources
+        ]
+
+    results = []
+    for step, func in (("track_store(list_of_dicts)", as_dicts), ("track_store(TrackStore)", as_stores)):
+        start = time.perf_counter()
+        func()
+        wall = time.perf_counter() - start
+        _, held = retained_mb(func) if memory else (None, None)
+        results.append({"step": step, "rows": n_rows, "wall_s": round(wall, 4),
+                        "api_calls": 0, "api_bytes": 0, "peak_mb": None, "retained_mb": held})
+    return results
+
+
+def bench_materialize(sp, lib, stats, memory=True):
+    """
+    Recipe outputs from scratch vs materialized: a full build, then the
+    refresh after a small sync (5 likes, 5 unlikes, 5 popularity changes;
+    incremental where the recipe has a spec), then one with nothing synced.
+    """
+    con = duckdb.connect()
+    fn.duckdb_init_catalog(con)
+    history.init_history(con)
+    for table_name, load in (("my_liked_songs", lambda: fn.load_my_saved_tracks(sp)),
+                             ("recently_played", lambda: fn.load_my_recently_played(sp))):
+        fn.df_to_duckdb(con, load(), table_name)
+        history.record_history(con, table_name)
+
+    names = [n for n, r in RECIPES.items() if set(r["tables"]) <= {"my_liked_songs", "recently_played"}]
+    results = []
+
+    def refresh(name, force=False):
+        return range(materialize.refresh_recipe(con, name, force=force)["rows"])
+
+    for name in names:
+        results.append(measure(f"recipe_query(scratch):{name}",
+                               lambda name=name: fn.duckdb_query_uris(con, recipe_sql(con, name)), stats, memory)[1])
+        results.append(measure(f"materialize(full):{name}", lambda name=name: refresh(name, force=True), stats, memory=False)[1])
+
+    con.execute("""
+        DELETE FROM my_liked_songs
+        WHERE track_id IN (SELECT track_id FROM my_liked_songs USING SAMPLE 5 ROWS);
+    """)
+    con.execute("""
+        INSERT INTO my_liked_songs
+        SELECT * REPLACE (
+            md5(track_id)[:22] AS track_id,
+            'spotify:track:' || md5(track_id)[:22] AS uri,
+            (SELECT max(saved_at) FROM my_liked_songs) AS saved_at
+        )
+        FROM my_liked_songs LIMIT 5;
+    """)
+    con.execute("""
+        UPDATE my_liked_songs SET popularity = popularity % 100 + 1
+        WHERE track_id IN (SELECT track_id FROM my_liked_songs USING SAMPLE 5 ROWS);
+    """)
+    fn.duckdb_table_updated(con, "my_liked_songs")
+    history.record_history(con, "my_liked_songs")
+
+    for mode in ("synced", "fresh"):
+        for name in names:
+            results.append(measure(f"materialize({mode}):{name}", lambda name=name: refresh(name), stats, memory=False)[1])
+
+    con.close()
+    return results
+
+
+STARTUP_COMMANDS = {
+    # what main.py imports before doing anything
+    "main.py imports": ["-c", "import duckdb, pandas, spotipy, IPython.display, functions, features, recipes, similarity"],
+    "cli --help": ["cli.py", "--help"],
+    "cli stats": ["cli.py", "--database", "{database}", "stats"],
+    "cli sync imports": ["-c", "import cli, sync, transport, duckdb, spotipy"],
+}
+
+
+def bench_startup(repeat=5):
+    """
+    Wall time of fresh interpreters for each entry point (median of repeat runs).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    database = os.path.join(tempfile.mkdtemp(), "startup.duckdb")
+
+    rows = []
+    for step, argv in STARTUP_COMMANDS.items():
+        argv = [a.format(database=database) for a in argv]
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            done = subprocess.run([sys.executable, *argv], cwd=here, capture_output=True)
+            times.append(time.perf_counter() - start)
+            if done.returncode != 0:
+                break
+        rows.append({
+            "step": step,
+            "wall_s": round(statistics.median(times), 4) if done.returncode == 0 else None,
+        })
+    return rows
+
+
+def run(sizes, latency_ms=0, rate_limit_every=0, memory=True, seed=0):
+    """
+    Run the full suite for each library size and return a DataFrame.
+    """
+    rows = []
+
+    for size in sizes:
+        start = time.perf_counter()
+        lib = make_library(size, seed=seed)
+        print(f"[{size}] library built in {time.perf_counter() - start:.2f}s "
+              f"({len(lib.tracks)} tracks, {len(lib.albums)} albums)")
+
+        with FakeSpotifyServer(lib, latency_ms=latency_ms, rate_limit_every=rate_limit_every, seed=seed) as server:
+            stats = ApiStats()
+            sp = instrument_spotify(server.client(requests_session=make_session()), stats)
+
+            for kind, bench in (("loader", bench_loaders), ("recipe", bench_recipes),
+                                ("sync", bench_sync), ("memory", bench_track_store),
+                                ("materialize", bench_materialize)):
+                for row in bench(sp, lib, stats, memory):
+                    rows.append({"size": size, "kind": kind, **row})
+                    print(f"[{size}] {row['step']}: {row['wall_s']}s, {row['api_calls']} calls")
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline SpotifyDB benchmarks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="saved-library sizes to benchmark (100 .. 100000)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated API latency")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup", action="store_true", help="only time interpreter startup per entry point")
+    parser.add_argument("--out", help="write results to this CSV file")
+    args = parser.parse_args()
+
+    if args.startup:
+        df = pd.DataFrame([{"kind": "startup", **row} for row in bench_startup()])
+    else:
+        df = run(
+            args.sizes,
+            latency_ms=args.latency_ms,
+            rate_limit_every=args.rate_limit_every,
+            memory=not args.no_memory,
+            seed=args.seed,
+        )
+
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(df.to_string(index=False))
+
+    if args.out:
+        df.to_csv(args.out, index=False)
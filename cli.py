@@ -0,0 +1,184 @@
+"""
+SpotifyDB command line.
+
+Each subcommand imports only what it uses: `stats` needs DuckDB alone,
+`build` and `cleanup` add spotipy, and only `sync` and `cleanup` load
+pandas (`cleanup` sorts the playlist in a DataFrame). So
+cron-style single-source jobs do not pay for the whole notebook stack.
+Credentials come from SPOTIPY_CLIENT_ID / SPOTIPY_CLIENT_SECRET, or cred.py.
+
+Example:
+python cli.py sync recently_played
+python cli.py sync --all --max-age-days 1
+python cli.py sync --all --max-calls 40 --dry-run
+python cli.py sync Blink182 --type artist --id 6FBDaR13swtiWwGhX1WQsP
+python cli.py build new_liked_songs cream_of_crop
+python cli.py cleanup 37i9dQZF1DXcBWIGoYBM5M --sort-by artist_name
+python cli.py stats
+"""
+import sys
+import argparse
+
+
+def _connect(args):
+    import duckdb
+    return duckdb.connect(args.database)
+
+
+def _spotify(args):
+    import transport
+    return transport.oauth_client(cache_path=args.cache_path, open_browser=not args.no_browser)
+
+
+def cmd_sync(args):
+    import sync
+
+    if args.type:
+        if len(args.sources) != 1:
+            raise SystemExit("--type/--id sync exactly one table")
+        sources = {args.sources[0]: (args.type, args.id)}
+    else:
+        names = list(sync.SOURCES) if args.all else args.sources
+        unknown = [n for n in names if n not in sync.SOURCES]
+        if unknown or not names:
+            raise SystemExit(f"unknown source(s) {unknown}; known: {', '.join(sync.SOURCES)} (or use --type/--id)")
+        sources = {n: sync.SOURCES[n] for n in names}
+
+    con = _connect(args)
+    plan = None
+    if args.max_calls is not None or args.max_seconds is not None or args.dry_run:
+        import planner
+
+        plan = planner.plan_refresh(con, sources, max_calls=args.max_calls, max_seconds=args.max_seconds,
+                                    values=_parse_values(args.value))
+        planner.print_plan(plan, args.max_calls, args.max_seconds)
+        if args.dry_run:
+            con.close()
+            return 0
+
+    syncer = sync.Syncer(_spotify(args), con)
+    failed = False
+    try:
+        if plan is None:
+            results = (
+                syncer.sync(table_name, source_type, source_id, max_age_days=args.max_age_days)
+                for table_name, (source_type, source_id) in sources.items()
+            )
+        else:
+            results = planner.run_plan(syncer, plan, max_calls=args.max_calls, max_seconds=args.max_seconds)
+        for result in results:
+            table_name = result["table_name"]
+            if result["skipped"]:
+                print(f"{table_name}: fresh ({result['age_days']:.2f} days old)")
+            else:
+                print(f"{table_name}: {result.get('rows')} rows, {result['api_calls']} API calls, "
+                      f"{result['fetch_seconds']:.2f}s")
+                failed = failed or bool(result.get("error"))
+    finally:
+        syncer.close()
+        con.close()
+    return 1 if failed else 0
+
+
+def _parse_values(values):
+    parsed = {}
+    for value in values or []:
+        table_name, _, weight = value.partition("=")
+        if not weight:
+            raise SystemExit("--value expects <table>=<weight>")
+        parsed[table_name] = float(weight)
+    return parsed
+
+
+def cmd_build(args):
+    import recipes
+
+    unknown = [n for n in args.recipes if n not in recipes.RECIPES]
+    if unknown:
+        raise SystemExit(f"unknown recipe(s) {unknown}; known: {', '.join(recipes.RECIPES)}")
+
+    con = _connect(args)
+    sp = _spotify(args)
+    try:
+        for name in args.recipes:
+            uris = recipes.build_recipe(con, sp, name, public=not args.private)
+            print(f"{recipes.RECIPES[name]['playlist']}: {len(uris)} tracks")
+    finally:
+        con.close()
+    return 0
+
+
+def cmd_cleanup(args):
+    import functions as fn
+
+    df = fn.playlist_cleanup(_spotify(args), args.playlist_id, sort_by=args.sort_by)
+    print(f"{args.playlist_id}: {len(df)} tracks kept")
+    return 0
+
+
+def cmd_stats(args):
+    con = _connect(args)
+    try:
+        tables = {row[0] for row in con.execute("SHOW TABLES").fetchall()}
+        if "sync_catalog" not in tables:
+            print("no syncs recorded yet")
+            return 0
+        rows = con.execute("""
+            SELECT table_name, (epoch(now()) - synced_at) / 86400 AS age_days,
+                   row_count, api_calls, fetch_seconds, write_seconds
+            FROM sync_catalog
+            ORDER BY table_name;
+        """).fetchall()
+    finally:
+        con.close()
+
+    print(f"{'table':<24}{'age (days)':>12}{'rows':>10}{'api calls':>11}{'fetch s':>9}{'write s':>9}")
+    for name, age, row_count, api_calls, fetch_s, write_s in rows:
+        fmt = lambda v, spec: "-" if v is None else format(v, spec)
+        print(f"{name:<24}{fmt(age, '.2f'):>12}{fmt(row_count, 'd'):>10}{fmt(api_calls, 'd'):>11}"
+              f"{fmt(fetch_s, '.2f'):>9}{fmt(write_s, '.2f'):>9}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="spotifydb", description="SpotifyDB command line.")
+    parser.add_argument("--database", default="spotify.duckdb", help="DuckDB file (default: spotify.duckdb)")
+    parser.add_argument("--cache-path", default=".cache-spotifydb", help="OAuth token cache")
+    parser.add_argument("--no-browser", action="store_true", help="do not open a browser for OAuth")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("sync", help="refresh source tables")
+    p.add_argument("sources", nargs="*", help="table names from sync.SOURCES")
+    p.add_argument("--all", action="store_true", help="every source in sync.SOURCES")
+    p.add_argument("--max-age-days", type=float, default=0, help="skip tables synced more recently (default: always sync)")
+    p.add_argument("--type", help="source_type for an ad hoc table (playlist, album, artist, ...)")
+    p.add_argument("--id", help="source_id for an ad hoc table")
+    p.add_argument("--max-calls", type=int, help="API call budget: refresh the most stale, valuable sources that fit")
+    p.add_argument("--max-seconds", type=float, help="time budget, like --max-calls")
+    p.add_argument("--value", action="append", metavar="TABLE=WEIGHT", help="source importance for the planner (repeatable)")
+    p.add_argument("--dry-run", action="store_true", help="print the refresh plan without syncing")
+    p.set_defaults(func=cmd_sync)
+
+    p = commands.add_parser("build", help="build recipe playlists")
+    p.add_argument("recipes", nargs="+", help="recipe names from recipes.RECIPES")
+    p.add_argument("--private", action="store_true")
+    p.set_defaults(func=cmd_build)
+
+    p = commands.add_parser("cleanup", help="dedupe and re-sort a playlist")
+    p.add_argument("playlist_id")
+    p.add_argument("--sort-by", help="column to sort by (e.g. artist_name, popularity)")
+    p.set_defaults(func=cmd_cleanup)
+
+    p = commands.add_parser("stats", help="show the sync catalog")
+    p.set_defaults(func=cmd_stats)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
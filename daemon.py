@@ -0,0 +1,217 @@
+"""
+Long-running sync daemon.
+
+Keeps one Spotify client (token cache, pooled keep-alive sessions), one
+DuckDB connection and one background writer open, and refreshes each
+source on its own interval with jitter, so short-interval sources like
+recently_played cost one API call per poll instead of a full main.py run.
+
+On start each source is scheduled from its last sync in sync_catalog,
+so restarting the daemon does not refetch fresh tables. Status (per
+source: last run, rows, API calls, errors, next run) is written to a
+JSON file after every sync and, with --status-port, served at
+http://127.0.0.1:<port>/status.
+
+Example:
+python daemon.py --status-port 8765
+python daemon.py --interval recently_played=300 --interval my_liked_songs=3600
+curl http://127.0.0.1:8765/status
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import signal
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sync
+from planner import DEFAULT_INTERVALS
+
+
+class SyncDaemon:
+    """
+    Runs Syncer.sync for each source whenever its interval has elapsed.
+
+    schedule: table_name -> (source_type, source_id, interval_seconds)
+    jitter: each interval is stretched or shrunk by up to this fraction,
+            so sources that share an interval drift apart.
+    """
+
+    def __init__(self, syncer, schedule, jitter=0.1, status_path="daemon_status.json", seed=None):
+        self.syncer = syncer
+        self.schedule = schedule
+        self.jitter = jitter
+        self.status_path = status_path
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        self.started_at = time.time()
+        self.status = {table_name: {"runs": 0, "errors": 0} for table_name in schedule}
+        self._queue = []
+
+    def _interval(self, table_name):
+        interval = self.schedule[table_name][2]
+        return interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _plan(self):
+        """
+        First run of each source: its last sync plus one interval.
+        """
+        catalog = self.syncer.catalog
+        now = time.time()
+        for table_name in self.schedule:
+            synced_at = (catalog.get(table_name) or {}).get("synced_at")
+            due = now if synced_at is None else max(now, synced_at + self._interval(table_name))
+            heapq.heappush(self._queue, (due, table_name))
+            self.status[table_name]["next_run"] = due
+
+    def run_once(self, table_name):
+        """
+        Sync one source now and record the outcome in status.
+        """
+        source_type, source_id, _ = self.schedule[table_name]
+        start = time.time()
+        try:
+            result = self.syncer.sync(table_name, source_type, source_id, max_age_days=0)
+        except Exception as e:
+            result = {"table_name": table_name, "error": f"{type(e).__name__}: {e}"}
+
+        with self._lock:
+            status = self.status[table_name]
+            status["runs"] += 1
+            status["last_run"] = start
+            status["last_seconds"] = round(time.time() - start, 3)
+            status["last_rows"] = result.get("rows")
+            status["last_api_calls"] = result.get("api_calls")
+            status["last_error"] = result.get("error")
+            if result.get("error"):
+                status["errors"] += 1
+        return result
+
+    def run(self, max_syncs=None):
+        """
+        Sync sources as they come due until stop() (or max_syncs syncs).
+        """
+        self._plan()
+        self.write_status()
+        syncs = 0
+
+        while not self._stop.is_set() and self._queue:
+            due, table_name = self._queue[0]
+            if self._stop.wait(max(0.0, due - time.time())):
+                break
+            heapq.heappop(self._queue)
+
+            self.run_once(table_name)
+            syncs += 1
+
+            due = time.time() + self._interval(table_name)
+            heapq.heappush(self._queue, (due, table_name))
+            with self._lock:
+                self.status[table_name]["next_run"] = due
+            self.write_status()
+
+            if max_syncs is not None and syncs >= max_syncs:
+                break
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self):
+        """
+        Current status as a JSON-serializable dict.
+        """
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "api": self.syncer.api_stats.totals(),
+                "sources": {name: dict(s) for name, s in self.status.items()},
+            }
+
+    def write_status(self):
+        if not self.status_path:
+            return
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2, default=str)
+        os.replace(tmp, self.status_path)
+
+    def serve_status(self, port, host="127.0.0.1"):
+        """
+        Serve GET /status on a background thread. Returns the server.
+        """
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(daemon.snapshot(), default=str).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="daemon-status", daemon=True).start()
+        return server
+
+
+def parse_intervals(values):
+    intervals = dict(DEFAULT_INTERVALS)
+    for value in values or []:
+        table_name, _, seconds = value.partition("=")
+        if table_name not in sync.SOURCES or not seconds:
+            raise SystemExit(f"--interval expects <source>=<seconds> with source in {sorted(sync.SOURCES)}")
+        intervals[table_name] = float(seconds)
+    return intervals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep SpotifyDB sources fresh in one long-running process.")
+    parser.add_argument("--database", default="spotify.duckdb")
+    parser.add_argument("--interval", action="append", metavar="SOURCE=SECONDS",
+                        help="override a source's sync interval (repeatable)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="interval jitter fraction")
+    parser.add_argument("--status-file", default="daemon_status.json")
+    parser.add_argument("--status-port", type=int, help="serve status on 127.0.0.1:<port>/status")
+    args = parser.parse_args()
+
+    import duckdb
+    import transport
+
+    intervals = parse_intervals(args.interval)
+    schedule = {
+        table_name: (source_type, source_id, intervals[table_name])
+        for table_name, (source_type, source_id) in sync.SOURCES.items()
+    }
+
+    sp = transport.oauth_client(open_browser=False)
+    con = duckdb.connect(args.database)
+    syncer = sync.Syncer(sp, con)
+    daemon = SyncDaemon(syncer, schedule, jitter=args.jitter, status_path=args.status_file)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: daemon.stop())
+
+    if args.status_port:
+        daemon.serve_status(args.status_port)
+        print(f"status: http://127.0.0.1:{args.status_port}/status", file=sys.stderr)
+
+    try:
+        daemon.run()
+    finally:
+        syncer.close()
+        con.close()
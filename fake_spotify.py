@@ -0,0 +1,771 @@
+"""
+Offline stand-in for the parts of the Spotify Web API used by functions.py.
+
+Serves a synthetic library over HTTP on 127.0.0.1 with Spotify's paging
+semantics (offset paging with `next` links, cursor paging for followed
+artists and recently played), playlist snapshot_ids, ETags with
+If-None-Match, and optional latency / 429 injection.
+
+Example:
+lib = make_library(1000)
+with FakeSpotifyServer(lib, latency_ms=5) as server:
+    sp = server.client()
+    df = fn.load_my_saved_tracks(sp)
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import collections
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+_BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+_WORDS = [
+    "love", "night", "fire", "heart", "dream", "summer", "rain", "gold",
+    "city", "light", "wild", "blue", "echo", "river", "ghost", "stone",
+    "neon", "paper", "ocean", "shadow", "velvet", "static", "hollow", "sun",
+]
+
+_GENRES = [
+    "pop", "rock", "pop punk", "indie", "hip hop", "electronic", "soul",
+    "folk", "metal", "jazz", "r&b", "country", "punk", "emo", "house",
+]
+
+FakeTrack = collections.namedtuple(
+    "FakeTrack",
+    ["id", "name", "album_id", "artist_ids", "isrc", "duration_ms",
+     "popularity", "explicit", "track_number"],
+)
+
+
+class FakeLibrary:
+    """
+    Synthetic catalogue plus one user's library. Build with make_library().
+    """
+
+    def __init__(self):
+        self.user_id = "fakeuser"
+        self.artists = {}
+        self.albums = {}
+        self.tracks = {}
+        self.saved = []         # [(added_at, track_id)] newest first
+        self.recent = []        # [(played_at, track_id)] newest first
+        self.top = []           # [track_id]
+        self.followed = []      # [artist_id]
+        self.playlists = {}
+        self.playlist_ids = {}  # name -> id
+        self.prolific_artist_id = None
+
+    # --------------------------
+    # Spotify-shaped objects
+    # --------------------------
+
+    def artist_simple(self, artist_id):
+        a = self.artists[artist_id]
+        return {
+            "id": a["id"],
+            "name": a["name"],
+            "type": "artist",
+            "uri": f"spotify:artist:{a['id']}",
+        }
+
+    def artist_object(self, artist_id):
+        a = self.artists[artist_id]
+        return {
+            **self.artist_simple(artist_id),
+            "genres": a["genres"],
+            "popularity": a["popularity"],
+            "followers": {"href": None, "total": a["followers"]},
+        }
+
+    def album_simple(self, album_id):
+        al = self.albums[album_id]
+        return {
+            "id": al["id"],
+            "name": al["name"],
+            "album_type": al["album_type"],
+            "album_group": al["album_type"],
+            "release_date": al["release_date"],
+            "release_date_precision": "day",
+            "total_tracks": len(al["track_ids"]),
+            "artists": [self.artist_simple(a) for a in al["artist_ids"]],
+            "type": "album",
+            "uri": f"spotify:album:{al['id']}",
+        }
+
+    def track_simple(self, track_id):
+        t = self.tracks[track_id]
+        return {
+            "id": t.id,
+            "name": t.name,
+            "artists": [self.artist_simple(a) for a in t.artist_ids],
+            "duration_ms": t.duration_ms,
+            "explicit": t.explicit,
+            "track_number": t.track_number,
+            "disc_number": 1,
+            "preview_url": None,
+            "is_local": False,
+            "type": "track",
+            "uri": f"spotify:track:{t.id}",
+        }
+
+    def track_object(self, track_id):
+        t = self.tracks[track_id]
+        return {
+            **self.track_simple(track_id),
+            "album": self.album_simple(t.album_id),
+            "popularity": t.popularity,
+            "external_ids": {"isrc": t.isrc},
+        }
+
+    def audio_features(self, track_id):
+        if track_id not in self.tracks:
+            return None
+
+        rng = random.Random(track_id)
+        return {
+            "id": track_id,
+            "danceability": round(rng.random(), 3),
+            "energy": round(rng.random(), 3),
+            "key": rng.randrange(12),
+            "loudness": round(rng.uniform(-30, 0), 3),
+            "mode": rng.randrange(2),
+            "speechiness": round(rng.random() * 0.5, 3),
+            "acousticness": round(rng.random(), 3),
+            "instrumentalness": round(rng.random() ** 3, 3),
+            "liveness": round(rng.random() * 0.6, 3),
+            "valence": round(rng.random(), 3),
+            "tempo": round(rng.uniform(60, 190), 3),
+            "time_signature": 4,
+            "type": "audio_features",
+            "uri": f"spotify:track:{track_id}",
+        }
+
+
+def make_library(n_tracks, seed=0, now=None):
+    """
+    Build a deterministic synthetic library with n_tracks saved tracks.
+
+    Saves, plays and releases are dated back from `now` (default: the
+    current UTC time), so recent plays fall inside the windows that
+    sync.Syncer keeps.
+
+    Every recording gets an album version; some also appear on singles,
+    deluxe editions and compilations (same ISRC, different track id),
+    like real discographies. The first artist is "prolific".
+
+    Example:
+    lib = make_library(10_000)
+    len(lib.saved)
+    """
+    rng = random.Random(seed)
+    lib = FakeLibrary()
+    now = now or datetime.now(timezone.utc).replace(microsecond=0)
+
+    def new_id():
+        return "".join(rng.choices(_BASE62, k=22))
+
+    def title(k=2):
+        return " ".join(rng.choice(_WORDS) for _ in range(k)).title()
+
+    def add_album(artist_id, name, album_type, release_date, recordings):
+        album_id = new_id()
+        track_ids = []
+        for number, rec in enumerate(recordings, start=1):
+            track_id = new_id()
+            lib.tracks[track_id] = FakeTrack(
+                track_id, rec["name"], album_id, (artist_id,), rec["isrc"],
+                rec["duration_ms"], rec["popularity"], rec["explicit"], number,
+            )
+            rec["track_ids"].append(track_id)
+            track_ids.append(track_id)
+
+        lib.albums[album_id] = {
+            "id": album_id,
+            "name": name,
+            "album_type": album_type,
+            "release_date": release_date,
+            "artist_ids": [artist_id],
+            "track_ids": track_ids,
+        }
+        return album_id
+
+    n_artists = max(3, n_tracks // 40)
+    prolific = min(max(20, n_tracks // 20), 500)
+    remaining = max(0, n_tracks - prolific)
+    counts = [prolific] + [remaining // (n_artists - 1)] * (n_artists - 1)
+    counts[-1] += remaining - sum(counts[1:])
+
+    album_versions = []
+    isrc_counter = 0
+
+    for count in counts:
+        artist_id = new_id()
+        lib.artists[artist_id] = {
+            "id": artist_id,
+            "name": title(rng.randint(1, 3)),
+            "genres": rng.sample(_GENRES, rng.randint(1, 3)),
+            "popularity": rng.randint(5, 95),
+            "followers": rng.randint(100, 5_000_000),
+        }
+        if lib.prolific_artist_id is None:
+            lib.prolific_artist_id = artist_id
+
+        recordings = []
+        names = set()
+        for _ in range(count):
+            name = title(rng.randint(1, 4))
+            while name in names:
+                name = title(rng.randint(2, 5))
+            names.add(name)
+
+            isrc_counter += 1
+            recordings.append({
+                "name": name,
+                "isrc": f"USFK{isrc_counter:08d}",
+                "duration_ms": rng.randint(120_000, 320_000),
+                "popularity": rng.randint(0, 100),
+                "explicit": rng.random() < 0.2,
+                "track_ids": [],
+            })
+
+        release = now - timedelta(days=rng.randint(3_000, 9_000))
+        for i in range(0, len(recordings), 12):
+            chunk = recordings[i:i + 12]
+            release += timedelta(days=rng.randint(200, 900))
+            name = title(rng.randint(1, 3))
+            add_album(artist_id, name, "album", release.date().isoformat(), chunk)
+            album_versions.extend(rec["track_ids"][0] for rec in chunk)
+
+            if (i // 12) % 3 == 2:
+                add_album(artist_id, f"{name} (Deluxe Edition)", "album",
+                          (release + timedelta(days=365)).date().isoformat(), chunk)
+
+        for rec in recordings:
+            if rng.random() < 0.3:
+                add_album(artist_id, rec["name"], "single",
+                          (release - timedelta(days=30)).date().isoformat(), [rec])
+
+        if len(recordings) >= 10:
+            hits = sorted(recordings, key=lambda r: -r["popularity"])[:10]
+            add_album(artist_id, "Greatest Hits", "compilation", now.date().isoformat(), hits)
+
+    rng.shuffle(album_versions)
+    saved_at = now
+    for track_id in album_versions[:n_tracks]:
+        lib.saved.append((saved_at.strftime("%Y-%m-%dT%H:%M:%SZ"), track_id))
+        saved_at -= timedelta(minutes=rng.randint(1, 2_000))
+
+    played_at = now
+    for _ in range(min(50, len(album_versions))):
+        lib.recent.append((played_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"), rng.choice(album_versions)))
+        played_at -= timedelta(minutes=rng.randint(3, 60))
+
+    lib.top = rng.sample(album_versions, min(50, len(album_versions)))
+    lib.followed = list(lib.artists)[:2_000]
+
+    # playlists also pick singles, deluxe and compilation versions, which
+    # are not saved, so recommendations have unliked candidates
+    all_versions = list(lib.tracks)
+    for name, size in [
+        ("Covers", min(n_tracks, 200)),
+        ("AI_Covers", min(n_tracks, 150)),
+        ("NTS_Covers", min(n_tracks, 80)),
+        ("Big Mix", max(1, n_tracks // 2)),
+    ]:
+        playlist_id = new_id()
+        lib.playlists[playlist_id] = {
+            "id": playlist_id,
+            "name": name,
+            "owner": "spotify",
+            "description": "",
+            "public": True,
+            "snapshot_id": new_id(),
+            "track_ids": rng.sample(all_versions, min(size, len(all_versions))),
+        }
+        lib.playlist_ids[name] = playlist_id
+
+    return lib
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.fake._dispatch(self, "GET")
+
+    def do_POST(self):
+        self.server.fake._dispatch(self, "POST")
+
+    def do_PUT(self):
+        self.server.fake._dispatch(self, "PUT")
+
+    def do_DELETE(self):
+        self.server.fake._dispatch(self, "DELETE")
+
+
+class FakeSpotifyServer:
+    """
+    Serve a FakeLibrary as a local Spotify Web API.
+
+    latency_ms / jitter_ms delay every response. Rate limiting answers 429
+    with Retry-After on every rate_limit_every-th request and/or with
+    probability rate_limit_prob.
+
+    Example:
+    with FakeSpotifyServer(make_library(500)) as server:
+        sp = server.client()
+    """
+
+    def __init__(self, library, host="127.0.0.1", port=0, latency_ms=0,
+                 jitter_ms=0, rate_limit_every=0, rate_limit_prob=0.0,
+                 retry_after=0, seed=0):
+        self.library = library
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after = retry_after
+
+        self.request_count = 0
+        self.requests = collections.Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def prefix(self):
+        return f"{self.base_url}/v1/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self, **kwargs):
+        """
+        Return a spotipy client pointed at this server.
+        """
+        import spotipy
+
+        sp = spotipy.Spotify(auth="fake-token", **kwargs)
+        sp.prefix = self.prefix
+        return sp
+
+    # --------------------------
+    # HTTP plumbing
+    # --------------------------
+
+    def _dispatch(self, handler, method):
+        parts = urlsplit(handler.path)
+        path = parts.path.rstrip("/")
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+
+        with self._lock:
+            self.request_count += 1
+            count = self.request_count
+            limited = (
+                (self.rate_limit_every and count % self.rate_limit_every == 0)
+                or (self.rate_limit_prob and self._rng.random() < self.rate_limit_prob)
+            )
+            delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+
+        if delay:
+            time.sleep(delay / 1000)
+
+        if limited:
+            self._send(handler, 429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                       headers={"Retry-After": str(self.retry_after)})
+            return
+
+        status, payload, etag = 404, None, None
+        for route_method, pattern, name in self._ROUTES:
+            if route_method != method:
+                continue
+            match = pattern.match(path)
+            if match:
+                with self._lock:
+                    self.requests[name] += 1
+                    result = getattr(self, name)(*match.groups(), query=query, body=body)
+                status, payload = result[0], result[1]
+                etag = result[2] if len(result) > 2 else None
+                break
+
+        if payload is None and status == 404:
+            payload = {"error": {"status": 404, "message": f"Not found: {path}"}}
+
+        if method == "GET" and status == 200:
+            if etag is None:
+                etag = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+            etag = f'"{etag}"'
+            if handler.headers.get("If-None-Match") == etag:
+                self._send(handler, 304, None, headers={"ETag": etag})
+                return
+
+        self._send(handler, status, payload, headers={"ETag": etag} if etag else None)
+
+    def _send(self, handler, status, payload, headers=None):
+        data = b"" if payload is None else json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        if data:
+            handler.wfile.write(data)
+
+    def _page(self, path, items, query, default_limit=20, max_limit=50, extra=None):
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", default_limit)), max_limit)
+        page = items[offset:offset + limit]
+
+        def link(o):
+            params = dict(extra or {}, offset=o, limit=limit)
+            return f"{self.prefix}{path}?{urlencode(params)}"
+
+        return {
+            "href": link(offset),
+            "items": page,
+            "limit": limit,
+            "offset": offset,
+            "total": len(items),
+            "next": link(offset + limit) if offset + limit < len(items) else None,
+            "previous": link(max(0, offset - limit)) if offset > 0 else None,
+        }
+
+    def _bump_snapshot(self, playlist):
+        digest = hashlib.sha1(
+            (playlist["snapshot_id"] + ",".join(playlist["track_ids"])).encode()
+        ).hexdigest()
+        playlist["snapshot_id"] = digest[:22]
+
+    @staticmethod
+    def _uri_ids(uris):
+        return [u.split(":")[-1] for u in uris]
+
+    # --------------------------
+    # Endpoints
+    # --------------------------
+
+    def me(self, query, body):
+        lib = self.library
+        return 200, {"id": lib.user_id, "display_name": "Fake User", "type": "user",
+                     "uri": f"spotify:user:{lib.user_id}"}
+
+    def track(self, track_id, query, body):
+        if track_id not in self.library.tracks:
+            return 404, None
+        return 200, self.library.track_object(track_id)
+
+    def several_tracks(self, query, body):
+        ids = query.get("ids", "").split(",")[:50]
+        lib = self.library
+        return 200, {"tracks": [lib.track_object(t) if t in lib.tracks else None for t in ids]}
+
+    def album(self, album_id, query, body):
+        lib = self.library
+        if album_id not in lib.albums:
+            return 404, None
+        album = lib.album_simple(album_id)
+        tracks = [lib.track_simple(t) for t in lib.albums[album_id]["track_ids"]]
+        album["tracks"] = self._page(f"albums/{album_id}/tracks", tracks, {"limit": 50})
+        return 200, album
+
+    def several_albums(self, query, body):
+        ids = query.get("ids", "").split(",")[:20]
+        albums = [self.album(a, query={}, body=None)[1] for a in ids]
+        return 200, {"albums": albums}
+
+    def album_tracks(self, album_id, query, body):
+        lib = self.library
+        if album_id not in lib.albums:
+            return 404, None
+        tracks = [lib.track_simple(t) for t in lib.albums[album_id]["track_ids"]]
+        return 200, self._page(f"albums/{album_id}/tracks", tracks, query)
+
+    def artist(self, artist_id, query, body):
+        if artist_id not in self.library.artists:
+            return 404, None
+        return 200, self.library.artist_object(artist_id)
+
+    def several_artists(self, query, body):
+        ids = query.get("ids", "").split(",")[:50]
+        lib = self.library
+        return 200, {"artists": [lib.artist_object(a) if a in lib.artists else None for a in ids]}
+
+    def artist_albums(self, artist_id, query, body):
+        lib = self.library
+        if artist_id not in lib.artists:
+            return 404, None
+        groups = set((query.get("include_groups") or "album,single,compilation,appears_on").split(","))
+        albums = [
+            lib.album_simple(a["id"]) for a in lib.albums.values()
+            if artist_id in a["artist_ids"] and a["album_type"] in groups
+        ]
+        albums.sort(key=lambda a: a["release_date"], reverse=True)
+        extra = {"include_groups": query["include_groups"]} if query.get("include_groups") else None
+        return 200, self._page(f"artists/{artist_id}/albums", albums, query, extra=extra)
+
+    def artist_top_tracks(self, artist_id, query, body):
+        lib = self.library
+        if artist_id not in lib.artists:
+            return 404, None
+        tracks = [t for t in lib.tracks.values() if artist_id in t.artist_ids]
+        tracks.sort(key=lambda t: -t.popularity)
+        return 200, {"tracks": [lib.track_object(t.id) for t in tracks[:10]]}
+
+    def saved_tracks(self, query, body):
+        lib = self.library
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 20)), 50)
+        window = lib.saved[offset:offset + limit]
+        items = [{"added_at": added_at, "track": lib.track_object(t)} for added_at, t in window]
+        page = self._page("me/tracks", lib.saved, query)
+        page["items"] = items
+        return 200, page
+
+    def top_tracks(self, query, body):
+        lib = self.library
+        tracks = [lib.track_object(t) for t in lib.top]
+        extra = {"time_range": query.get("time_range", "medium_term")}
+        return 200, self._page("me/top/tracks", tracks, query, extra=extra)
+
+    def recently_played(self, query, body):
+        lib = self.library
+        limit = min(int(query.get("limit", 20)), 50)
+
+        def ms(ts):
+            return int(datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.000Z")
+                       .replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+        items = lib.recent
+        if query.get("after"):
+            items = [i for i in items if ms(i[0]) > int(query["after"])]
+            items = items[-limit:]
+        else:
+            if query.get("before"):
+                items = [i for i in items if ms(i[0]) < int(query["before"])]
+            items = items[:limit]
+
+        cursors = None
+        next_link = None
+        if items:
+            cursors = {"after": str(ms(items[0][0])), "before": str(ms(items[-1][0]))}
+            next_link = f"{self.prefix}me/player/recently-played?{urlencode({'before': cursors['before'], 'limit': limit})}"
+
+        return 200, {
+            "href": f"{self.prefix}me/player/recently-played",
+            "items": [{"played_at": played_at, "track": lib.track_object(t), "context": None}
+                      for played_at, t in items],
+            "limit": limit,
+            "next": next_link,
+            "cursors": cursors,
+        }
+
+    def following(self, query, body):
+        lib = self.library
+        limit = min(int(query.get("limit", 20)), 50)
+        ids = lib.followed
+
+        start = 0
+        if query.get("after"):
+            start = ids.index(query["after"]) + 1 if query["after"] in ids else len(ids)
+        window = ids[start:start + limit]
+        more = start + limit < len(ids)
+
+        return 200, {"artists": {
+            "href": f"{self.prefix}me/following?type=artist",
+            "items": [lib.artist_object(a) for a in window],
+            "limit": limit,
+            "total": len(ids),
+            "next": f"{self.prefix}me/following?{urlencode({'type': 'artist', 'limit': limit, 'after': window[-1]})}" if more else None,
+            "cursors": {"after": window[-1] if more else None},
+        }}
+
+    def _playlist_object(self, playlist, with_tracks=True):
+        lib = self.library
+        obj = {
+            "id": playlist["id"],
+            "name": playlist["name"],
+            "description": playlist["description"],
+            "public": playlist["public"],
+            "collaborative": False,
+            "owner": {"id": playlist["owner"], "type": "user"},
+            "snapshot_id": playlist["snapshot_id"],
+            "type": "playlist",
+            "uri": f"spotify:playlist:{playlist['id']}",
+        }
+        if with_tracks:
+            items = [{"added_at": None, "track": lib.track_object(t)} for t in playlist["track_ids"][:100]]
+            page = self._page(f"playlists/{playlist['id']}/items", playlist["track_ids"], {"limit": 100}, max_limit=100)
+            page["items"] = items
+            obj["tracks"] = page
+        else:
+            obj["tracks"] = {"href": f"{self.prefix}playlists/{playlist['id']}/items",
+                             "total": len(playlist["track_ids"])}
+        return obj
+
+    def playlist(self, playlist_id, query, body):
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return 404, None
+        return 200, self._playlist_object(playlist), playlist["snapshot_id"]
+
+    def playlist_items(self, playlist_id, kind, query, body):
+        lib = self.library
+        playlist = lib.playlists.get(playlist_id)
+        if playlist is None:
+            return 404, None
+
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 100)), 100)
+        window = playlist["track_ids"][offset:offset + limit]
+        page = self._page(f"playlists/{playlist_id}/{kind}", playlist["track_ids"], query,
+                          default_limit=100, max_limit=100)
+        page["items"] = [{"added_at": None, "track": lib.track_object(t)} for t in window]
+        return 200, page, f"{playlist['snapshot_id']}-{offset}-{limit}"
+
+    def my_playlists(self, query, body):
+        playlists = [self._playlist_object(p, with_tracks=False) for p in self.library.playlists.values()]
+        return 200, self._page("me/playlists", playlists, query)
+
+    def create_playlist(self, user_id, query, body):
+        lib = self.library
+        playlist_id = "".join(self._rng.choices(_BASE62, k=22))
+        lib.playlists[playlist_id] = {
+            "id": playlist_id,
+            "name": body.get("name", ""),
+            "owner": lib.user_id,
+            "description": body.get("description", ""),
+            "public": bool(body.get("public", True)),
+            "snapshot_id": playlist_id,
+            "track_ids": [],
+        }
+        lib.playlist_ids[body.get("name", "")] = playlist_id
+        return 201, self._playlist_object(lib.playlists[playlist_id])
+
+    def change_playlist(self, playlist_id, query, body):
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return 404, None
+        for key in ("name", "description", "public"):
+            if key in (body or {}):
+                playlist[key] = body[key]
+        return 200, {}
+
+    def replace_items(self, playlist_id, kind, query, body):
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return 404, None
+        if "uris" in (body or {}):
+            playlist["track_ids"] = self._uri_ids(body["uris"])
+            self._bump_snapshot(playlist)
+        return 200, {"snapshot_id": playlist["snapshot_id"]}
+
+    def add_items(self, playlist_id, kind, query, body):
+        playlist = self.library.playlists.get(playlist_id)
+        if playlist is None:
+            return 404, None
+        uris = body["uris"] if isinstance(body, dict) else (body or [])
+        ids = self._uri_ids(uris)
+        if len(ids) > 100:
+            return 400, {"error": {"status": 400, "message": "Too many ids requested"}}
+
+        position = query.get("position")
+        if position is None:
+            playlist["track_ids"].extend(ids)
+        else:
+            playlist["track_ids"][int(position):int(position)] = ids
+        self._bump_snapshot(playlist)
+        return 201, {"snapshot_id": playlist["snapshot_id"]}
+
+    def audio_features(self, query, body):
+        ids = query.get("ids", "").split(",")[:100]
+        return 200, {"audio_features": [self.library.audio_features(t) for t in ids]}
+
+    _ID = r"([0-9A-Za-z]+)"
+    _ROUTES = [
+        ("GET", re.compile(r"^/v1/me$"), "me"),
+        ("GET", re.compile(r"^/v1/tracks$"), "several_tracks"),
+        ("GET", re.compile(rf"^/v1/tracks/{_ID}$"), "track"),
+        ("GET", re.compile(r"^/v1/albums$"), "several_albums"),
+        ("GET", re.compile(rf"^/v1/albums/{_ID}$"), "album"),
+        ("GET", re.compile(rf"^/v1/albums/{_ID}/tracks$"), "album_tracks"),
+        ("GET", re.compile(r"^/v1/artists$"), "several_artists"),
+        ("GET", re.compile(rf"^/v1/artists/{_ID}$"), "artist"),
+        ("GET", re.compile(rf"^/v1/artists/{_ID}/albums$"), "artist_albums"),
+        ("GET", re.compile(rf"^/v1/artists/{_ID}/top-tracks$"), "artist_top_tracks"),
+        ("GET", re.compile(r"^/v1/me/tracks$"), "saved_tracks"),
+        ("GET", re.compile(r"^/v1/me/top/tracks$"), "top_tracks"),
+        ("GET", re.compile(r"^/v1/me/player/recently-played$"), "recently_played"),
+        ("GET", re.compile(r"^/v1/me/following$"), "following"),
+        ("GET", re.compile(r"^/v1/me/playlists$"), "my_playlists"),
+        ("GET", re.compile(rf"^/v1/playlists/{_ID}$"), "playlist"),
+        ("GET", re.compile(rf"^/v1/playlists/{_ID}/(items|tracks)$"), "playlist_items"),
+        ("POST", re.compile(r"^/v1/users/([^/]+)/playlists$"), "create_playlist"),
+        ("PUT", re.compile(rf"^/v1/playlists/{_ID}$"), "change_playlist"),
+        ("PUT", re.compile(rf"^/v1/playlists/{_ID}/(items|tracks)$"), "replace_items"),
+        ("POST", re.compile(rf"^/v1/playlists/{_ID}/(items|tracks)$"), "add_items"),
+        ("GET", re.compile(r"^/v1/audio-features$"), "audio_features"),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Spotify Web API on localhost.")
+    parser.add_argument("--tracks", type=int, default=1000, help="saved tracks in the synthetic library")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeSpotifyServer(
+        make_library(args.tracks, seed=args.seed),
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit_every=args.rate_limit_every,
+        rate_limit_prob=args.rate_limit_prob,
+        seed=args.seed,
+    )
+    print(f"fake Spotify API on {server.prefix} (set sp.prefix to this)")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
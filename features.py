@@ -0,0 +1,150 @@
+"""
+Audio-features store in DuckDB, keyed by track_id.
+
+fill_audio_features() only asks its source for track ids that have no
+stored row yet, 100 at a time, and bulk-inserts the results. Ids the
+source returned nothing for are stored with found = false and asked for
+again once that row is older than NOT_FOUND_RETRY_DAYS (features can
+appear later, and a null may have been a temporary failure).
+
+A source is any callable taking a list of up to 100 track ids and
+returning a list of the same length with a feature dict (or None) per id:
+spotify_source(sp) for the Web API, dataframe_source(df) for a
+precomputed dataset, or a fake_spotify client.
+
+Example:
+features.init_audio_features(con)
+features.fill_audio_features(con, features.spotify_source(sp), tables=["my_liked_songs"])
+"""
+import time
+
+import pandas as pd
+
+import functions as fn
+from profiling import span
+
+
+# days before an id stored with found = false is looked up again
+NOT_FOUND_RETRY_DAYS = 30
+
+
+def init_audio_features(con):
+    """
+    Create the audio_features table if it does not exist.
+    """
+    columns = ",\n".join(
+        f"    {c} {'INTEGER' if c in ('key', 'mode', 'time_signature') else 'DOUBLE'}"
+        for c in fn.AUDIO_FEATURE_COLUMNS
+    )
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS audio_features (
+        track_id TEXT PRIMARY KEY,
+    {columns},
+        found BOOLEAN,
+        fetched_at DOUBLE
+    );
+    """)
+
+
+def spotify_source(sp):
+    """
+    Feature source backed by the Spotify audio-features endpoint.
+    """
+    def fetch(track_ids):
+        with span("fetch", endpoint="audio_features"):
+            return sp.audio_features(track_ids)
+
+    return fetch
+
+
+def dataframe_source(df, id_column="track_id"):
+    """
+    Feature source backed by a precomputed dataset (e.g. a CSV export).
+
+    Example:
+    source = dataframe_source(pd.read_csv("tracks_features.csv"), id_column="id")
+    """
+    lookup = df.set_index(id_column)[fn.AUDIO_FEATURE_COLUMNS]
+    lookup = lookup[~lookup.index.duplicated()]
+    records = lookup.to_dict("index")
+
+    def fetch(track_ids):
+        return [
+            {"id": track_id, **records[track_id]} if track_id in records else None
+            for track_id in track_ids
+        ]
+
+    return fetch
+
+
+def missing_track_ids(con, tables, retry_days=NOT_FOUND_RETRY_DAYS):
+    """
+    Return track ids found in `tables` that have no row in audio_features,
+    or only a found = false row older than retry_days.
+    """
+    union = "\nUNION\n".join(f"SELECT track_id FROM {t}" for t in tables)
+    retry_before = time.time() - retry_days * 86400
+
+    # no bound parameters: binding one makes DuckDB import numpy
+    rows = con.execute(f"""
+        SELECT DISTINCT s.track_id
+        FROM ({union}) s
+        ANTI JOIN (
+            SELECT track_id FROM audio_features
+            WHERE found OR fetched_at >= {float(retry_before)!r}
+        ) f ON f.track_id = s.track_id
+        WHERE s.track_id IS NOT NULL;
+    """).fetchall()
+
+    return [row[0] for row in rows]
+
+
+def _insert(con, rows):
+    columns = fn.AUDIO_FEATURE_COLUMNS + ["found", "fetched_at"]
+    df = pd.DataFrame(rows, columns=["track_id"] + columns)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns)
+
+    with span("duckdb_write", table="audio_features", rows=len(df)):
+        con.register("_temp_features", df)
+        # a retried id replaces its found = false row
+        con.execute(f"""
+            INSERT INTO audio_features BY NAME
+            SELECT * FROM _temp_features
+            ON CONFLICT (track_id) DO UPDATE SET {updates};
+        """)
+        con.unregister("_temp_features")
+
+
+def fill_audio_features(con, source, tables=("my_liked_songs",), batch_size=100,
+                        insert_every=5000, retry_days=NOT_FOUND_RETRY_DAYS):
+    """
+    Fetch and store features for every track in `tables` that has none yet
+    (or none found more than retry_days ago).
+    Rows are inserted in bulk every `insert_every` ids.
+    Returns the number of ids that were looked up.
+
+    Example:
+    n = fill_audio_features(con, spotify_source(sp), tables=["my_liked_songs", "Covers"])
+    """
+    init_audio_features(con)
+    track_ids = missing_track_ids(con, tables, retry_days)
+
+    rows = []
+    for i in range(0, len(track_ids), batch_size):
+        batch = track_ids[i:i + batch_size]
+        fetched_at = time.time()
+
+        for track_id, f in zip(batch, source(batch)):
+            if f is None:
+                rows.append([track_id] + [None] * len(fn.AUDIO_FEATURE_COLUMNS) + [False, fetched_at])
+            else:
+                rows.append([track_id] + [f.get(c) for c in fn.AUDIO_FEATURE_COLUMNS] + [True, fetched_at])
+
+        if len(rows) >= insert_every:
+            _insert(con, rows)
+            rows = []
+
+    if rows:
+        _insert(con, rows)
+
+    return len(track_ids)
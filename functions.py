@@ -1,17 +1,26 @@
-import requests
-import pandas as pd
+import re
+import time
 
+from lazy import lazy_import
+from profiling import span, traced
 
-def get_genre_tags(artist,track):
+# loaded on first use, so catalog / playlist helpers start fast
+pd = lazy_import("pandas")
+transport = lazy_import("transport")
+
+
+def get_genre_tags(artist,track,session=None):
     """
     Given a Spotify artist and track object, return combined genre tags.
+    Uses the shared keep-alive MusicBrainz session unless one is passed.
     """
 
     artist = artist.replace(" ","%20")
     track = track.replace(" ","%20")
     url = f"https://musicbrainz.org/ws/2/recording/?query=recording:\"{track}\"%20AND%20artist:\"{artist}\"&fmt=json#"
     # print(url)
-    response = requests.get(url)
+    with span("fetch", endpoint="musicbrainz_recording"):
+        response = (session or transport.musicbrainz_session()).get(url)
     data = response.json()
 
     genres = []
@@ -30,6 +39,7 @@ if __name__ == "__main__":
 
 
 
+@traced("normalize")
 def normalize_track_item(track, source_type, source_id):
     """
     Convert a Spotify track object into a flat row suitable for DuckDB.
@@ -58,21 +68,36 @@ def normalize_track_item(track, source_type, source_id):
             "explicit": track["explicit"],
             "preview_url": track["preview_url"],
             "uri": track["uri"],
+            "isrc": (track.get("external_ids") or {}).get("isrc"),
             # "genres": genre_tags,  # Placeholder for genres
         }
 
-def load_tracks_from_playlist(sp, playlist_id, limit:int=50):
+def _emit_page(on_page, rows):
+    """
+    Hand one page of row dicts to an on_page callback.
+    """
+    if rows:
+        on_page(rows)
+    return len(rows)
+
+def load_tracks_from_playlist(sp, playlist_id, limit:int=50, on_page=None):
     """
     Example:
     df = load_tracks_from_playlist(sp, "37i9dQZF1DXcBWIGoYBM5M")  # Today's Top Hits
     df.head()
 
+    If on_page is given, each page's rows (a list of dicts) are passed to
+    it as soon as they are fetched (nothing is collected) and the row
+    count is returned:
+    n = load_tracks_from_playlist(sp, playlist_id, on_page=writer.chunk_callback("Covers"))
     """
     tracks = []
     offset = 0
+    emitted = 0
 
     while True:
-        data = sp.playlist_items(playlist_id, limit=limit, offset=offset)
+        with span("fetch", endpoint="playlist_items"):
+            data = sp.playlist_items(playlist_id, limit=limit, offset=offset)
         items = data.get("items", [])
         if not items:
             break
@@ -85,9 +110,17 @@ def load_tracks_from_playlist(sp, playlist_id, limit:int=50):
                     source_id="playlist", 
                     source_type=playlist_id))
 
+        if on_page is not None:
+            emitted += _emit_page(on_page, tracks)
+            tracks = []
+
         offset += len(items)
 
-    return pd.DataFrame(tracks)
+    if on_page is not None:
+        return emitted
+
+    with span("frame_build"):
+        return pd.DataFrame(tracks)
 
 def load_tracks_from_album(sp, album_id):
     """
@@ -96,49 +129,156 @@ def load_tracks_from_album(sp, album_id):
     df.head()
 
     """
-    album = sp.album(album_id)
+    with span("fetch", endpoint="album"):
+        album = sp.album(album_id)
     album_name = album["name"]
 
     tracks = []
     for track in album["tracks"]["items"]:
         # Spotify album tracks lack full "track" object fields unless we fetch
-        full_track = sp.track(track["id"])
+        with span("fetch", endpoint="track"):
+            full_track = sp.track(track["id"])
         tracks.append(normalize_track_item(full_track, "album", album_id))
 
-    return pd.DataFrame(tracks)
+    with span("frame_build"):
+        return pd.DataFrame(tracks)
 
-def load_tracks_from_artist(sp, artist_id):
+# canonical release preference: albums first, then singles, then compilations
+RELEASE_TYPE_RANK = {"album": 0, "single": 1, "compilation": 2, "appears_on": 3}
+
+_EDITION_WORDS = r"(deluxe|remaster\w*|expanded|edition|anniversary|bonus|version|mono|stereo|radio edit)"
+_EDITION_SUFFIX = re.compile(rf"\s*([\(\[][^\)\]]*{_EDITION_WORDS}[^\)\]]*[\)\]]|\s-\s.*{_EDITION_WORDS}.*)$", re.I)
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize_title(name):
     """
+    Normalize a track or release title for matching recordings across releases.
+
     Example:
-    df = load_tracks_from_artist(sp, "4dpARuHxo51G3z768sgnrY")  # Adele
-    df.head()
+    normalize_title("Hello - Remastered 2015")  # 'hello'
+    normalize_title("25 (Deluxe Edition)")      # '25'
+    """
+    name = name or ""
+    while True:
+        stripped = _EDITION_SUFFIX.sub("", name)
+        if stripped == name:
+            break
+        name = stripped
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+def plan_artist_discography(sp, artist_id, include_compilations=True, duration_tolerance_ms=3000):
     """
+    Pick one canonical release per recording before any track is hydrated.
+
+    Releases are ranked album > single > compilation, plain editions before
+    deluxe/remaster ones, then oldest first. Their tracklists are fetched
+    20 albums per request, and a track is kept only if no better-ranked
+    release already had the same normalized title (with a duration within
+    duration_tolerance_ms). Releases with nothing new are skipped.
+
+    Returns (track_ids in canonical order, stats dict).
+
+    Example:
+    track_ids, stats = plan_artist_discography(sp, "4dpARuHxo51G3z768sgnrY")
+    """
+    groups = "album,single,compilation" if include_compilations else "album,single"
+
     albums = []
-    
-    # Get all albums + singles
-    results = sp.artist_albums(artist_id, album_type="album,single,compilation", limit=50)
+    with span("fetch", endpoint="artist_albums"):
+        results = sp.artist_albums(artist_id, include_groups=groups, limit=50)
     albums.extend(results["items"])
 
-    # Continue paging if needed
     while results.get("next"):
-        results = sp.next(results)
+        with span("fetch", endpoint="artist_albums"):
+            results = sp.next(results)
         albums.extend(results["items"])
 
-    seen_albums = {a["id"]: a for a in albums}.values()
+    releases = list({a["id"]: a for a in albums}.values())
+    releases.sort(key=lambda a: (
+        RELEASE_TYPE_RANK.get(a.get("album_group") or a.get("album_type"), 9),
+        bool(_EDITION_SUFFIX.search(a["name"] or "")),
+        a.get("release_date") or "9999",
+    ))
+
+    # simplified tracklists, 20 releases per request
+    tracklists = {}
+    for i in range(0, len(releases), 20):
+        ids = [a["id"] for a in releases[i:i+20]]
+        with span("fetch", endpoint="albums"):
+            full = sp.albums(ids)["albums"]
+        for album in full:
+            if not album:
+                continue
+            page = album["tracks"]
+            items = list(page["items"])
+            while page.get("next"):
+                with span("fetch", endpoint="album_tracks"):
+                    page = sp.next(page)
+                items.extend(page["items"])
+            tracklists[album["id"]] = items
+
+    seen = {}  # normalized title -> durations already kept
+    track_ids = []
+    skipped_releases = 0
+
+    for album in releases:
+        kept = 0
+        for item in tracklists.get(album["id"], []):
+            if not item or not item.get("id"):
+                continue
+            title = normalize_title(item["name"])
+            duration = item.get("duration_ms") or 0
+            durations = seen.setdefault(title, [])
+            if any(abs(duration - d) <= duration_tolerance_ms for d in durations):
+                continue
+            durations.append(duration)
+            track_ids.append(item["id"])
+            kept += 1
+        skipped_releases += kept == 0
+
+    stats = {
+        "releases": len(releases),
+        "skipped_releases": skipped_releases,
+        "tracks_listed": sum(len(t) for t in tracklists.values()),
+        "tracks_planned": len(track_ids),
+    }
+    return track_ids, stats
+
+def load_tracks_from_artist(sp, artist_id, include_compilations=True):
+    """
+    Load one row per recording in an artist's discography.
+    Redundant releases (singles, deluxe editions, compilations of tracks
+    already on an album) are skipped by plan_artist_discography before
+    hydration; tracks are hydrated 50 per request and deduped by ISRC.
+
+    Example:
+    df = load_tracks_from_artist(sp, "4dpARuHxo51G3z768sgnrY")  # Adele
+    df.head()
+    """
+    track_ids, _ = plan_artist_discography(sp, artist_id, include_compilations=include_compilations)
 
     all_tracks = []
-
-    # Load tracks from each album
-    for album in seen_albums:
-        album_id = album["id"]
-        data = sp.album_tracks(album_id)
-        for item in data["items"]:
-            full_track = sp.track(item["id"])
+    seen_isrcs = set()
+
+    # Hydrate in batches (full track objects carry popularity and ISRC)
+    for i in range(0, len(track_ids), 50):
+        with span("fetch", endpoint="tracks"):
+            full_tracks = sp.tracks(track_ids[i:i+50])["tracks"]
+        for full_track in full_tracks:
+            if not full_track:
+                continue
+            isrc = (full_track.get("external_ids") or {}).get("isrc")
+            if isrc:
+                if isrc in seen_isrcs:
+                    continue
+                seen_isrcs.add(isrc)
             all_tracks.append(normalize_track_item(full_track, "artist", artist_id))
 
     # Convert to DataFrame and drop duplicates
-    df = pd.DataFrame(all_tracks)
-    df = df.drop_duplicates(subset=["track_id"])
+    with span("frame_build"):
+        df = pd.DataFrame(all_tracks)
+        if not df.empty:
+            df = df.drop_duplicates(subset=["track_id"])
 
     return df
 
@@ -181,7 +321,7 @@ def load_any(sp, spotify_id, id_type=None):
 
     raise ValueError(f"Unsupported id_type: {id_type}")
 
-def load_my_saved_tracks(sp, limit:int=50):
+def load_my_saved_tracks(sp, limit:int=50, on_page=None):
     """
     Fetch all saved (liked) tracks for the current user.
 
@@ -191,6 +331,10 @@ def load_my_saved_tracks(sp, limit:int=50):
         An authenticated Spotipy client.
     limit : int, optional
         Page size for each API request (max 50).
+    on_page : callable, optional
+        Called with each page's rows (a list of dicts) as soon as they
+        are fetched (e.g. writer.DuckDBWriter.chunk_callback); rows are
+        then not collected and the row count is returned instead.
 
     Returns
     -------
@@ -199,9 +343,11 @@ def load_my_saved_tracks(sp, limit:int=50):
     """
     results = []
     offset = 0
+    emitted = 0
 
     while True:
-        page = sp.current_user_saved_tracks(limit=limit, offset=offset)
+        with span("fetch", endpoint="current_user_saved_tracks"):
+            page = sp.current_user_saved_tracks(limit=limit, offset=offset)
         items = page["items"]
         if not items:
             break
@@ -229,12 +375,21 @@ def load_my_saved_tracks(sp, limit:int=50):
                 "popularity": track.get("popularity"),
                 "is_local": track.get("is_local", False),
                 "uri": track["uri"],
+                "isrc": (track.get("external_ids") or {}).get("isrc"),
 
             })
 
+        if on_page is not None:
+            emitted += _emit_page(on_page, results)
+            results = []
+
         offset += len(items)
 
-    return pd.DataFrame(results)
+    if on_page is not None:
+        return emitted
+
+    with span("frame_build"):
+        return pd.DataFrame(results)
 
 def load_my_top_tracks(sp, time_range="medium_term", limit=50):
     """
@@ -254,7 +409,8 @@ def load_my_top_tracks(sp, time_range="medium_term", limit=50):
     pandas.DataFrame
         One row per top track with useful metadata.
     """
-    results = sp.current_user_top_tracks(time_range=time_range, limit=limit)
+    with span("fetch", endpoint="current_user_top_tracks"):
+        results = sp.current_user_top_tracks(time_range=time_range, limit=limit)
     items = results.get("items", [])
 
     rows = []
@@ -264,7 +420,8 @@ def load_my_top_tracks(sp, time_range="medium_term", limit=50):
             normalize_track_item(track, "top", time_range)
         )
 
-    return pd.DataFrame(rows)
+    with span("frame_build"):
+        return pd.DataFrame(rows)
 
 
 def load_my_recently_played(sp, limit=50, after=None,before=None):
@@ -283,7 +440,8 @@ def load_my_recently_played(sp, limit=50, after=None,before=None):
     pandas.DataFrame
         One row per recently played track with useful metadata.
     """
-    results = sp.current_user_recently_played(limit=limit, after=after, before=before)
+    with span("fetch", endpoint="current_user_recently_played"):
+        results = sp.current_user_recently_played(limit=limit, after=after, before=before)
     items = results.get("items", [])
 
     rows = []
@@ -295,38 +453,57 @@ def load_my_recently_played(sp, limit=50, after=None,before=None):
         row["played_at"] = played_at
         rows.append(row)
 
-    return pd.DataFrame(rows)
+    with span("frame_build"):
+        df = pd.DataFrame(rows)
 
+    # cursor for the next incremental fetch (recorded in the sync catalog)
+    cursors = results.get("cursors") or {}
+    if cursors.get("after"):
+        df.attrs["cursor"] = cursors["after"]
 
-# def audio_features_for_tracks(sp,track_ids, batch_size=10):
-#     """
-#     track_ids = saved_df["track_id"].dropna().unique().tolist()
-#     features_df = fetch_audio_features_for_tracks(track_ids)
-#     """
-#     features_rows = []
-    
-#     for i in range(0, len(track_ids), batch_size):
-#         batch = track_ids[i:i+batch_size]
-#         features = sp.audio_features(batch)
-#         for f in features:
-#             if f is None:
-#                 continue
-#             features_rows.append({
-#                 "track_id": f["id"],
-#                 "danceability": f["danceability"],
-#                 "energy": f["energy"],
-#                 "key": f["key"],
-#                 "loudness": f["loudness"],
-#                 "mode": f["mode"],
-#                 "speechiness": f["speechiness"],
-#                 "acousticness": f["acousticness"],
-#                 "instrumentalness": f["instrumentalness"],
-#                 "liveness": f["liveness"],
-#                 "valence": f["valence"],
-#                 "tempo": f["tempo"],
-#                 "time_signature": f["time_signature"]
-#             })
-#     return pd.DataFrame(features_rows)
+    return df
+
+
+AUDIO_FEATURE_COLUMNS = [
+    "danceability",
+    "energy",
+    "key",
+    "loudness",
+    "mode",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "valence",
+    "tempo",
+    "time_signature",
+]
+
+def audio_features_for_tracks(sp,track_ids, batch_size=100):
+    """
+    Fetch audio features, 100 ids per request (the endpoint maximum).
+    To fetch only what is not stored yet, use features.fill_audio_features.
+
+    Example:
+    track_ids = saved_df["track_id"].dropna().unique().tolist()
+    features_df = audio_features_for_tracks(sp, track_ids)
+    """
+    features_rows = []
+
+    for i in range(0, len(track_ids), batch_size):
+        batch = track_ids[i:i+batch_size]
+        with span("fetch", endpoint="audio_features"):
+            features = sp.audio_features(batch)
+        for f in features:
+            if f is None:
+                continue
+            features_rows.append({
+                "track_id": f["id"],
+                **{c: f[c] for c in AUDIO_FEATURE_COLUMNS}
+            })
+
+    with span("frame_build"):
+        return pd.DataFrame(features_rows, columns=["track_id"] + AUDIO_FEATURE_COLUMNS)
 
 def get_followed_artists_df(sp, limit=50):
     """
@@ -340,7 +517,8 @@ def get_followed_artists_df(sp, limit=50):
     all_artists = []
     
     # First page
-    data = sp.current_user_followed_artists(limit=limit)
+    with span("fetch", endpoint="current_user_followed_artists"):
+        data = sp.current_user_followed_artists(limit=limit)
     artists = data["artists"]["items"]
     all_artists.extend(artists)
 
@@ -348,24 +526,26 @@ def get_followed_artists_df(sp, limit=50):
     cursor = data["artists"]["cursors"]["after"]
 
     while cursor:
-        data = sp.current_user_followed_artists(limit=limit, after=cursor)
+        with span("fetch", endpoint="current_user_followed_artists"):
+            data = sp.current_user_followed_artists(limit=limit, after=cursor)
         artists = data["artists"]["items"]
         all_artists.extend(artists)
 
         cursor = data["artists"]["cursors"]["after"]
 
     # Convert to DataFrame
-    df = pd.DataFrame([
-        {
-            "artist_id": a["id"],
-            "name": a["name"],
-            "followers": a["followers"]["total"],
-            "popularity": a["popularity"],
-            "genres": ", ".join(a.get("genres", [])),
-            "uri": a["uri"]
-        }
-        for a in all_artists
-    ])
+    with span("frame_build"):
+        df = pd.DataFrame([
+            {
+                "artist_id": a["id"],
+                "name": a["name"],
+                "followers": a["followers"]["total"],
+                "popularity": a["popularity"],
+                "genres": ", ".join(a.get("genres", [])),
+                "uri": a["uri"]
+            }
+            for a in all_artists
+        ])
 
     return df
 
@@ -374,7 +554,8 @@ def get_artist_top_tracks_df(sp, artist_id, country="US"):
     Return a DataFrame of an artist's most popular songs.
     Spotify requires a country parameter (ISO 3166-1 alpha-2 code).
     """
-    data = sp.artist_top_tracks(artist_id, country=country)
+    with span("fetch", endpoint="artist_top_tracks"):
+        data = sp.artist_top_tracks(artist_id, country=country)
     tracks = data.get("tracks", [])
 
     rows = []
@@ -391,10 +572,12 @@ def get_artist_top_tracks_df(sp, artist_id, country="US"):
             "duration_ms": t["duration_ms"],
             "explicit": t["explicit"],
             "preview_url": t["preview_url"],
-            "uri": t["uri"]
+            "uri": t["uri"],
+            "isrc": (t.get("external_ids") or {}).get("isrc"),
         })
 
-    return pd.DataFrame(rows)
+    with span("frame_build"):
+        return pd.DataFrame(rows)
 
 def find_playlist_by_name(sp,name):
     playlists = []
@@ -545,65 +728,206 @@ def playlist_cleanup(sp, playlist_id, sort_by=None):
     return df
 
 
-def duckdb_table_age(con, table_name):
+SYNC_SCHEMA_VERSION = 2
+
+SYNC_CATALOG_COLUMNS = [
+    "table_name",
+    "synced_at",
+    "row_count",
+    "api_calls",
+    "bytes_transferred",
+    "fetch_seconds",
+    "write_seconds",
+    "snapshot_id",
+    "etag",
+    "cursor",
+    "schema_version",
+]
+
+
+def duckdb_init_catalog(con):
+    """
+    Create the sync catalog once at startup (the catalog helpers also
+    create it on first use).
+
+    sync_catalog holds one row per source table (the latest sync),
+    sync_log keeps every sync so cost can be tracked over time.
+    Rows from the old table_updated bookkeeping are carried over.
+
+    Example:
+    con = duckdb.connect("spotify.duckdb")
+    duckdb_init_catalog(con)
+    """
+    columns = """
+        synced_at DOUBLE,
+        row_count BIGINT,
+        api_calls BIGINT,
+        bytes_transferred BIGINT,
+        fetch_seconds DOUBLE,
+        write_seconds DOUBLE,
+        snapshot_id TEXT,
+        etag TEXT,
+        cursor TEXT,
+        schema_version INTEGER
+    """
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS sync_catalog (
+        table_name TEXT PRIMARY KEY,
+        {columns}
+    );
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS sync_log (
+        table_name TEXT,
+        {columns}
+    );
+    """)
+
+    legacy = con.execute("""
+        SELECT count(*) FROM information_schema.tables
+        WHERE table_schema = current_schema() AND table_name = 'table_updated';
+    """).fetchone()[0]
+
+    if legacy:
+        con.execute("""
+            INSERT INTO sync_catalog (table_name, synced_at)
+            SELECT table_name, CAST(updated_at AS DOUBLE) FROM table_updated
+            ON CONFLICT DO NOTHING;
+        """)
+        con.execute("DROP TABLE table_updated;")
+
+
+def _with_catalog(con, run):
+    """
+    Return run(); when the sync catalog does not exist yet, create it
+    first, so callers that never ran duckdb_init_catalog keep working.
+    """
+    import duckdb
+
+    try:
+        return run()
+    except duckdb.CatalogException:
+        duckdb_init_catalog(con)
+        return run()
+
+
+def duckdb_sync_catalog(con):
+    """
+    Read the whole sync catalog with one query.
+    Returns a dict of table_name -> row (dict), each row including age_days.
+
+    Example:
+    catalog = duckdb_sync_catalog(con)
+    catalog["my_liked_songs"]["row_count"]
+    """
+    df = _with_catalog(con, lambda: con.execute("""
+        SELECT *, (epoch(now()) - synced_at) / 86400 AS age_days
+        FROM sync_catalog;
+    """).df())
+
+    df = df.astype(object).where(df.notna(), None)
+    return {row["table_name"]: row for row in df.to_dict("records")}
+
+
+def duckdb_table_age(con, table_name, catalog=None):
     """
     Return the age of a DuckDB table in days since last update.
     If table does not exist or has never been updated, returns None.
 
+    Pass a catalog from duckdb_sync_catalog to avoid querying DuckDB.
+
     Example:
-    age_seconds = duckdb_table_age(con, "my_table")
+    age_days = duckdb_table_age(con, "my_table")
     """
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS table_updated (
-    table_name TEXT PRIMARY KEY,
-    updated_at BIGINT
-    );
-    """)
+    if catalog is not None:
+        row = catalog.get(table_name)
+        return None if row is None else row["age_days"]
 
-    result = con.execute("""
-        SELECT updated_at FROM table_updated
+    result = _with_catalog(con, lambda: con.execute("""
+        SELECT (epoch(now()) - synced_at) / 86400 FROM sync_catalog
         WHERE table_name = ?;
-    """, [table_name]).fetchone()
+    """, [table_name]).fetchone())
 
     if result is None:
         return None
 
-    updated_at = result[0]
-    current_time = con.execute("SELECT epoch(now());").fetchone()[0]
+    return result[0]
 
-    return (current_time - updated_at)/86400
 
+def duckdb_table_updated(con, table_name, row_count=None, api_calls=None,
+                         bytes_transferred=None, fetch_seconds=None,
+                         write_seconds=None, snapshot_id=None, etag=None,
+                         cursor=None):
+    """
+    Record a sync of table_name in the sync catalog and the sync log.
 
+    Example:
+    duckdb_table_updated(con, "my_table", row_count=120, api_calls=3)
+    """
+    values = [
+        table_name,
+        row_count,
+        api_calls,
+        bytes_transferred,
+        fetch_seconds,
+        write_seconds,
+        snapshot_id,
+        etag,
+        cursor,
+        SYNC_SCHEMA_VERSION,
+    ]
+    names = ", ".join(c for c in SYNC_CATALOG_COLUMNS if c != "synced_at")
+    params = ", ".join("?" for _ in values)
+    updates = ", ".join(
+        f"{c} = excluded.{c}" for c in SYNC_CATALOG_COLUMNS if c != "table_name"
+    )
 
-def duckdb_table_updated(con, table_name):
+    def record():
+        con.execute(f"""
+            INSERT INTO sync_catalog (synced_at, {names})
+            VALUES (epoch(now()), {params})
+            ON CONFLICT (table_name)
+                DO UPDATE SET {updates};
+        """, values)
 
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS table_updated (
-    table_name TEXT PRIMARY KEY,
-    updated_at DOUBLE
-    );
-    """)
+        con.execute(f"""
+            INSERT INTO sync_log (synced_at, {names})
+            VALUES (epoch(now()), {params});
+        """, values)
 
-    con.execute("""
-        INSERT INTO table_updated (table_name, updated_at)
-        VALUES (?, epoch(now()))
-        ON CONFLICT(table_name)
-            DO UPDATE SET updated_at = epoch(now());
-    """, [table_name])
+    _with_catalog(con, record)
 
 
-def df_to_duckdb(con, df, table_name):
+def df_to_duckdb(con, df, table_name, **sync_stats):
     """
     Save a pandas DataFrame to DuckDB table.
     Overwrites existing table.
 
+    Extra keyword arguments (api_calls, fetch_seconds, ...) are recorded
+    in the sync catalog. snapshot_id, etag and cursor are also picked up
+    from df.attrs when a loader set them.
+
     Example:
     df_to_duckdb(con, df, "my_table")
     """
-    con.register("_temp_df", df)
-    con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM _temp_df")
+    start = time.perf_counter()
 
-    duckdb_table_updated(con, table_name)
+    with span("duckdb_write", table=table_name, rows=len(df)):
+        con.register("_temp_df", df)
+        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM _temp_df")
+        con.unregister("_temp_df")
+
+    for key in ("snapshot_id", "etag", "cursor"):
+        if key in df.attrs:
+            sync_stats.setdefault(key, df.attrs[key])
+
+    duckdb_table_updated(
+        con,
+        table_name,
+        row_count=len(df),
+        write_seconds=time.perf_counter() - start,
+        **sync_stats
+    )
 
 def duckdb_to_df(con, table_name):
     """
@@ -613,3 +937,26 @@ def duckdb_to_df(con, table_name):
     df = duckdb_to_df(con, "my_table")
     """
     return con.execute(f"SELECT * FROM {table_name}").df()
+
+def duckdb_query_uris(con, sql, params=None):
+    """
+    Run a recipe query on the persistent connection and return only its uri column.
+    Nothing but the URI list is materialized in Python.
+
+    Example:
+    uris = duckdb_query_uris(con, "select * from my_liked_songs order by saved_at desc limit 100")
+    add_tracks_to_playlist(sp, playlist_id, uris)
+    """
+    rows = con.execute(f"SELECT uri FROM ({sql}) AS recipe", params).fetchall()
+    return [row[0] for row in rows]
+
+def duckdb_query_arrow(con, sql, params=None):
+    """
+    Run a query on the persistent connection and return a pyarrow.Table.
+
+    Example:
+    tbl = duckdb_query_arrow(con, "select * from my_liked_songs limit 100")
+    """
+    result = con.execute(sql, params)
+    to_arrow = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+    return to_arrow()
@@ -0,0 +1,209 @@
+"""
+Change-only history of track popularity and source membership in DuckDB.
+
+Both tables are slowly-changing dimensions: a row is one version, valid
+from valid_from until valid_to (epoch seconds; NULL = still current).
+record_history() compares a freshly synced table with the current
+versions and only closes / appends the rows that changed, so a year of
+daily syncs costs about one row per change, not one copy per day.
+
+- popularity_history(track_id, popularity, valid_from, valid_to)
+- membership_history(table_name, track_id, valid_from, valid_to)
+- history_recorded(table_name, recorded_at): when each table was last folded in
+
+Rows are appended in time order, so DuckDB's min/max zone maps on
+valid_from skip most row groups in as-of queries.
+
+Example:
+history.init_history(con)
+history.record_history(con, "my_liked_songs")
+history.popularity_as_of(con, "2026-03-01")
+history.members_as_of(con, "Covers", "2026-03-01")
+"""
+import time
+import datetime
+
+from profiling import span
+
+
+def init_history(con):
+    """
+    Create the history tables if they do not exist.
+    """
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS popularity_history (
+        track_id TEXT,
+        popularity INTEGER,
+        valid_from DOUBLE,
+        valid_to DOUBLE
+    );
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS membership_history (
+        table_name TEXT,
+        track_id TEXT,
+        valid_from DOUBLE,
+        valid_to DOUBLE
+    );
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS history_recorded (
+        table_name TEXT PRIMARY KEY,
+        recorded_at DOUBLE
+    );
+    """)
+
+
+def _epoch(at):
+    """
+    Accept epoch seconds, a date / datetime, or an ISO string.
+    """
+    if at is None:
+        return time.time()
+    if isinstance(at, (int, float)):
+        return float(at)
+    if isinstance(at, str):
+        at = datetime.datetime.fromisoformat(at)
+    if not isinstance(at, datetime.datetime):
+        at = datetime.datetime.combine(at, datetime.time())
+    return at.timestamp()
+
+
+def _has_column(con, table_name, column):
+    return con.execute("""
+        SELECT count(*) FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?;
+    """, [table_name, column]).fetchone()[0] > 0
+
+
+def record_history(con, table_name, synced_at=None):
+    """
+    Fold the current contents of table_name into the history tables.
+    Returns the number of versions opened and closed.
+
+    Example:
+    record_history(con, "Covers")  # -> {"popularity_opened": 3, ...}
+    """
+    init_history(con)
+    now = _epoch(synced_at)
+    counts = {}
+
+    with span("history", table=table_name):
+        # all or nothing: a half-applied update would leave open versions
+        # without the history_recorded watermark that covers them
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _history_sync AS
+                SELECT track_id, {"max(popularity)" if _has_column(con, table_name, "popularity") else "NULL"} AS popularity
+                FROM {table_name}
+                WHERE track_id IS NOT NULL
+                GROUP BY track_id;
+            """)
+
+            # membership: close tracks that left, open tracks that arrived
+            counts["membership_closed"] = con.execute("""
+                UPDATE membership_history SET valid_to = ?
+                WHERE table_name = ? AND valid_to IS NULL
+                  AND track_id NOT IN (SELECT track_id FROM _history_sync);
+            """, [now, table_name]).fetchone()[0]
+
+            counts["membership_opened"] = con.execute("""
+                INSERT INTO membership_history
+                SELECT ?, s.track_id, ?, NULL
+                FROM _history_sync s
+                ANTI JOIN (
+                    SELECT track_id FROM membership_history
+                    WHERE table_name = ? AND valid_to IS NULL
+                ) m ON m.track_id = s.track_id;
+            """, [table_name, now, table_name]).fetchone()[0]
+
+            # popularity is per track: close versions whose value changed,
+            # then open a version for every track without a current one
+            counts["popularity_closed"] = con.execute("""
+                UPDATE popularity_history h SET valid_to = ?
+                FROM _history_sync s
+                WHERE h.track_id = s.track_id AND h.valid_to IS NULL
+                  AND s.popularity IS NOT NULL
+                  AND h.popularity IS DISTINCT FROM s.popularity;
+            """, [now]).fetchone()[0]
+
+            counts["popularity_opened"] = con.execute("""
+                INSERT INTO popularity_history
+                SELECT s.track_id, s.popularity, ?, NULL
+                FROM _history_sync s
+                ANTI JOIN (
+                    SELECT track_id FROM popularity_history WHERE valid_to IS NULL
+                ) h ON h.track_id = s.track_id
+                WHERE s.popularity IS NOT NULL;
+            """, [now]).fetchone()[0]
+
+            con.execute("DROP TABLE _history_sync;")
+
+            con.execute("""
+                INSERT INTO history_recorded VALUES (?, ?)
+                ON CONFLICT (table_name) DO UPDATE SET recorded_at = excluded.recorded_at;
+            """, [table_name, now])
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+
+    return counts
+
+
+def popularity_as_of(con, at):
+    """
+    Return (track_id, popularity) as they were at `at`, as a relation.
+    """
+    return con.sql(f"""
+        SELECT track_id, popularity FROM popularity_history
+        WHERE valid_from <= {_epoch(at)!r}
+          AND (valid_to IS NULL OR valid_to > {_epoch(at)!r})
+    """)
+
+
+def members_as_of(con, table_name, at):
+    """
+    Return the track_ids that were in table_name at `at`, as a relation.
+    """
+    return con.sql(f"""
+        SELECT track_id FROM membership_history
+        WHERE table_name = '{table_name.replace("'", "''")}'
+          AND valid_from <= {_epoch(at)!r}
+          AND (valid_to IS NULL OR valid_to > {_epoch(at)!r})
+    """)
+
+
+def popularity_series(con, track_id):
+    """
+    Return every popularity version of one track as a DataFrame.
+    """
+    return con.execute("""
+        SELECT popularity,
+               to_timestamp(valid_from) AS valid_from,
+               to_timestamp(valid_to) AS valid_to
+        FROM popularity_history
+        WHERE track_id = ?
+        ORDER BY valid_from;
+    """, [track_id]).df()
+
+
+def changed_track_ids(con, table_names, since, popularity=True):
+    """
+    Return the track_ids that joined or left any of table_names (and, with
+    popularity=True, whose popularity changed) after `since`, as a relation.
+    """
+    names = ", ".join("'" + t.replace("'", "''") + "'" for t in table_names)
+    sql = f"""
+        SELECT track_id FROM membership_history
+        WHERE table_name IN ({names})
+          AND (valid_from > {_epoch(since)!r} OR valid_to > {_epoch(since)!r})
+    """
+    if popularity:
+        sql += f"""
+        UNION
+        SELECT track_id FROM popularity_history
+        WHERE valid_from > {_epoch(since)!r}
+    """
+    return con.sql(sql)
@@ -0,0 +1,258 @@
+import re
+import sys
+import time
+import threading
+import contextlib
+import contextvars
+from urllib.parse import urlsplit
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+# latency histogram bucket upper bounds (ms); the last bucket is open ended
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Spotify ids are 22 character base62 strings
+_ID_SEGMENT = re.compile(r"^[0-9A-Za-z]{22}$")
+
+_current_loader = contextvars.ContextVar("spotifydb_loader", default=None)
+
+
+def endpoint_name(method, url):
+    """
+    Collapse a request URL into an endpoint key, replacing ids with {id}.
+
+    Example:
+    endpoint_name("GET", "https://api.spotify.com/v1/playlists/37i9dQZF1DXcBWIGoYBM5M/tracks")
+    # 'GET api.spotify.com/v1/playlists/{id}/tracks'
+    """
+    parts = urlsplit(url)
+    segments = parts.path.split("/")
+
+    for i, segment in enumerate(segments):
+        if _ID_SEGMENT.match(segment):
+            segments[i] = "{id}"
+        elif i > 0 and segments[i - 1] == "users" and segment:
+            segments[i] = "{id}"
+
+    return f"{method.upper()} {parts.netloc}{'/'.join(segments)}"
+
+
+def calling_loader():
+    """
+    Name of the functions.py function that triggered the current call.
+    An explicit ApiStats.loader(...) scope takes precedence.
+    """
+    name = _current_loader.get()
+    if name:
+        return name
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if (
+            frame.f_globals.get("__name__") == "functions"
+            and not code.co_name.startswith("_")
+        ):
+            return code.co_name
+        frame = frame.f_back
+
+    return "unattributed"
+
+
+class ApiStats:
+    """
+    Thread-safe counters for outbound API calls, keyed by (loader, endpoint).
+
+    Example:
+    stats = ApiStats()
+    instrument_spotify(sp, stats)
+    df = fn.load_tracks_from_artist(sp, "4dpARuHxo51G3z768sgnrY")
+    stats.summary()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def record(self, loader, endpoint, seconds, nbytes=0, status=None,
+               retries=0, rate_limited=0, error=False):
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if seconds * 1000 <= bound:
+                bucket = i
+                break
+
+        with self._lock:
+            row = self._rows.get((loader, endpoint))
+            if row is None:
+                row = {
+                    "calls": 0,
+                    "errors": 0,
+                    "retries": 0,
+                    "rate_limited": 0,
+                    "bytes": 0,
+                    "seconds": 0.0,
+                    "latency_hist": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+                self._rows[(loader, endpoint)] = row
+
+            row["calls"] += 1
+            row["errors"] += int(error or (status is not None and status >= 400))
+            row["retries"] += retries
+            row["rate_limited"] += rate_limited
+            row["bytes"] += nbytes
+            row["seconds"] += seconds
+            row["latency_hist"][bucket] += 1
+
+    @contextlib.contextmanager
+    def loader(self, name):
+        """
+        Attribute every call made inside the block to name.
+
+        Example:
+        with stats.loader("followed_artist"):
+            fn.get_followed_artists_df(sp)
+        """
+        token = _current_loader.set(name)
+        try:
+            yield self
+        finally:
+            _current_loader.reset(token)
+
+    def totals(self):
+        """
+        Return overall counters as a dict (calls, errors, retries, rate_limited, bytes, seconds).
+        Useful for deltas around a single sync.
+        """
+        keys = ["calls", "errors", "retries", "rate_limited", "bytes", "seconds"]
+        with self._lock:
+            return {k: sum(row[k] for row in self._rows.values()) for k in keys}
+
+    def summary(self):
+        """
+        Return one row per (loader, endpoint) as a pandas DataFrame.
+        """
+        with self._lock:
+            rows = [
+                {"loader": loader, "endpoint": endpoint, **dict(row, latency_hist=list(row["latency_hist"]))}
+                for (loader, endpoint), row in self._rows.items()
+            ]
+
+        df = pd.DataFrame(rows, columns=[
+            "loader", "endpoint", "calls", "errors", "retries",
+            "rate_limited", "bytes", "seconds", "latency_hist",
+        ])
+        df["avg_ms"] = (df["seconds"] / df["calls"] * 1000).round(1)
+        return df.sort_values(["loader", "calls"], ascending=[True, False]).reset_index(drop=True)
+
+    def by_loader(self):
+        """
+        Return totals per loader as a pandas DataFrame.
+        """
+        df = self.summary().drop(columns=["latency_hist", "avg_ms"])
+        return df.groupby("loader", as_index=False).sum(numeric_only=True)
+
+    def reset(self):
+        with self._lock:
+            self._rows.clear()
+
+    def to_duckdb(self, con, run_id=None):
+        """
+        Append this run's stats to the api_call_stats table.
+
+        Example:
+        stats.to_duckdb(con)
+        """
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS api_call_stats (
+            run_id TEXT,
+            recorded_at DOUBLE,
+            loader TEXT,
+            endpoint TEXT,
+            calls BIGINT,
+            errors BIGINT,
+            retries BIGINT,
+            rate_limited BIGINT,
+            bytes BIGINT,
+            seconds DOUBLE,
+            latency_hist BIGINT[]
+        );
+        """)
+
+        df = self.summary().drop(columns=["avg_ms"])
+        if df.empty:
+            return
+
+        df.insert(0, "recorded_at", time.time())
+        df.insert(0, "run_id", run_id or time.strftime("%Y%m%dT%H%M%S"))
+
+        con.register("_temp_stats", df)
+        con.execute("INSERT INTO api_call_stats BY NAME SELECT * FROM _temp_stats")
+        con.unregister("_temp_stats")
+
+
+def instrument_session(session, stats):
+    """
+    Count every request made through a requests.Session into stats.
+    Latency includes retries done by the session's urllib3 adapter.
+
+    Example:
+    session = requests.Session()
+    instrument_session(session, stats)
+    fn.get_genre_tags("Adele", "Hello", session=session)
+    """
+    if getattr(session, "_spotifydb_stats", None) is not None:
+        session._spotifydb_stats = stats
+        return session
+
+    request = session.request
+
+    def instrumented_request(method, url, *args, **kwargs):
+        loader = calling_loader()
+        start = time.perf_counter()
+        try:
+            response = request(method, url, *args, **kwargs)
+        except Exception:
+            session._spotifydb_stats.record(
+                loader, endpoint_name(method, url),
+                time.perf_counter() - start, error=True
+            )
+            raise
+
+        history = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+        rate_limited = sum(1 for h in history if h.status == 429)
+        rate_limited += int(response.status_code == 429)
+
+        session._spotifydb_stats.record(
+            loader,
+            endpoint_name(method, url),
+            time.perf_counter() - start,
+            nbytes=len(response.content),
+            status=response.status_code,
+            retries=len(history),
+            rate_limited=rate_limited,
+        )
+        return response
+
+    session._spotifydb_stats = stats
+    session.request = instrumented_request
+    return session
+
+
+def instrument_spotify(sp, stats):
+    """
+    Count every Web API call made by a spotipy client into stats.
+
+    Example:
+    stats = ApiStats()
+    instrument_spotify(sp, stats)
+    """
+    session = getattr(sp, "_session", None)
+    if session is None or not hasattr(session, "hooks"):
+        raise ValueError("spotipy client must be built with a requests.Session (requests_session=True)")
+
+    instrument_session(session, stats)
+    return sp
@@ -1,4 +1,6 @@
 #!/bin/bash
 cd ~/GitHub/SpotifyDB/
 source ./env/bin/activate
+# one-shot run; for a long-running process that keeps sources fresh use
+# python daemon.py --status-port 8765
 python main.py
@@ -0,0 +1,61 @@
+"""
+Deferred imports for heavy dependencies.
+
+lazy_import("pandas") returns a stand-in for the module at once and only
+imports it on first attribute access, so a code path that never touches
+pandas never pays for it. The stand-in stays local to the importing
+module: sys.modules only ever holds the real module, imported normally
+(and under a lock, so threads racing on first use import it once).
+
+Example:
+from lazy import lazy_import
+pd = lazy_import("pandas")
+"""
+import importlib
+import importlib.util
+import sys
+import threading
+
+
+class LazyModule:
+    """
+    Proxy that imports module `name` on first attribute access.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return LazyModule(name)
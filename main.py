@@ -4,13 +4,14 @@
 # # SpotifyDB Notebook
 # This notebook demonstrates setting up and using the SpotifyDB utilities.
 
-# In[ ]:
+# In[1]:
 
 
 #in powershell
 # %pip install spotipy duckdb python-dotenv pandas
 
 
+
 # ## create cred.py  in the root directory 
 # add your own client id and secrets using the values you have optained from spotify.
 # 
@@ -43,17 +44,25 @@ import duckdb
 import pandas as pd
 
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 
 # custom functions
 import functions as fn
+import features
+import recipes
+import planner
+import snapshots
+import sync
+import transport
+from similarity import SimilarityIndex, more_like_recent_likes
+from instrumentation import ApiStats, instrument_spotify, instrument_session
+import profiling
 
 from IPython.display import display
 
 
 # ## setting up the environment, api, and duckdb
 
-# In[4]:
+# In[ ]:
 
 
 # Load .env
@@ -61,29 +70,34 @@ from IPython.display import display
 
 CLIENT_ID = spotify_client_id
 CLIENT_SECRET = spotify_client_secret
-REDIRECT_URI = "http://127.0.0.1:8000/callback"
-SCOPE = (
-    "user-library-read user-read-recently-played user-top-read user-read-playback-state user-follow-read playlist-read-private playlist-modify-private playlist-modify-public"
-)
+REDIRECT_URI = transport.REDIRECT_URI
+SCOPE = transport.SCOPE
 
 assert CLIENT_ID and CLIENT_SECRET and REDIRECT_URI, "Missing Spotify env vars"
 
-sp = spotipy.Spotify(
-    auth_manager=SpotifyOAuth(
-        client_id=CLIENT_ID,
-        client_secret=CLIENT_SECRET,
-        redirect_uri=REDIRECT_URI,
-        scope=SCOPE,
-        open_browser=True,  # will open auth page in browser
-        cache_path=".cache-spotifydb"  # token cache
+# pooled keep-alive sessions (pool size: SPOTIFYDB_WORKERS);
+# opens the auth page in a browser and caches the token in .cache-spotifydb
+sp = transport.oauth_client(CLIENT_ID, CLIENT_SECRET)
+
+# opt-in stage profiling: SPOTIFYDB_PROFILE=trace.json python main.py
+# (SPOTIFYDB_PROFILE_MEMORY=1 adds tracemalloc, SPOTIFYDB_PROFILE_CPROFILE=1 adds cProfile)
+PROFILE_PATH = os.environ.get("SPOTIFYDB_PROFILE")
+if PROFILE_PATH:
+    profiling.enable(
+        cprofile=bool(os.environ.get("SPOTIFYDB_PROFILE_CPROFILE")),
+        memory=bool(os.environ.get("SPOTIFYDB_PROFILE_MEMORY")),
     )
-)
+
+# count API calls per loader / endpoint for this run
+api_stats = ApiStats()
+instrument_spotify(sp, api_stats)
+instrument_session(transport.musicbrainz_session(), api_stats)
 
 current_user = sp.current_user()
 current_user["display_name"], current_user["id"]
 
 
-# In[5]:
+# In[ ]:
 
 
 # In-memory DB (great for playing around)
@@ -92,6 +106,22 @@ current_user["display_name"], current_user["id"]
 # If you want persistent on-disk:
 con = duckdb.connect(database='spotify.duckdb')
 
+# syncs reuse this client and connection: sync catalog (freshness, row counts
+# and sync cost per table), a background writer thread that owns all table
+# writes, Parquet snapshots under snapshots/ (SPOTIFYDB_SNAPSHOTS, read through
+# the `snapshots` view) and change-only popularity / membership history
+syncer = sync.Syncer(sp, con, api_stats=api_stats)
+
+# optional API budget: refresh the most stale / valuable sources that fit
+# first (see planner.py); get_item then only fetches tables that never synced
+API_BUDGET_CALLS = None
+budgeted = set()
+if API_BUDGET_CALLS is not None:
+    plan = planner.plan_refresh(con, sync.SOURCES, max_calls=API_BUDGET_CALLS)
+    planner.print_plan(plan, API_BUDGET_CALLS)
+    planner.run_plan(syncer, plan, max_calls=API_BUDGET_CALLS)
+    budgeted = set(sync.SOURCES)
+
 
 # In[ ]:
 
@@ -99,6 +129,9 @@ con = duckdb.connect(database='spotify.duckdb')
 df_tables = con.execute(f"SHOW TABLES").df()
 display(df_tables)
 
+df_catalog = con.execute("SELECT * FROM sync_catalog ORDER BY table_name").df()
+display(df_catalog)
+
 
 # ## function wrapper 
 
@@ -108,57 +141,28 @@ display(df_tables)
 def get_item(table_name:str,source_type:str, source_id:str,verbose=True):
     """
     source_type: playlist, album, artist, liked_songs, top_tracks, recently_played
+
+    Refreshes the table if it is older than a day and returns it as a
+    DuckDB relation on con (query it with SQL, see recipes.py).
     """
     global con
-    global sp
-
-    table_age = fn.duckdb_table_age(con, table_name)    
-    print(f"table age: {table_age} days old")
-
-    if table_age is None or table_age > 1.0:
-
-        if source_type == "playlist":
-            items = fn.load_tracks_from_playlist(sp, source_id)
-        elif source_type == "album":
-            items = fn.load_tracks_from_album(sp, source_id)
-        elif source_type == "artist":
-            items = fn.load_tracks_from_artist(sp, source_id)
-        elif source_type == "liked_songs":
-            items = fn.load_my_saved_tracks(sp)
-        elif source_type == "top_tracks":
-            items = fn.load_my_top_tracks(sp)
-        elif source_type == "recently_played":
-            # recently_played tracks 
-            items = fn.load_my_recently_played(sp)
-        # elif source_type == "recently_played_last3M":
-        #     # recently played tracks in the last 3 months
-        #     now = int(time.time() * 1000)
-        #     three_months_ago = now - (90 * 24 * 60 * 60 * 1000)
-        #     items = fn.load_my_recently_played(sp, after=three_months_ago)
-        # elif source_type == "one_year_ago":
-        #     # stuff i haven't played in over a year
-        #     now = int(time.time() * 1000)
-        #     one_year_ago = now - (365 * 24 * 60 * 60 * 1000)
-        #     items = fn.load_my_recently_played(sp, before=one_year_ago)
-        else:
-            raise ValueError(f"Unknown source_type: {source_type}")
-
-        try:
-            fn.df_to_duckdb(con, items, table_name)
-        except Exception as e:
-            print(f"Error saving to DuckDB: {e}")
-    else:
-        items = fn.duckdb_to_df(con, table_name)
+    global syncer
+
+    max_age_days = float("inf") if table_name in budgeted else 1.0
+    result = syncer.sync(table_name, source_type, source_id, max_age_days=max_age_days)
+    print(f"table age: {result.get('age_days')} days old" if result["skipped"]
+          else f"synced {result.get('rows')} rows with {result['api_calls']} API calls")
+
+    # recipes query the table in DuckDB, nothing is read back into pandas
+    items = con.table(table_name)
 
     if verbose:
         display(f"{table_name}: {len(items)} records")
-        display(items.head())
+        display(items.limit(5).df())
 
     return items
 
 
-
-
 # ## geting basic data 
 
 # ### my followed artist 
@@ -166,26 +170,18 @@ def get_item(table_name:str,source_type:str, source_id:str,verbose=True):
 # In[ ]:
 
 
-table_age = fn.duckdb_table_age(con, "followed_artist")
-
-print(f"table age: {table_age} days old")
-
-
-if table_age is None or table_age > 1.0:
-    print("Refreshing followed_artist table...")
+result = syncer.sync("followed_artist", "followed_artists",
+                     max_age_days=float("inf") if "followed_artist" in budgeted else 1.0)
 
-    followed_artist = fn.get_followed_artists_df(sp)
-    display(followed_artist.head())
-
-    print("Loading followed_artist table from DuckDB...")
-    fn.df_to_duckdb(con, followed_artist, "followed_artist")
+if result["skipped"]:
+    print(f"Using followed_artist table from DuckDB ({result['age_days']:.2f} days old).")
 else:
-    followed_artist = fn.duckdb_to_df(con, "followed_artist")
-    print("Loaded followed_artist table from DuckDB.")
+    print(f"Refreshed followed_artist table: {result.get('rows')} artists.")
 
+followed_artist = con.table("followed_artist")
 
 display(f"Followed Artists: {len(followed_artist)} records")
-display(followed_artist.head())
+display(followed_artist.limit(5).df())
 
 
 # ### my liked songs
@@ -196,34 +192,29 @@ display(followed_artist.head())
 my_liked_songs = get_item("my_liked_songs", "liked_songs", None)
 
 
-# ## new_liked_songs
+
+# ### audio features (only for tracks not stored yet)
 
 # In[ ]:
 
 
-new_liked_songs = duckdb.query(
-"""
-select * from my_liked_songs 
-order by saved_at 
-desc limit 100
-"""
-).to_df()
+try:
+    n = features.fill_audio_features(con, features.spotify_source(sp), tables=["my_liked_songs"])
+    print(f"audio features fetched for {n} new tracks")
+except Exception as e:
+    # the endpoint is not available to every app; a precomputed dataset can be used instead
+    print(f"Error fetching audio features: {e}")
 
 
-display(f"new_liked_songs: {len(new_liked_songs)}")
-display(new_liked_songs.head())
+# ## new_liked_songs
 
+# In[ ]:
 
-# let's save this as a Playlist on Spotify
-playlist_id = fn.create_playlist(
-    sp,
-    name="**New Liked Songs",
-    description="My 100 most recently liked songs, updated via Spotify API",
-    public=True,
-    overwrite_if_exists=True
-)
 
-fn.add_tracks_to_playlist(sp, playlist_id, new_liked_songs["uri"].tolist())
+# recipes read their materialized table, updated only for what synced since (materialize.py)
+new_liked_songs = recipes.build_recipe(con, sp, "new_liked_songs")
+
+display(f"new_liked_songs: {len(new_liked_songs)}")
 
 
 # ## cream of crop
@@ -231,28 +222,9 @@ fn.add_tracks_to_playlist(sp, playlist_id, new_liked_songs["uri"].tolist())
 # In[ ]:
 
 
-cream_of_crop = duckdb.query(
-"""
-select * from my_liked_songs 
-order by popularity 
-desc limit 100
-"""
-).to_df()
-
+cream_of_crop = recipes.build_recipe(con, sp, "cream_of_crop")
 
 display(f"cream_of_crop: {len(cream_of_crop)}")
-display(cream_of_crop.head())
-
-# let's save this as a Playlist on Spotify
-playlist_id = fn.create_playlist(
-    sp,
-    name="**Cream of Crop",
-    description="My 100 most popular liked songs, updated via Spotify API",
-    public=True,
-    overwrite_if_exists=True
-)
-
-fn.add_tracks_to_playlist(sp, playlist_id, cream_of_crop["uri"].tolist())
 
 
 # ## discover_these 
@@ -260,7 +232,7 @@ fn.add_tracks_to_playlist(sp, playlist_id, cream_of_crop["uri"].tolist())
 # In[ ]:
 
 
-top_artist = followed_artist.head(10)['artist_id'].to_list()
+top_artist = [row[0] for row in followed_artist.limit(10).project("artist_id").fetchall()]
 
 disc_these = pd.DataFrame()
 for artist_id in top_artist:
@@ -296,106 +268,11 @@ Covers = get_item("Covers", "playlist", "6jfY6NVENX592ZhLizN4HO",verbose=False)
 AI_Covers = get_item("AI_Covers", "playlist", "5xooQuxBYK7ZXN4dhSQ9GL",verbose=False)
 NTS_Covers = get_item("NTS_Covers", "playlist", "53pyL7jy1hbFbttiZZ8g1D",verbose=False)
 
-# sort by popularity
-Covers = Covers.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
-AI_Covers = AI_Covers.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
-NTS_Covers = NTS_Covers.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
-
-# combine, drop duplicates, re-sort
-CoversPP = pd.concat(
-    [
-        Covers.head(60), 
-        AI_Covers.head(60),
-        NTS_Covers.head(20)
-    ], 
-    ignore_index=True
-    )
-CoversPP = CoversPP.drop_duplicates()
-CoversPP = CoversPP.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
+# rank, merge and dedupe inside DuckDB (see recipes.RECIPES["covers_pp"])
+CoversPP = recipes.build_recipe(con, sp, "covers_pp")
 
 display(f"CoversPP: {len(CoversPP)}")
-display(CoversPP.head())
 
-# save the playlist 
-playlist_id = fn.create_playlist(
-    sp,
-    name="**Covers ++",
-    description="Some of the Best Covers from my picks and AI, updated via Spotify API",
-    public=True,
-    overwrite_if_exists=True
-)
-
-fn.add_tracks_to_playlist(sp, playlist_id, CoversPP["uri"].tolist())
-
-
-# #### this is just a more sql way of doing the same thing
-# * similar output
-# 
-# ```python 
-# 
-# 
-# # load some playlists
-# Covers = get_item("Covers", "playlist", "6jfY6NVENX592ZhLizN4HO",verbose=False)
-# AI_Covers = get_item("AI_Covers", "playlist", "5xooQuxBYK7ZXN4dhSQ9GL",verbose=False)
-# NTS_Covers = get_item("NTS_Covers", "playlist", "53pyL7jy1hbFbttiZZ8g1D",verbose=False)
-# 
-# 
-# # display(NTS_Covers.head())
-# 
-# CoversPP = duckdb.query(
-# """
-# 
-# select 
-# distinct * from 
-# (
-# 
-#     select * from 
-#     (
-#         select * from Covers
-#         order by popularity desc 
-#         limit 60
-#     ) A
-# 
-#     union all 
-# 
-#     select * from     
-#     (    
-#         select * from AI_Covers 
-#         order by popularity desc 
-#         limit 60
-#     ) B
-# 
-#     union all
-# 
-#     select * from     
-#     (    
-#         select * from NTS_Covers 
-#         order by popularity desc 
-#         limit 20
-#     ) C
-# 
-# ) D
-# order by popularity 
-# desc limit 150
-# 
-# """
-# ).to_df()
-# 
-# 
-# display(f"CoversPP: {len(CoversPP)}")
-# display(CoversPP.head())
-# 
-# # save the playlist 
-# playlist_id = fn.create_playlist(
-#     sp,
-#     name="**Covers ++",
-#     description="Some of the Best Covers from my picks and AI, updated via Spotify API",
-#     public=True,
-#     overwrite_if_exists=True
-# )
-# 
-# fn.add_tracks_to_playlist(sp, playlist_id, CoversPP["uri"].tolist())
-# ```
 
 # ## forgotten tracks
 
@@ -404,90 +281,81 @@ fn.add_tracks_to_playlist(sp, playlist_id, CoversPP["uri"].tolist())
 
 recently_played = get_item("recently_played", "recently_played", None, verbose=False)
 
-forgotten_tracks = duckdb.query(
-"""
-
-select * from 
-(
-    select 
-    distinct 
-    * from my_liked_songs  mls
-    left join recently_played rp
-    on rp.track_id = mls.track_id
-    where rp.track_id is null
-    order by saved_at asc --saved a long time ago
-    limit 500
-)
-order by random()
-limit 150
+forgotten_tracks = recipes.build_recipe(con, sp, "forgotten_tracks")
 
-"""
-).to_df()
+display(f"forgotten_tracks: {len(forgotten_tracks)}")
 
 
-display(f"forgotten_tracks: {len(forgotten_tracks)}")
-display(forgotten_tracks.head())
+# ## more like my recent likes
+
+# In[ ]:
+
+
+# similarity index over every stored track (cached, only changed tracks are re-featurized)
+similarity_index = SimilarityIndex.build(con, cache_path="similarity.npz")
+print(f"similarity index: {len(similarity_index)} tracks, {similarity_index.updated_rows} updated")
 
-# save the playlist 
+more_like_these = more_like_recent_likes(con, similarity_index, n_seeds=50, k=100)
+
+display(f"more_like_these: {len(more_like_these)}")
+
+# save the playlist
 playlist_id = fn.create_playlist(
     sp,
-    name="**Forgotten Tracks",
-    description="Some of my liked tracks that i haven't listened to in a while, updated via Spotify API",
+    name="**More Like My Recent Likes",
+    description="Stored tracks closest to my 50 newest likes, updated via Spotify API",
     public=True,
     overwrite_if_exists=True
 )
 
-fn.add_tracks_to_playlist(sp, playlist_id, CoversPP["uri"].tolist())
+fn.add_tracks_to_playlist(sp, playlist_id, more_like_these)
 
 
 # ## Mix 182
 
-# In[15]:
+# In[ ]:
 
 
-# # load some playlists
+# # load some artists
 # Blink182 = get_item("Blink182", "artist", "6FBDaR13swtiWwGhX1WQsP",verbose=False)
 # TheParadox = get_item("TheParadox", "artist", "6GhcI55xfZf5vqmmNqYzxW",verbose=False)
 # MagnoliaPark = get_item("MagnoliaPark", "artist", "7B76SsfzG0wWk1WEvGzCmY",verbose=False)
 # Sum41 = get_item("Sum41", "artist", "0qT79UgT5tY4yudH9VfsdT",verbose=False)
 # All_American_Rejects = get_item("All_American_Rejects", "artist", "spotify:artist:3vAaWhdBR38Q02ohXqaNHT",verbose=False)
 
-# dfl = [
-#     Blink182,
-#     TheParadox,
-#     MagnoliaPark,
-#     Sum41,
-#     All_American_Rejects
-# ]
+# # top 30 of each artist by popularity, deduped on ISRC (see recipes.RECIPES["mix_182"])
+# MIX182 = recipes.build_recipe(con, sp, "mix_182")
 
-# for temp_df in dfl:
-#     temp_df = temp_df.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
+# display(f"MIX182: {len(MIX182)}")
 
-# MIX182 = pd.DataFrame()
 
-# for temp_df in dfl:
-#     MIX182 = pd.concat(
-#         [
-#             MIX182,
-#             temp_df.head(30)
-#         ],
-#         ignore_index=True
-#     )
+# flush and stop the background writer
+syncer.close()
 
-# MIX182 = MIX182.drop_duplicates()
-# MIX182 = MIX182.sort_values(by=['popularity'], ascending=False).reset_index(drop=True)
 
-# display(f"MIX182: {len(MIX182)}")
-# display(MIX182.head())
-
-# # save the playlist 
-# playlist_id = fn.create_playlist(
-#     sp,
-#     name="**MIX182",
-#     description="A Mix of Blink-182 and other Bands, updated via Spotify API",
-#     public=True,
-#     overwrite_if_exists=True
-# )
-
-# fn.add_tracks_to_playlist(sp, playlist_id, MIX182["uri"].tolist())
+# ## api call stats
+
+# In[ ]:
+
+
+display(api_stats.by_loader())
+display(api_stats.summary())
+
+# keep per-run stats in DuckDB to compare before/after performance work
+api_stats.to_duckdb(con)
+
+
+# ## profiling (opt-in)
+
+# In[ ]:
+
+
+if PROFILE_PATH:
+    profiler = profiling.disable()
+    display(profiling.summary())
+    profiling.export_chrome_trace(PROFILE_PATH)
+    print(f"Chrome trace written to {PROFILE_PATH}")
+
+    if profiler is not None:
+        profiler.dump_stats(os.path.splitext(PROFILE_PATH)[0] + ".prof")
 
@@ -0,0 +1,266 @@
+"""
+Recipe outputs kept as DuckDB tables (recipe_<name>), refreshed only when
+their source tables have synced since the last build.
+
+recipe_dependencies records the sync_catalog.synced_at of every source
+table a materialization was built from; an unchanged recipe is not
+recomputed at all. Recipes with an "incremental" spec (the top N rows of a
+base query by an ordering) are maintained from the history change feed:
+rows of tracks that joined / left a source or changed popularity since the
+last build are deleted and re-read from the base query restricted to those
+track_ids, so a refresh costs about as much as what changed. History does
+not track other columns, so kept rows may hold stale values (e.g. a
+renamed track) until a full rebuild; one is forced once the last full
+build is older than FULL_REBUILD_AGE.
+
+The table keeps limit + slack rows. After k unchanged rows survive a
+delta, only the top k are known to be exact, so the table is cut back to
+k rows and rebuilt in full once k drops below limit. A full rebuild also
+happens when the history does not cover a source's latest sync (e.g. it
+was written with keep_history=False).
+
+- recipe_materializations(name, built_at, mode, row_count, complete, seconds, full_built_at)
+- recipe_dependencies(name, table_name, synced_at)
+
+Example:
+materialize.refresh_recipe(con, "forgotten_tracks")  # -> {"mode": "incremental", ...}
+materialize.recipe_uris(con, "forgotten_tracks")  # refresh, then read the output
+"""
+import time
+
+import duckdb
+
+import history
+from profiling import span
+from recipes import RECIPES, recipe_sql
+
+
+# seconds after which an incremental recipe is rebuilt in full anyway
+FULL_REBUILD_AGE = 24 * 60 * 60
+
+
+def init_materializations(con):
+    """
+    Create the materialization bookkeeping tables if they do not exist.
+    """
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS recipe_materializations (
+        name TEXT PRIMARY KEY,
+        built_at DOUBLE,
+        mode TEXT,
+        row_count BIGINT,
+        complete BOOLEAN,
+        seconds DOUBLE,
+        full_built_at DOUBLE
+    );
+    """)
+    con.execute("ALTER TABLE recipe_materializations ADD COLUMN IF NOT EXISTS full_built_at DOUBLE;")
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS recipe_dependencies (
+        name TEXT,
+        table_name TEXT,
+        synced_at DOUBLE,
+        PRIMARY KEY (name, table_name)
+    );
+    """)
+
+
+def materialized_table(name):
+    return f"recipe_{name}"
+
+
+def _ordering(spec):
+    # track_id breaks ties, so full and incremental builds agree
+    return f"{spec['order_by']}, track_id"
+
+
+def _depth(spec):
+    return spec["limit"] + spec.get("slack", spec["limit"])
+
+
+def _source_versions(con, tables):
+    """
+    synced_at of each source table in sync_catalog (None when unknown).
+    """
+    versions = dict.fromkeys(tables)
+    try:
+        versions.update(con.execute(f"""
+            SELECT table_name, synced_at FROM sync_catalog
+            WHERE table_name IN ({", ".join("?" for _ in tables)});
+        """, tables).fetchall())
+    except duckdb.CatalogException:
+        pass  # no sync catalog: always rebuilt in full
+    return versions
+
+
+def _history_covers(con, versions):
+    """
+    True when history was recorded after the latest sync of every source.
+    """
+    recorded = dict(con.execute(f"""
+        SELECT table_name, recorded_at FROM history_recorded
+        WHERE table_name IN ({", ".join("?" for _ in versions)});
+    """, list(versions)).fetchall())
+    return all(
+        recorded.get(t) is not None and synced_at is not None and recorded[t] >= synced_at
+        for t, synced_at in versions.items()
+    )
+
+
+def _build_full(con, name, recipe):
+    table = materialized_table(name)
+    spec = recipe.get("incremental")
+    if spec is None:
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS {recipe_sql(con, name)}")
+        return con.execute(f"SELECT count(*) FROM {table}").fetchall()[0][0], True
+
+    depth = _depth(spec)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * FROM ({spec['from']}) AS base
+        ORDER BY {_ordering(spec)}
+        LIMIT {depth}
+    """)
+    rows = con.execute(f"SELECT count(*) FROM {table}").fetchall()[0][0]
+    # fewer rows than asked for: the table holds the whole base query
+    return rows, rows < depth
+
+
+def _apply_delta(con, name, spec, built_at, complete):
+    """
+    Fold the changes since built_at into the materialization.
+    Returns (row count, complete, affected track_ids), or None when too few
+    exact rows are left and a full rebuild is needed.
+    """
+    table = materialized_table(name)
+    changed = history.changed_track_ids(con, spec["tables"], built_at, popularity=True).sql_query()
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _recipe_affected AS {changed}")
+    try:
+        affected = con.execute("SELECT count(*) FROM _recipe_affected").fetchall()[0][0]
+        if affected == 0:
+            rows = con.execute(f"SELECT count(*) FROM {table}").fetchall()[0][0]
+            return rows, complete, 0
+
+        kept = con.execute(f"""
+            SELECT count(*) FROM {table}
+            WHERE track_id NOT IN (SELECT track_id FROM _recipe_affected);
+        """).fetchall()[0][0]
+
+        # unchanged rows outside the table rank below every kept row,
+        # so only the top `kept` rows of the candidates are known to be exact
+        if complete:
+            cap = _depth(spec)
+        elif kept >= spec["limit"]:
+            cap = kept
+        else:
+            return None
+
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {table} AS
+            SELECT * FROM (
+                SELECT * FROM {table}
+                WHERE track_id NOT IN (SELECT track_id FROM _recipe_affected)
+                UNION ALL BY NAME
+                SELECT * FROM ({spec['from']}) AS base
+                WHERE track_id IN (SELECT track_id FROM _recipe_affected)
+            )
+            ORDER BY {_ordering(spec)}
+            LIMIT {cap}
+        """)
+        rows = con.execute(f"SELECT count(*) FROM {table}").fetchall()[0][0]
+        return rows, complete and rows < cap, affected
+    finally:
+        con.execute("DROP TABLE IF EXISTS _recipe_affected;")
+
+
+def refresh_recipe(con, name, force=False, full_rebuild_age=FULL_REBUILD_AGE):
+    """
+    Bring recipe_<name> up to date with its source tables.
+    Returns a dict with mode "fresh" (nothing synced since the last build),
+    "incremental" or "full", the row count and the seconds it took.
+    A refresh is full when the last full build is older than full_rebuild_age.
+    """
+    init_materializations(con)
+    history.init_history(con)
+    recipe = RECIPES[name]
+    table = materialized_table(name)
+    start = time.perf_counter()
+
+    versions = _source_versions(con, recipe["tables"])
+    previous = con.execute("""
+        SELECT built_at, row_count, complete, full_built_at FROM recipe_materializations WHERE name = ?;
+    """, [name]).fetchall()
+    built = dict(con.execute("""
+        SELECT table_name, synced_at FROM recipe_dependencies WHERE name = ?;
+    """, [name]).fetchall())
+    exists = con.execute("""
+        SELECT count(*) FROM information_schema.tables
+        WHERE table_schema = current_schema() AND table_name = ?;
+    """, [table]).fetchall()[0][0] > 0
+
+    known = previous and exists and None not in versions.values()
+    if known and not force and built == versions:
+        return {"name": name, "mode": "fresh", "rows": previous[0][1], "seconds": time.perf_counter() - start}
+
+    spec = recipe.get("incremental")
+    result = {"name": name}
+    built_at = time.time()
+
+    with span("materialize", recipe=name):
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            delta = None
+            recent = known and previous[0][3] is not None and built_at - previous[0][3] < full_rebuild_age
+            if recent and not force and spec is not None and _history_covers(con, versions):
+                delta = _apply_delta(con, name, {**spec, "tables": recipe["tables"]},
+                                     previous[0][0], previous[0][2])
+            if delta is None:
+                rows, complete = _build_full(con, name, recipe)
+                result["mode"] = "full"
+                full_built_at = built_at
+            else:
+                rows, complete, result["affected"] = delta
+                result["mode"] = "incremental"
+                full_built_at = previous[0][3]
+
+            seconds = time.perf_counter() - start
+            con.execute("""
+                INSERT INTO recipe_materializations VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    built_at = excluded.built_at, mode = excluded.mode, row_count = excluded.row_count,
+                    complete = excluded.complete, seconds = excluded.seconds,
+                    full_built_at = excluded.full_built_at;
+            """, [name, built_at, result["mode"], rows, complete, seconds, full_built_at])
+            con.execute("DELETE FROM recipe_dependencies WHERE name = ?;", [name])
+            con.executemany("INSERT INTO recipe_dependencies VALUES (?, ?, ?);",
+                            [[name, t, synced_at] for t, synced_at in versions.items()])
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+
+    result.update(rows=rows, seconds=seconds)
+    return result
+
+
+def output_sql(name):
+    """
+    SQL reading a recipe's playlist from its materialized table.
+    """
+    table = materialized_table(name)
+    spec = RECIPES[name].get("incremental")
+    if spec is None:
+        return f"SELECT * FROM {table}"
+
+    top = f"SELECT * FROM {table} ORDER BY {_ordering(spec)} LIMIT {spec['limit']}"
+    if spec.get("sample"):
+        return f"SELECT * FROM ({top}) AS top USING SAMPLE reservoir({int(spec['sample'])} ROWS)"
+    return top
+
+
+def recipe_uris(con, name):
+    """
+    Refresh the materialization if needed and return its playlist URIs.
+    """
+    refresh_recipe(con, name)
+    return [row[0] for row in con.execute(f"SELECT uri FROM ({output_sql(name)}) AS recipe").fetchall()]
@@ -0,0 +1,101 @@
+"""
+Merge several ranked track sources into one playlist ranking.
+
+Each source contributes its top `quota` tracks (ranked by order_by).
+Duplicates across sources are detected on a hashed integer key:
+the ISRC when present, otherwise the track_id. So the same recording
+on two releases, or the same track in two playlists, counts once.
+The copy from the best-ranked position wins.
+
+Example:
+df = merge_ranked_sources([(covers, 60), (ai_covers, 60), (nts_covers, 20)], limit=150)
+sql = merge_sources_sql(con, [("Covers", 60), ("AI_Covers", 60), ("NTS_Covers", 20)], limit=150)
+"""
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+def dedupe_keys(df):
+    """
+    Return a uint64 key per row: hash of the ISRC, falling back to track_id.
+    """
+    if "isrc" in df.columns:
+        values = df["isrc"].where(df["isrc"].notna() & (df["isrc"] != ""), df["track_id"])
+    else:
+        values = df["track_id"]
+    return pd.util.hash_array(values.astype(str).to_numpy(object))
+
+
+def merge_ranked_sources(sources, order_by="popularity", ascending=False, limit=None):
+    """
+    Merge (DataFrame, quota) pairs in one vectorized pass.
+
+    Within each source rows are ranked by order_by and cut at quota;
+    duplicates (by dedupe_keys) keep the best-ranked copy, with earlier
+    sources winning ties; the result is sorted by order_by.
+
+    Example:
+    mix = merge_ranked_sources([(blink182, 30), (sum41, 30)], limit=150)
+    """
+    frames = []
+    for source_rank, (df, quota) in enumerate(sources):
+        if df is None or df.empty:
+            continue
+        # track_id breaks ties so pandas and DuckDB pick the same rows
+        top = df.sort_values([order_by, "track_id"], ascending=[ascending, True], kind="stable").head(quota)
+        frames.append(top.assign(_source_rank=source_rank, _pos=np.arange(len(top))))
+
+    if not frames:
+        return pd.DataFrame()
+
+    merged = pd.concat(frames, ignore_index=True)
+    merged["_key"] = dedupe_keys(merged)
+
+    merged = merged.sort_values(
+        [order_by, "_source_rank", "_pos"],
+        ascending=[ascending, True, True],
+        kind="stable",
+    )
+    merged = merged.drop_duplicates(subset="_key", keep="first")
+
+    merged = merged.drop(columns=["_source_rank", "_pos", "_key"]).reset_index(drop=True)
+    return merged.head(limit) if limit else merged
+
+
+def merge_sources_sql(con, sources, order_by="popularity", ascending=False, limit=None):
+    """
+    Build the same merge as a DuckDB window query over tables on con.
+    Tables without an isrc column are keyed on track_id.
+
+    Example:
+    uris = fn.duckdb_query_uris(con, merge_sources_sql(con, [("Covers", 60), ("AI_Covers", 60)]))
+    """
+    direction = "ASC" if ascending else "DESC"
+
+    branches = []
+    for source_rank, (table_name, quota) in enumerate(sources):
+        has_isrc = con.execute("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ? AND column_name = 'isrc';
+        """, [table_name]).fetchone()[0]
+        key = "coalesce(nullif(isrc, ''), track_id)" if has_isrc else "track_id"
+
+        branches.append(f"""
+            SELECT *, {source_rank} AS _source_rank,
+                   row_number() OVER (ORDER BY {order_by} {direction}, track_id) AS _pos,
+                   hash({key}) AS _key
+            FROM {table_name}
+            QUALIFY _pos <= {int(quota)}
+        """)
+
+    union = "\nUNION ALL BY NAME\n".join(f"({b})" for b in branches)
+
+    return f"""
+        SELECT * EXCLUDE (_source_rank, _pos, _key)
+        FROM ({union})
+        QUALIFY row_number() OVER (PARTITION BY _key ORDER BY {order_by} {direction}, _source_rank, _pos) = 1
+        ORDER BY {order_by} {direction}, _source_rank, _pos
+        {f"LIMIT {int(limit)}" if limit else ""}
+    """
@@ -0,0 +1,210 @@
+"""
+API budget planner: decide which sources to refresh when calls or time are capped.
+
+Each source's refresh cost (API calls ~ pages, bytes, seconds) is estimated
+from its recent syncs in sync_log, or from DEFAULT_COSTS when it has never
+been synced. Sources are scored by value x staleness (age / refresh
+interval; never-synced sources count as NEVER_SYNCED_STALENESS) and taken
+greedily, most important first, while they fit the budget. Only sources
+that are due (staleness >= 1) are considered.
+
+Planning only reads the sync catalog, so a dry run needs DuckDB alone.
+
+Example:
+plan = plan_refresh(con, sync.SOURCES, max_calls=50)
+print_plan(plan)                          # dry run
+run_plan(syncer, plan, max_calls=50)      # refresh the selected sources
+"""
+import time
+
+
+# seconds between refreshes of each source (the sync daemon's schedule too)
+DEFAULT_INTERVALS = {
+    "recently_played": 5 * 60,
+    "my_liked_songs": 60 * 60,
+    "Covers": 6 * 60 * 60,
+    "AI_Covers": 6 * 60 * 60,
+    "NTS_Covers": 6 * 60 * 60,
+    "followed_artist": 24 * 60 * 60,
+}
+DEFAULT_INTERVAL = 24 * 60 * 60
+
+# relative importance of keeping each source fresh (default 1.0)
+SOURCE_VALUE = {
+    "my_liked_songs": 2.0,
+    "recently_played": 2.0,
+}
+
+# first-sync cost guesses per source_type: (API calls, bytes)
+DEFAULT_COSTS = {
+    "recently_played": (1, 60_000),
+    "top_tracks": (1, 60_000),
+    "followed_artists": (2, 40_000),
+    "playlist": (5, 300_000),
+    "album": (15, 150_000),
+    "artist": (10, 600_000),
+    "liked_songs": (20, 1_200_000),
+}
+DEFAULT_SECONDS_PER_CALL = 0.3
+
+NEVER_SYNCED_STALENESS = 10.0
+
+# how many recent syncs of a table the estimate looks at
+COST_HISTORY = 5
+
+
+def estimate_costs(con, history=COST_HISTORY):
+    """
+    Median cost of each table's last `history` syncs in sync_log.
+    Returns table_name -> {"calls", "bytes", "seconds", "rows", "syncs"} and
+    the overall seconds per API call (None without history).
+    """
+    tables = {row[0] for row in con.execute("SHOW TABLES").fetchall()}
+    if "sync_log" not in tables:
+        return {}, None
+
+    # no bound parameters: binding one makes DuckDB import numpy
+    rows = con.execute(f"""
+        SELECT table_name,
+               median(api_calls),
+               median(bytes_transferred),
+               median(fetch_seconds + coalesce(write_seconds, 0)),
+               arg_max(row_count, synced_at),
+               count(*)
+        FROM (
+            SELECT *, row_number() OVER (PARTITION BY table_name ORDER BY synced_at DESC) AS n
+            FROM sync_log
+            WHERE api_calls IS NOT NULL
+        )
+        WHERE n <= {int(history)}
+        GROUP BY table_name;
+    """).fetchall()
+
+    seconds_per_call = con.execute("""
+        SELECT sum(fetch_seconds + coalesce(write_seconds, 0)) / nullif(sum(api_calls), 0)
+        FROM sync_log
+        WHERE api_calls IS NOT NULL;
+    """).fetchall()[0][0]
+
+    costs = {
+        table_name: {"calls": calls, "bytes": nbytes, "seconds": seconds, "rows": row_count, "syncs": syncs}
+        for table_name, calls, nbytes, seconds, row_count, syncs in rows
+    }
+    return costs, seconds_per_call
+
+
+def plan_refresh(con, sources, max_calls=None, max_seconds=None, intervals=None, values=None):
+    """
+    Rank sources (table_name -> (source_type, source_id)) and select the
+    ones to refresh within max_calls and/or max_seconds (None = no cap).
+
+    Returns one dict per source, selected ones first in refresh order, each
+    with its score, estimated cost and the reason it was (not) selected.
+    """
+    intervals = {**DEFAULT_INTERVALS, **(intervals or {})}
+    values = {**SOURCE_VALUE, **(values or {})}
+    costs, seconds_per_call = estimate_costs(con)
+    seconds_per_call = seconds_per_call or DEFAULT_SECONDS_PER_CALL
+
+    tables = {row[0] for row in con.execute("SHOW TABLES").fetchall()}
+    synced_at = {}
+    if "sync_catalog" in tables:
+        synced_at = dict(con.execute("SELECT table_name, synced_at FROM sync_catalog;").fetchall())
+
+    now = time.time()
+    plan = []
+    for table_name, (source_type, source_id) in sources.items():
+        interval = intervals.get(table_name, DEFAULT_INTERVAL)
+        last = synced_at.get(table_name)
+        age = None if last is None else now - last
+        staleness = NEVER_SYNCED_STALENESS if age is None else age / interval
+        value = values.get(table_name, 1.0)
+
+        cost = costs.get(table_name)
+        if cost is None:
+            calls, nbytes = DEFAULT_COSTS.get(source_type, (10, 500_000))
+            cost = {"calls": calls, "bytes": nbytes, "seconds": calls * seconds_per_call}
+            estimate = "default"
+        else:
+            estimate = f"{cost['syncs']} syncs"
+
+        plan.append({
+            "table_name": table_name,
+            "source_type": source_type,
+            "source_id": source_id,
+            "age_days": None if age is None else age / 86400,
+            "staleness": staleness,
+            "value": value,
+            "score": value * staleness,
+            "calls": cost["calls"] or 0,
+            "bytes": cost["bytes"] or 0,
+            "seconds": cost["seconds"] or 0.0,
+            "estimate": estimate,
+            "selected": False,
+            "reason": None,
+        })
+
+    calls_left = float("inf") if max_calls is None else max_calls
+    seconds_left = float("inf") if max_seconds is None else max_seconds
+
+    # most important first; a source that does not fit leaves room for cheaper ones
+    for item in sorted(plan, key=lambda i: -i["score"]):
+        if item["staleness"] < 1:
+            item["reason"] = "fresh"
+        elif item["calls"] > calls_left or item["seconds"] > seconds_left:
+            item["reason"] = "over budget"
+        else:
+            item["selected"] = True
+            item["reason"] = "due"
+            calls_left -= item["calls"]
+            seconds_left -= item["seconds"]
+
+    plan.sort(key=lambda i: (not i["selected"], -i["score"]))
+    return plan
+
+
+def run_plan(syncer, plan, max_calls=None, max_seconds=None):
+    """
+    Refresh the selected sources in plan order with syncer. A source is
+    skipped when the calls / seconds actually spent so far leave too little
+    budget for its estimate. Returns Syncer.sync's result per source run.
+    """
+    calls_used = 0
+    start = time.perf_counter()
+    results = []
+
+    for item in plan:
+        if not item["selected"]:
+            continue
+        if max_calls is not None and calls_used + item["calls"] > max_calls:
+            item["reason"] = "budget spent"
+            continue
+        if max_seconds is not None and time.perf_counter() - start + item["seconds"] > max_seconds:
+            item["reason"] = "budget spent"
+            continue
+
+        result = syncer.sync(item["table_name"], item["source_type"], item["source_id"], max_age_days=0)
+        calls_used += result.get("api_calls") or 0
+        results.append(result)
+
+    return results
+
+
+def print_plan(plan, max_calls=None, max_seconds=None):
+    """
+    Print the plan as a table, with the selected sources' total estimate.
+    """
+    print(f"{'table':<24}{'age (days)':>12}{'stale':>8}{'value':>7}{'score':>8}"
+          f"{'calls':>7}{'KB':>9}{'secs':>7}  {'estimate':<10}decision")
+    for item in plan:
+        age = "never" if item["age_days"] is None else f"{item['age_days']:.2f}"
+        print(f"{item['table_name']:<24}{age:>12}{item['staleness']:>8.1f}{item['value']:>7.1f}"
+              f"{item['score']:>8.1f}{item['calls']:>7.0f}{item['bytes'] / 1024:>9.0f}"
+              f"{item['seconds']:>7.1f}  {item['estimate']:<10}{'refresh' if item['selected'] else item['reason']}")
+
+    selected = [i for i in plan if i["selected"]]
+    budget = ", ".join(
+        f"{label} {cap}" for label, cap in (("max calls", max_calls), ("max seconds", max_seconds)) if cap is not None
+    ) or "no budget"
+    print(f"{len(selected)} of {len(plan)} sources: ~{sum(i['calls'] for i in selected):.0f} calls, "
+          f"~{sum(i['seconds'] for i in selected):.1f}s ({budget})")
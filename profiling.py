@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+import functools
+
+# Opt-in timing spans for the sync pipeline (fetch, normalize, frame build,
+# DuckDB write). Disabled by default: span() then returns a shared no-op
+# context manager and traced() functions call straight through.
+
+_enabled = False
+_memory = False
+_profiler = None
+_events = []
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start", "mem_start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if _memory:
+            import tracemalloc
+            self.mem_start = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        if _memory:
+            import tracemalloc
+            self.args["mem_delta_kb"] = round((tracemalloc.get_traced_memory()[0] - self.mem_start) / 1024, 1)
+
+        with _lock:
+            _events.append((self.name, self.start, end, threading.get_ident(), self.args))
+        return False
+
+
+def span(name, **args):
+    """
+    Time a block as a named span (nests naturally).
+
+    Example:
+    with span("fetch", endpoint="playlist_items"):
+        data = sp.playlist_items(playlist_id)
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name=None):
+    """
+    Decorator form of span(); the span name defaults to the function name.
+
+    Example:
+    @traced("normalize")
+    def normalize_track_item(track, source_type, source_id): ...
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(label, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable(cprofile=False, memory=False):
+    """
+    Start recording spans. Optionally run cProfile (calling thread only)
+    and tracemalloc (adds mem_delta_kb to every span).
+
+    Example:
+    profiling.enable(memory=True)
+    """
+    global _enabled, _memory, _profiler
+
+    if memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory = True
+
+    if cprofile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+    _enabled = True
+
+
+def disable():
+    """
+    Stop recording. Recorded spans are kept until reset().
+    Returns the cProfile.Profile if one was running, otherwise None.
+    """
+    global _enabled, _memory, _profiler
+
+    _enabled = False
+
+    if _memory:
+        import tracemalloc
+        tracemalloc.stop()
+        _memory = False
+
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.disable()
+    return profiler
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _events.clear()
+
+
+def events():
+    """
+    Return recorded spans as a list of dicts (times in ms since import).
+    """
+    with _lock:
+        recorded = list(_events)
+
+    return [
+        {
+            "name": name,
+            "start_ms": (start - _origin) * 1000,
+            "duration_ms": (end - start) * 1000,
+            "thread_id": tid,
+            **args,
+        }
+        for name, start, end, tid, args in recorded
+    ]
+
+
+def summary():
+    """
+    Return total time per span name as a pandas DataFrame.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(events(), columns=["name", "start_ms", "duration_ms", "thread_id"])
+    return (
+        df.groupby("name")["duration_ms"]
+        .agg(["count", "sum", "mean", "max"])
+        .rename(columns={"sum": "total_ms", "mean": "avg_ms", "max": "max_ms"})
+        .sort_values("total_ms", ascending=False)
+        .reset_index()
+    )
+
+
+def export_chrome_trace(path):
+    """
+    Write recorded spans as Chrome trace JSON (open in chrome://tracing or Perfetto).
+
+    Example:
+    profiling.export_chrome_trace("trace.json")
+    """
+    pid = os.getpid()
+
+    with _lock:
+        recorded = list(_events)
+
+    trace = {
+        "traceEvents": [
+            {
+                "name": name,
+                "cat": "spotifydb",
+                "ph": "X",
+                "ts": (start - _origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, end, tid, args in recorded
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+    with open(path, "w") as f:
+        json.dump(trace, f, default=str)
+
+    return path
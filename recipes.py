@@ -0,0 +1,140 @@
+"""
+Playlist recipes, run as SQL directly against the persistent DuckDB connection.
+
+Each recipe names the source tables it reads, the SQL that ranks its
+tracks (a string, or a function of con that builds it), and the Spotify
+playlist it is saved to. A recipe whose full query is costly and that is
+the top `limit` rows of a base query can also give it as "incremental",
+so materialize.py maintains its output table from the changes since the
+last build. Cheap top-N recipes are simply rebuilt.
+
+Example:
+uris = build_recipe(con, sp, "cream_of_crop")
+"""
+import functions as fn
+from merge import merge_sources_sql
+
+
+RECIPES = {
+    "new_liked_songs": {
+        "tables": ["my_liked_songs"],
+        "playlist": "**New Liked Songs",
+        "description": "My 100 most recently liked songs, updated via Spotify API",
+        "sql": """
+            select * from my_liked_songs
+            order by saved_at desc, track_id
+            limit 100
+        """,
+    },
+    "cream_of_crop": {
+        "tables": ["my_liked_songs"],
+        "playlist": "**Cream of Crop",
+        "description": "My 100 most popular liked songs, updated via Spotify API",
+        "sql": """
+            select * from my_liked_songs
+            order by popularity desc, track_id
+            limit 100
+        """,
+    },
+    "covers_pp": {
+        "tables": ["Covers", "AI_Covers", "NTS_Covers"],
+        "playlist": "**Covers ++",
+        "description": "Some of the Best Covers from my picks and AI, updated via Spotify API",
+        # top 60/60/20 by popularity, deduped on ISRC / track_id
+        "sql": lambda con: merge_sources_sql(
+            con,
+            [("Covers", 60), ("AI_Covers", 60), ("NTS_Covers", 20)],
+            limit=150,
+        ),
+    },
+    "mix_182": {
+        "tables": ["Blink182", "TheParadox", "MagnoliaPark", "Sum41", "All_American_Rejects"],
+        "playlist": "**MIX182",
+        "description": "A Mix of Blink-182 and other Bands, updated via Spotify API",
+        "sql": lambda con: merge_sources_sql(
+            con,
+            [(t, 30) for t in RECIPES["mix_182"]["tables"]],
+        ),
+    },
+    "forgotten_tracks": {
+        "tables": ["my_liked_songs", "recently_played"],
+        "playlist": "**Forgotten Tracks",
+        "description": "Some of my liked tracks that i haven't listened to in a while, updated via Spotify API",
+        "sql": """
+            select * from
+            (
+                select distinct mls.* from my_liked_songs mls
+                left join recently_played rp
+                on rp.track_id = mls.track_id
+                where rp.track_id is null
+                order by saved_at asc, mls.track_id --saved a long time ago
+                limit 500
+            ) as forgotten
+            using sample reservoir(150 rows)
+        """,
+        # the 500 oldest unplayed likes, 150 of them sampled per build
+        # (an anti join never repeats a liked row, so no distinct)
+        "incremental": {
+            "from": """
+                select mls.* from my_liked_songs mls
+                anti join recently_played rp
+                on rp.track_id = mls.track_id
+            """,
+            "order_by": "saved_at asc",
+            "limit": 500,
+            "sample": 150,
+        },
+    },
+}
+
+
+def recipe_sql(con, name):
+    """
+    Return the SQL for a recipe, building it from con if needed.
+    """
+    sql = RECIPES[name]["sql"]
+    return sql(con) if callable(sql) else sql
+
+
+def recipe_uris(con, name):
+    """
+    Return the track URIs a recipe selects, computed inside DuckDB.
+    """
+    return fn.duckdb_query_uris(con, recipe_sql(con, name))
+
+
+def recipe_arrow(con, name):
+    """
+    Return a recipe's full result as a pyarrow.Table (for inspection).
+    """
+    return fn.duckdb_query_arrow(con, recipe_sql(con, name))
+
+
+def build_recipe(con, sp, name, public=True, materialized=True):
+    """
+    Run a recipe and save it as a Spotify playlist (overwriting the old one).
+    Returns the URI list that was written.
+
+    With materialized=True the output comes from the recipe's table, which
+    is only updated for what changed since the last build (materialize.py).
+
+    Example:
+    uris = build_recipe(con, sp, "new_liked_songs")
+    """
+    recipe = RECIPES[name]
+    if materialized:
+        import materialize
+        uris = materialize.recipe_uris(con, name)
+    else:
+        uris = recipe_uris(con, name)
+
+    playlist_id = fn.create_playlist(
+        sp,
+        name=recipe["playlist"],
+        description=recipe["description"],
+        public=public,
+        overwrite_if_exists=True
+    )
+    fn.add_tracks_to_playlist(sp, playlist_id, uris)
+
+    return uris
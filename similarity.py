@@ -0,0 +1,410 @@
+"""
+Vectorized track similarity over every track in the synced source tables.
+
+Each track becomes one L2-normalised float32 row built from popularity,
+duration, explicit, hashed artist ids, hashed artist genres (from
+followed_artist) and audio features where available. Similarity is a
+dot product, so top-k for a batch of queries is one matrix multiply
+plus argpartition.
+
+The index is cached on disk (.npz) and rebuilt incrementally: only
+tracks that are new or whose inputs changed (per-row hash computed in
+DuckDB) are re-featurized.
+
+Example:
+index = SimilarityIndex.build(con, cache_path="similarity.npz")
+uris = more_like_recent_likes(con, index, k=100)
+"""
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from profiling import span
+
+
+ARTIST_DIM = 64
+GENRE_DIM = 32
+
+AUDIO_COLUMNS = [
+    "danceability", "energy", "speechiness", "acousticness",
+    "instrumentalness", "liveness", "valence", "tempo", "loudness",
+]
+
+# block weights (applied before the row is normalised)
+WEIGHTS = {
+    "popularity": 1.0,
+    "duration": 0.5,
+    "explicit": 0.5,
+    "artist": 2.0,
+    "genre": 1.5,
+    "audio": 1.5,
+}
+
+CACHE_VERSION = 1
+
+
+def _base_tables(con):
+    """
+    Base tables (not views) in the current schema.
+    """
+    rows = con.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_catalog = current_database() AND table_schema = current_schema()
+          AND table_type = 'BASE TABLE';
+    """).fetchall()
+    return {row[0] for row in rows}
+
+
+def track_tables(con):
+    """
+    Return the synced source tables (listed in sync_catalog) on con that
+    are track tables (have track_id, uri, popularity and duration_ms).
+    Snapshot views, recipe outputs and other schemas are not sources.
+    """
+    if "sync_catalog" not in _base_tables(con):
+        return []
+    rows = con.execute("""
+        SELECT c.table_name FROM information_schema.columns c
+        JOIN information_schema.tables t USING (table_catalog, table_schema, table_name)
+        WHERE c.table_catalog = current_database() AND c.table_schema = current_schema()
+          AND t.table_type = 'BASE TABLE'
+          AND c.column_name IN ('track_id', 'uri', 'popularity', 'duration_ms')
+          AND c.table_name IN (SELECT table_name FROM sync_catalog)
+        GROUP BY c.table_name
+        HAVING count(*) = 4
+        ORDER BY c.table_name;
+    """).fetchall()
+    return [row[0] for row in rows]
+
+
+def _table_columns(con, table_name):
+    rows = con.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_catalog = current_database() AND table_schema = current_schema()
+          AND table_name = ?;
+    """, [table_name]).fetchall()
+    return {row[0] for row in rows}
+
+
+def _inputs_sql(con, tables):
+    """
+    SQL yielding one row per track_id with every feature input and a row hash.
+    """
+    selects = []
+    for t in tables:
+        cols = _table_columns(con, t)
+        artists = "artist_ids" if "artist_ids" in cols else "artist_id" if "artist_id" in cols else "NULL"
+        explicit = "explicit" if "explicit" in cols else "NULL"
+        selects.append(f"""
+            SELECT track_id, uri, popularity, duration_ms,
+                   CAST({explicit} AS BOOLEAN) AS explicit,
+                   CAST({artists} AS TEXT) AS artist_ids
+            FROM {t}
+        """)
+
+    tracks = f"""
+        SELECT track_id,
+               any_value(uri) AS uri,
+               max(popularity) AS popularity,
+               any_value(duration_ms) AS duration_ms,
+               bool_or(explicit) AS explicit,
+               max(artist_ids) AS artist_ids
+        FROM ({' UNION ALL '.join(selects)})
+        WHERE track_id IS NOT NULL
+        GROUP BY track_id
+    """
+
+    existing = _base_tables(con)
+
+    genre_join, genre_col = "", "NULL::TEXT AS genres"
+    if "followed_artist" in existing:
+        genre_join = """
+            LEFT JOIN (SELECT artist_id, any_value(genres) AS genres FROM followed_artist GROUP BY artist_id) fa
+            ON fa.artist_id = split_part(t.artist_ids, ', ', 1)
+        """
+        genre_col = "fa.genres"
+
+    audio_join = ""
+    audio_cols = ", ".join(f"NULL::DOUBLE AS {c}" for c in AUDIO_COLUMNS)
+    if "audio_features" in existing:
+        audio_join = "LEFT JOIN audio_features af ON af.track_id = t.track_id AND af.found"
+        audio_cols = ", ".join(f"af.{c}" for c in AUDIO_COLUMNS)
+
+    inputs = f"""
+        SELECT t.*, {genre_col}, {audio_cols}
+        FROM ({tracks}) t
+        {genre_join}
+        {audio_join}
+    """
+
+    return f"""
+        SELECT *, hash(popularity, duration_ms, explicit, artist_ids, genres,
+                       {', '.join(AUDIO_COLUMNS)}) AS row_hash
+        FROM ({inputs})
+    """
+
+
+def _hashed(values, dim):
+    """
+    Feature-hash comma separated tokens into a (len(values), dim) matrix.
+    """
+    out = np.zeros((len(values), dim), dtype=np.float32)
+    for i, value in enumerate(values):
+        if not isinstance(value, str) or not value:
+            continue
+        tokens = [tok.strip() for tok in value.split(",") if tok.strip()]
+        for tok in tokens:
+            h = zlib.crc32(tok.encode())
+            out[i, h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+        out[i] /= np.sqrt(len(tokens))
+    return out
+
+
+def featurize(df):
+    """
+    Turn feature inputs (one row per track) into L2-normalised float32 rows.
+    Uses fixed scalings only, so a row never depends on the other rows.
+    """
+    n = len(df)
+
+    popularity = df["popularity"].fillna(0).to_numpy(np.float32)[:, None] / 100
+    duration = np.log(df["duration_ms"].fillna(210_000).clip(lower=1_000).to_numpy(np.float32))
+    duration = np.clip((duration - np.log(210_000)) / 0.35, -3, 3)[:, None] / 3
+    explicit = df["explicit"].fillna(False).to_numpy(np.float32)[:, None]
+
+    audio = np.zeros((n, len(AUDIO_COLUMNS) + 1), dtype=np.float32)
+    values = df[AUDIO_COLUMNS].to_numpy(np.float64)
+    has_audio = ~np.isnan(values).any(axis=1)
+    values = np.nan_to_num(values, nan=0.0)
+    values[:, AUDIO_COLUMNS.index("tempo")] /= 200
+    values[:, AUDIO_COLUMNS.index("loudness")] = (values[:, AUDIO_COLUMNS.index("loudness")] + 60) / 60
+    audio[has_audio, :-1] = values[has_audio]
+    audio[has_audio, -1] = 1.0
+
+    blocks = [
+        WEIGHTS["popularity"] * popularity,
+        WEIGHTS["duration"] * duration,
+        WEIGHTS["explicit"] * explicit,
+        WEIGHTS["artist"] * _hashed(df["artist_ids"].tolist(), ARTIST_DIM),
+        WEIGHTS["genre"] * _hashed(df["genres"].tolist(), GENRE_DIM),
+        WEIGHTS["audio"] * audio / np.sqrt(len(AUDIO_COLUMNS)),
+    ]
+    matrix = np.hstack(blocks).astype(np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class SimilarityIndex:
+    """
+    Feature matrix over stored tracks with batched top-k queries.
+    Build with SimilarityIndex.build(con, ...).
+    """
+
+    def __init__(self, track_ids, uris, row_hash, matrix):
+        self.track_ids = np.asarray(track_ids, dtype=object)
+        self.uris = np.asarray(uris, dtype=object)
+        self.row_hash = np.asarray(row_hash, dtype=np.uint64)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._rows = {t: i for i, t in enumerate(self.track_ids)}
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    @classmethod
+    def build(cls, con, tables=None, cache_path=None):
+        """
+        Build (or incrementally refresh) the index from DuckDB track tables.
+        tables defaults to track_tables(con) (the synced source tables).
+
+        Example:
+        index = SimilarityIndex.build(con, cache_path="similarity.npz")
+        """
+        tables = tables or track_tables(con)
+        if not tables:
+            # nothing synced yet: there is no union to select from
+            index = cls.empty()
+            index.updated_rows = 0
+            return index
+        inputs = _inputs_sql(con, tables)
+
+        with span("similarity_build", tables=len(tables)):
+            current = con.execute(f"SELECT track_id, row_hash FROM ({inputs})").df()
+
+            cached = cls.load(cache_path) if cache_path and os.path.exists(cache_path) else None
+            if cached is not None:
+                old = pd.DataFrame({"track_id": cached.track_ids, "old_hash": cached.row_hash, "row": np.arange(len(cached))})
+                merged = current.merge(old, on="track_id", how="left")
+                stale = merged["old_hash"].isna() | (merged["old_hash"] != merged["row_hash"])
+                todo = merged.loc[stale, "track_id"].tolist()
+            else:
+                merged = None
+                todo = current["track_id"].tolist()
+
+            fresh = None
+            if todo:
+                con.register("_todo_ids", pd.DataFrame({"track_id": todo}))
+                fresh = con.execute(f"""
+                    SELECT i.* FROM ({inputs}) i SEMI JOIN _todo_ids USING (track_id)
+                """).df()
+                con.unregister("_todo_ids")
+
+            parts_ids, parts_uris, parts_hash, parts_matrix = [], [], [], []
+
+            if merged is not None:
+                keep = merged[~stale]
+                rows = keep["row"].astype(int).to_numpy()
+                parts_ids.append(cached.track_ids[rows])
+                parts_uris.append(cached.uris[rows])
+                parts_hash.append(cached.row_hash[rows])
+                parts_matrix.append(cached.matrix[rows])
+
+            if fresh is not None and len(fresh):
+                parts_ids.append(fresh["track_id"].to_numpy(object))
+                parts_uris.append(fresh["uri"].to_numpy(object))
+                parts_hash.append(fresh["row_hash"].to_numpy(np.uint64))
+                parts_matrix.append(featurize(fresh))
+
+            if parts_matrix:
+                index = cls(
+                    np.concatenate(parts_ids),
+                    np.concatenate(parts_uris),
+                    np.concatenate(parts_hash),
+                    np.vstack(parts_matrix),
+                )
+            else:
+                index = cls.empty()
+
+        index.updated_rows = len(todo)
+
+        if cache_path:
+            index.save(cache_path)
+
+        return index
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], np.zeros((0, 3 + ARTIST_DIM + GENRE_DIM + len(AUDIO_COLUMNS) + 1), np.float32))
+
+    def save(self, path):
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            version=CACHE_VERSION,
+            track_ids=self.track_ids.astype(str),
+            uris=self.uris.astype(str),
+            row_hash=self.row_hash,
+            matrix=self.matrix,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a cached index; returns None if the cache is from another version.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != CACHE_VERSION:
+                return None
+            return cls(data["track_ids"].astype(object), data["uris"].astype(object),
+                       data["row_hash"], data["matrix"])
+
+    def rows(self, track_ids):
+        return np.array([self._rows[t] for t in track_ids if t in self._rows], dtype=np.int64)
+
+    def _exclude_mask(self, exclude_ids):
+        if not exclude_ids:
+            return None
+        rows = self.rows(exclude_ids)
+        return rows if len(rows) else None
+
+    def top_k(self, queries, k=10, exclude_ids=None, batch_size=1024):
+        """
+        Batched nearest neighbours for query vectors (n, dim).
+        Returns (rows, scores), both shaped (n, k), best first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self))
+        if k <= 0 or not len(queries):
+            return np.zeros((len(queries), max(k, 0)), np.int64), np.zeros((len(queries), max(k, 0)), np.float32)
+        exclude = self._exclude_mask(exclude_ids)
+
+        all_rows, all_scores = [], []
+        for i in range(0, len(queries), batch_size):
+            scores = queries[i:i + batch_size] @ self.matrix.T
+            if exclude is not None:
+                scores[:, exclude] = -np.inf
+
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            part_scores = np.take_along_axis(scores, part, axis=1)
+            order = np.argsort(-part_scores, axis=1)
+            all_rows.append(np.take_along_axis(part, order, axis=1))
+            all_scores.append(np.take_along_axis(part_scores, order, axis=1))
+
+        return np.vstack(all_rows), np.vstack(all_scores)
+
+    def neighbours(self, track_ids, k=10, exclude_self=True):
+        """
+        Top-k similar tracks for each track id, as a DataFrame
+        (query_id, track_id, uri, score, rank).
+        """
+        rows = self.rows(track_ids)
+        found, scores = self.top_k(self.matrix[rows], k=k + int(exclude_self))
+
+        out = []
+        for query_row, hits, hit_scores in zip(rows, found, scores):
+            rank = 0
+            for row, score in zip(hits, hit_scores):
+                if exclude_self and row == query_row:
+                    continue
+                if rank == k:
+                    break
+                out.append((self.track_ids[query_row], self.track_ids[row], self.uris[row], float(score), rank))
+                rank += 1
+
+        return pd.DataFrame(out, columns=["query_id", "track_id", "uri", "score", "rank"])
+
+    def recommend(self, seed_ids, k=100, exclude_ids=None):
+        """
+        Top-k tracks closest to the centroid of seed_ids (seeds excluded).
+        Returns a DataFrame (track_id, uri, score).
+        """
+        rows = self.rows(seed_ids)
+        if not len(rows):
+            return pd.DataFrame(columns=["track_id", "uri", "score"])
+
+        centroid = self.matrix[rows].mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm:
+            centroid /= norm
+
+        exclude = list(seed_ids) + list(exclude_ids or [])
+        found, scores = self.top_k(centroid, k=k, exclude_ids=exclude)
+        found, scores = found[0], scores[0]
+        keep = np.isfinite(scores)
+
+        return pd.DataFrame({
+            "track_id": self.track_ids[found[keep]],
+            "uri": self.uris[found[keep]],
+            "score": scores[keep],
+        })
+
+
+def more_like_recent_likes(con, index, n_seeds=50, k=100):
+    """
+    URIs of stored tracks most similar to the n_seeds most recently liked
+    songs, excluding anything already liked.
+
+    Example:
+    uris = more_like_recent_likes(con, index)
+    """
+    seeds = [row[0] for row in con.execute(f"""
+        SELECT track_id FROM my_liked_songs ORDER BY saved_at DESC LIMIT {int(n_seeds)}
+    """).fetchall()]
+    liked = [row[0] for row in con.execute("SELECT track_id FROM my_liked_songs").fetchall()]
+
+    with span("similarity_query", seeds=len(seeds), k=k):
+        return index.recommend(seeds, k=k, exclude_ids=liked)["uri"].tolist()
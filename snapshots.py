@@ -0,0 +1,133 @@
+"""
+Parquet snapshot store for source syncs.
+
+Each sync written is appended as one zstd-compressed Parquet file under a
+Hive-partitioned tree (sync.Syncer writes one per table per day):
+
+    snapshots/source=<table_name>/snapshot_date=<YYYY-MM-DD>/sync_<uuid>.parquet
+
+Each row carries the partition columns plus synced_at (epoch seconds),
+so several syncs on one day are kept apart. The `snapshots` view reads
+the tree lazily; filters on source and snapshot_date only open the
+matching files. The tree is plain Parquet, so it can be archived or
+copied to another host and read there with the same view.
+
+Example:
+snapshots.write_snapshot(con, "my_liked_songs")
+snapshots.create_snapshot_view(con)
+con.sql("SELECT * FROM snapshots WHERE source = 'my_liked_songs' AND snapshot_date >= DATE '2026-01-01'")
+liked_then = snapshots.snapshot_at(con, "my_liked_songs", "2026-03-01")
+"""
+import os
+import glob
+import datetime
+from urllib.parse import unquote
+
+from profiling import span
+
+
+SNAPSHOT_ROOT = os.environ.get("SPOTIFYDB_SNAPSHOTS", "snapshots")
+
+
+def _quote(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def write_snapshot(con, table_name, root=SNAPSHOT_ROOT, snapshot_date=None):
+    """
+    Append the current contents of table_name to the snapshot tree.
+    Returns the number of rows written.
+
+    Example:
+    write_snapshot(con, "Covers")
+    """
+    snapshot_date = snapshot_date or datetime.date.today()
+    rows = con.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+    # COPY creates the partition directories but not a missing root's parents
+    os.makedirs(root, exist_ok=True)
+
+    with span("snapshot_write", table=table_name, rows=rows):
+        con.execute(f"""
+            COPY (
+                SELECT *, ? AS source, CAST(? AS DATE) AS snapshot_date, epoch(now()) AS synced_at
+                FROM {table_name}
+            )
+            TO {_quote(root)} (
+                FORMAT parquet,
+                COMPRESSION zstd,
+                PARTITION_BY (source, snapshot_date),
+                OVERWRITE_OR_IGNORE,
+                FILENAME_PATTERN 'sync_{{uuid}}'
+            );
+        """, [table_name, str(snapshot_date)])
+
+    return rows
+
+
+def has_snapshots(root=SNAPSHOT_ROOT):
+    return bool(glob.glob(os.path.join(root, "source=*", "snapshot_date=*", "*.parquet")))
+
+
+def create_snapshot_view(con, root=SNAPSHOT_ROOT, view_name="snapshots"):
+    """
+    Create (or replace) a view over every snapshot under root.
+    Sources with different columns are unioned by name.
+    Returns False when there are no snapshots yet.
+    """
+    if not has_snapshots(root):
+        return False
+
+    pattern = os.path.join(root, "source=*", "snapshot_date=*", "*.parquet")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {view_name} AS
+        SELECT * FROM read_parquet(
+            {_quote(pattern)},
+            hive_partitioning = true,
+            hive_types = {{'source': VARCHAR, 'snapshot_date': DATE}},
+            union_by_name = true
+        );
+    """)
+    return True
+
+
+def snapshot_dates(table_name, root=SNAPSHOT_ROOT):
+    """
+    Return the sorted dates with snapshots of table_name, from the
+    directory names alone.
+    """
+    dates = []
+    for source_dir in glob.glob(os.path.join(root, "source=*")):
+        if unquote(os.path.basename(source_dir).split("=", 1)[1]) != table_name:
+            continue
+        for date_dir in glob.glob(os.path.join(source_dir, "snapshot_date=*")):
+            dates.append((datetime.date.fromisoformat(date_dir.rsplit("=", 1)[1]), date_dir))
+    return sorted(dates)
+
+
+def has_snapshot(table_name, day, root=SNAPSHOT_ROOT):
+    """
+    True when table_name has a snapshot dated `day`.
+    """
+    return any(d == day for d, _ in snapshot_dates(table_name, root))
+
+
+def snapshot_at(con, table_name, day, root=SNAPSHOT_ROOT):
+    """
+    Return the last sync of table_name on or before `day` as a DuckDB
+    relation with the source's own columns, or None when there is none.
+    Only that day's files are read.
+
+    Example:
+    liked = snapshot_at(con, "my_liked_songs", "2026-03-01")
+    """
+    day = datetime.date.fromisoformat(str(day))
+    dates = [d for d in snapshot_dates(table_name, root) if d[0] <= day]
+    if not dates:
+        return None
+
+    pattern = os.path.join(dates[-1][1], "*.parquet")
+    return con.sql(f"""
+        SELECT * EXCLUDE (synced_at)
+        FROM read_parquet({_quote(pattern)}, hive_partitioning = false, union_by_name = true)
+        QUALIFY synced_at = max(synced_at) OVER ()
+    """)
@@ -0,0 +1,250 @@
+"""
+Source sync: fetch one source and persist it (table, catalog, snapshot,
+history) on a warm Spotify client, DuckDB connection and writer.
+
+Used by main.get_item, the sync daemon and the command line.
+
+recently_played is fetched from the cursor of its last sync and appended
+to its table (plays older than RECENT_PLAYS_DAYS are dropped), and each
+table gets at most one Parquet snapshot a day, so polling it every few
+minutes neither refetches nor re-snapshots the same plays.
+
+Example:
+syncer = Syncer(sp, con)
+syncer.sync("my_liked_songs", "liked_songs")
+syncer.sync("Covers", "playlist", "6jfY6NVENX592ZhLizN4HO", max_age_days=0)
+syncer.close()
+"""
+import time
+import datetime
+
+import functions as fn
+import history
+import snapshots
+from instrumentation import ApiStats, instrument_spotify
+from profiling import span
+
+
+# the sources main.py keeps: table_name -> (source_type, source_id)
+SOURCES = {
+    "followed_artist": ("followed_artists", None),
+    "my_liked_songs": ("liked_songs", None),
+    "recently_played": ("recently_played", None),
+    "Covers": ("playlist", "6jfY6NVENX592ZhLizN4HO"),
+    "AI_Covers": ("playlist", "5xooQuxBYK7ZXN4dhSQ9GL"),
+    "NTS_Covers": ("playlist", "53pyL7jy1hbFbttiZZ8g1D"),
+}
+
+# loaders that can hand pages to the writer while fetching
+STREAMED = {"playlist", "liked_songs"}
+
+# loaders that fetch only what is new since the cursor of the last sync;
+# their rows are appended to the table
+APPENDED = {"recently_played"}
+
+# days of plays kept in an appended recently_played table
+RECENT_PLAYS_DAYS = 90
+
+
+def load_source(sp, source_type, source_id=None, on_page=None, after=None):
+    """
+    Run the loader for a source_type. Paged loaders (STREAMED) pass pages
+    to on_page when given and return a row count; the rest return a DataFrame.
+    APPENDED loaders only fetch items after the cursor `after`.
+    """
+    if source_type == "playlist":
+        return fn.load_tracks_from_playlist(sp, source_id, on_page=on_page)
+    elif source_type == "album":
+        return fn.load_tracks_from_album(sp, source_id)
+    elif source_type == "artist":
+        return fn.load_tracks_from_artist(sp, source_id)
+    elif source_type == "liked_songs":
+        return fn.load_my_saved_tracks(sp, on_page=on_page)
+    elif source_type == "top_tracks":
+        return fn.load_my_top_tracks(sp)
+    elif source_type == "recently_played":
+        return fn.load_my_recently_played(sp, after=after)
+    elif source_type == "followed_artists":
+        return fn.get_followed_artists_df(sp)
+    # elif source_type == "recently_played_last3M":
+    #     # recently played tracks in the last 3 months
+    #     now = int(time.time() * 1000)
+    #     three_months_ago = now - (90 * 24 * 60 * 60 * 1000)
+    #     return fn.load_my_recently_played(sp, after=three_months_ago)
+    # elif source_type == "one_year_ago":
+    #     # stuff i haven't played in over a year
+    #     now = int(time.time() * 1000)
+    #     one_year_ago = now - (365 * 24 * 60 * 60 * 1000)
+    #     return fn.load_my_recently_played(sp, before=one_year_ago)
+    raise ValueError(f"Unknown source_type: {source_type}")
+
+
+class Syncer:
+    """
+    Refreshes source tables, reusing one client, connection and writer.
+
+    sync_catalog is read once, on first use; the Syncer keeps its copy up
+    to date with its own syncs instead of querying it per table.
+    """
+
+    def __init__(self, sp, con, api_stats=None, writer=None,
+                 snapshot_root=snapshots.SNAPSHOT_ROOT, keep_history=True):
+        self.sp = sp
+        self.con = con
+        if api_stats is None:
+            api_stats = ApiStats()
+            instrument_spotify(sp, api_stats)
+        self.api_stats = api_stats
+        if writer is None:
+            # imported here so that reading SOURCES does not load pandas
+            from writer import DuckDBWriter
+            writer = DuckDBWriter(con)
+        self.writer = writer
+        self.snapshot_root = snapshot_root
+        self.keep_history = keep_history
+        self._catalog = None
+
+        fn.duckdb_init_catalog(con)
+        if keep_history:
+            history.init_history(con)
+        self.has_snapshot_view = snapshots.create_snapshot_view(con, snapshot_root)
+
+    def table_exists(self, table_name):
+        return self.con.execute("""
+            SELECT count(*) FROM information_schema.tables
+            WHERE table_schema = current_schema() AND table_name = ?;
+        """, [table_name]).fetchone()[0] > 0
+
+    @property
+    def catalog(self):
+        """
+        table_name -> sync_catalog row, read with one query on first use.
+        """
+        if self._catalog is None:
+            self._catalog = fn.duckdb_sync_catalog(self.con)
+        return self._catalog
+
+    def table_age(self, table_name):
+        # from synced_at, so a long-lived Syncer's cached rows do not age out
+        row = self.catalog.get(table_name)
+        if row is None or row["synced_at"] is None:
+            return None
+        return (time.time() - row["synced_at"]) / 86400
+
+    def cursor(self, table_name):
+        """
+        The cursor recorded by table_name's last sync, or None.
+        """
+        return (self.catalog.get(table_name) or {}).get("cursor")
+
+    def _synced(self, table_name, rows, sync_stats, attrs):
+        # what the writer just recorded in sync_catalog
+        row = dict.fromkeys(fn.SYNC_CATALOG_COLUMNS)
+        row.update(sync_stats, table_name=table_name, synced_at=time.time(), row_count=rows)
+        for key in ("snapshot_id", "etag", "cursor"):
+            if key in attrs:
+                row[key] = attrs[key]
+        self.catalog[table_name] = row
+
+    def append_plays(self, table_name, plays, cursor, keep_days=RECENT_PLAYS_DAYS):
+        """
+        Return table_name's stored plays of the last keep_days days plus
+        the new ones (deduped on played_at, track_id), newest first,
+        carrying the new cursor (or the old one when nothing was played).
+        """
+        import duckdb
+        import pandas as pd
+
+        frames = [plays]
+        if cursor is not None:
+            try:
+                frames.insert(0, self.con.execute(f"SELECT * FROM {table_name}").df())
+            except duckdb.CatalogException:
+                pass  # the table was dropped since its last sync
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            merged = plays
+        else:
+            merged = pd.concat(frames, ignore_index=True).drop_duplicates(["played_at", "track_id"])
+            played_at = pd.to_datetime(merged["played_at"], utc=True, format="ISO8601")
+            cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=keep_days)
+            merged = merged[played_at >= cutoff].sort_values("played_at", ascending=False, ignore_index=True)
+
+        merged.attrs["cursor"] = plays.attrs.get("cursor", cursor)
+        return merged
+
+    def snapshot_due(self, table_name):
+        # one snapshot per table per day: recently_played is polled every
+        # few minutes, which would otherwise add ~288 files a day
+        return not snapshots.has_snapshot(table_name, datetime.date.today(), self.snapshot_root)
+
+    def sync(self, table_name, source_type, source_id=None, max_age_days=1.0):
+        """
+        Refresh table_name if it is older than max_age_days (0 = always).
+        Returns a dict describing the sync, with skipped=True when the
+        table was fresh and error set when the write failed.
+        """
+        with span("source", table=table_name, source_type=source_type):
+            table_age = self.table_age(table_name)
+            if table_age is not None and table_age <= max_age_days:
+                return {"table_name": table_name, "skipped": True, "age_days": table_age}
+
+            fetch_start = time.perf_counter()
+            calls_before = self.api_stats.totals()
+
+            streamed = source_type in STREAMED
+            appended = source_type in APPENDED
+            cursor = self.cursor(table_name) if appended else None
+            try:
+                items = load_source(
+                    self.sp, source_type, source_id,
+                    on_page=self.writer.chunk_callback(table_name) if streamed else None,
+                    after=cursor,
+                )
+            except Exception:
+                if streamed:
+                    self.writer.discard(table_name)
+                raise
+
+            calls_after = self.api_stats.totals()
+            sync_stats = dict(
+                fetch_seconds=time.perf_counter() - fetch_start,
+                api_calls=calls_after["calls"] - calls_before["calls"],
+                bytes_transferred=calls_after["bytes"] - calls_before["bytes"],
+            )
+            result = {"table_name": table_name, "skipped": False, **sync_stats}
+            if appended:
+                result["new_rows"] = len(items)
+                items = self.append_plays(table_name, items, cursor)
+
+            try:
+                if streamed:
+                    result["rows"] = self.writer.finish(table_name, **sync_stats).result()
+                else:
+                    result["rows"] = self.writer.write(table_name, items, **sync_stats).result()
+                if not result["rows"] and not self.table_exists(table_name):
+                    # nothing fetched and no table yet (e.g. no liked songs):
+                    # the writer recorded no sync, so there is nothing to keep
+                    return result
+                self._synced(table_name, result["rows"], sync_stats, {} if streamed else items.attrs)
+
+                if self.snapshot_due(table_name):
+                    snapshots.write_snapshot(self.con, table_name, self.snapshot_root)
+                    self.has_snapshot_view = self.has_snapshot_view or \
+                        snapshots.create_snapshot_view(self.con, self.snapshot_root)
+                if self.keep_history and source_type != "followed_artists":
+                    result["history"] = history.record_history(self.con, table_name)
+            except Exception as e:
+                print(f"Error saving to DuckDB: {e}")
+                result["error"] = str(e)
+                if not streamed:
+                    # keep the fresh rows queryable for this run
+                    self.con.register(table_name, items)
+
+        return result
+
+    def close(self):
+        """
+        Flush and stop the writer.
+        """
+        self.writer.close()
@@ -0,0 +1,286 @@
+"""
+Compact in-memory track store for code that keeps several sources in memory.
+
+Holds the same rows as functions.normalize_track_item, but column-wise:
+
+- TrackPool keeps one entry per distinct track_id (name, album, artists,
+  duration, ...) in typed arrays and plain lists; album and
+  artist strings are dictionary-encoded, so each is stored once.
+- TrackStore is one list of rows: a 4-byte track index plus source codes
+  per row, pointing into a (shareable) TrackPool.
+- The uri is derived from track_id on demand, never stored.
+
+Stores that share a TrackPool hold a track seen in several sources once.
+Popularity is per track, so the most recently added known value wins.
+
+The sync path (sync.Syncer, the daemon) streams pages to DuckDB and keeps
+no rows in memory, so it does not use this; benchmark.py compares its
+retained memory with list-of-dicts rows.
+
+Example:
+pool = TrackPool()
+liked = TrackStore(pool).extend(tracks, "saved", "user")
+covers = TrackStore(pool).extend(playlist_tracks, "playlist", covers_id)
+df = liked.to_frame()
+"""
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+class StringPool:
+    """
+    Dictionary-encoded strings: value <-> int code, one copy per value.
+    Code 0 is None.
+    """
+    __slots__ = ("_codes", "values")
+
+    def __init__(self):
+        self._codes = {}
+        self.values = [None]
+
+    def encode(self, value):
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class TrackPool:
+    """
+    One row per distinct track, shared by any number of TrackStores.
+    """
+
+    def __init__(self):
+        self._index = {}                    # track_id -> row
+        self.track_id = []
+        self.name = []
+        self.isrc = []
+        self.preview_url = []
+        self.popularity = array("b")        # -1 = unknown
+        self.duration_ms = array("I")
+        self.explicit = array("b")
+
+        self.album_id = array("I")
+        self.album_name = array("I")
+        self.artist_name = array("I")
+        self.artist_ids = array("I")
+
+        self.albums = StringPool()          # album ids and names
+        self.artists = StringPool()         # joined artist names and ids
+        self.sources = StringPool()         # source_type / source_id
+
+    def __len__(self):
+        return len(self.track_id)
+
+    def add(self, row):
+        """
+        Add (or refresh the popularity of) a track from a normalized row.
+        Returns its row index.
+        """
+        popularity = row.get("popularity")
+        popularity = -1 if popularity is None or popularity != popularity else int(popularity)
+
+        track_id = row["track_id"]
+        i = self._index.get(track_id)
+        if i is not None:
+            # a source without popularity (e.g. a simplified track) keeps the known one
+            if popularity >= 0:
+                self.popularity[i] = popularity
+            return i
+
+        i = len(self.track_id)
+        self._index[track_id] = i
+        self.track_id.append(track_id)
+        self.name.append(row.get("name"))
+        self.isrc.append(row.get("isrc") or None)
+        self.preview_url.append(row.get("preview_url") or None)
+        self.popularity.append(popularity)
+        self.duration_ms.append(int(row.get("duration_ms") or 0))
+        self.explicit.append(1 if row.get("explicit") else 0)
+
+        self.album_id.append(self.albums.encode(row.get("album_id")))
+        self.album_name.append(self.albums.encode(row.get("album_name")))
+        self.artist_name.append(self.artists.encode(row.get("artist_name")))
+        self.artist_ids.append(self.artists.encode(row.get("artist_ids")))
+        return i
+
+
+class TrackRecord:
+    """
+    Read-only view of one row of a TrackStore.
+    """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    def __getattr__(self, name):
+        return self._store.value(name, self._i)
+
+    def __repr__(self):
+        return f"TrackRecord({self.track_id!r}, {self.name!r})"
+
+    def to_dict(self):
+        return {c: self._store.value(c, self._i) for c in TrackStore.COLUMNS}
+
+
+class TrackStore:
+    """
+    Ordered rows (source, track) backed by a TrackPool.
+    """
+
+    COLUMNS = [
+        "source_type", "source_id", "track_id", "name", "album_name",
+        "album_id", "artist_name", "artist_ids", "popularity", "duration_ms",
+        "explicit", "preview_url", "uri", "isrc",
+    ]
+
+    # pool column -> StringPool it is encoded in
+    _ENCODED = {
+        "album_id": "albums",
+        "album_name": "albums",
+        "artist_name": "artists",
+        "artist_ids": "artists",
+    }
+
+    def __init__(self, pool=None):
+        self.pool = pool or TrackPool()
+        self._track = array("I")
+        self._source_type = array("I")
+        self._source_id = array("I")
+
+    def __len__(self):
+        return len(self._track)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return TrackRecord(self, i)
+
+    def __iter__(self):
+        return (TrackRecord(self, i) for i in range(len(self)))
+
+    def value(self, column, i):
+        pool = self.pool
+        if column == "source_type":
+            return pool.sources.values[self._source_type[i]]
+        if column == "source_id":
+            return pool.sources.values[self._source_id[i]]
+        if column == "uri":
+            return f"spotify:track:{pool.track_id[self._track[i]]}"
+
+        t = self._track[i]
+        if column in self._ENCODED:
+            return getattr(pool, self._ENCODED[column]).values[getattr(pool, column)[t]]
+        if column == "popularity":
+            return None if pool.popularity[t] < 0 else pool.popularity[t]
+        if column == "explicit":
+            return bool(pool.explicit[t])
+        if column in ("track_id", "name", "isrc", "preview_url", "duration_ms"):
+            return getattr(pool, column)[t]
+        raise AttributeError(column)
+
+    def append(self, row):
+        """
+        Append one row shaped like normalize_track_item's output.
+        """
+        self._track.append(self.pool.add(row))
+        self._source_type.append(self.pool.sources.encode(row.get("source_type")))
+        self._source_id.append(self.pool.sources.encode(row.get("source_id")))
+
+    def extend(self, tracks, source_type, source_id):
+        """
+        Append Spotify track objects from one source. Returns self.
+        """
+        for track in tracks:
+            if not track or not track.get("id"):
+                continue
+            artists = track["artists"]
+            self.append({
+                "source_type": source_type,
+                "source_id": source_id,
+                "track_id": track["id"],
+                "name": track["name"],
+                "album_name": track["album"]["name"],
+                "album_id": track["album"]["id"],
+                "artist_name": ", ".join(a["name"] for a in artists),
+                "artist_ids": ", ".join(a["id"] for a in artists),
+                "popularity": track.get("popularity"),
+                "duration_ms": track["duration_ms"],
+                "explicit": track["explicit"],
+                "preview_url": track.get("preview_url"),
+                "isrc": (track.get("external_ids") or {}).get("isrc"),
+            })
+        return self
+
+    # loader column -> normalize_track_item column (load_my_saved_tracks)
+    _RENAMED = {
+        "track_name": "name",
+        "artist_id": "artist_ids",
+    }
+
+    @classmethod
+    def from_frame(cls, df, pool=None, source_type=None, source_id=None):
+        """
+        Build a store from a loader's DataFrame. Missing values (NaN) are
+        stored as None; source_type / source_id fill in for frames
+        without those columns (e.g. load_my_saved_tracks).
+        """
+        store = cls(pool)
+        df = df.rename(columns={k: v for k, v in cls._RENAMED.items() if v not in df.columns})
+        df = df.astype(object).where(df.notna(), None)
+        for row in df.to_dict("records"):
+            row.setdefault("source_type", source_type)
+            row.setdefault("source_id", source_id)
+            store.append(row)
+        return store
+
+    def to_frame(self, include_uri=True):
+        """
+        Return a DataFrame in normalize_track_item's column order.
+        Album, artist and source columns are Categoricals over the pool.
+        """
+        pool = self.pool
+        t = np.frombuffer(self._track, dtype=np.uint32) if len(self) else np.zeros(0, dtype=np.uint32)
+
+        def categorical(codes, string_pool):
+            codes = np.asarray(codes, dtype=np.int64)
+            return pd.Categorical.from_codes(codes - 1, categories=pd.Index(string_pool.values[1:], dtype=object))
+
+        def gather(values):
+            return np.asarray(values, dtype=object)[t] if len(values) else np.array([], dtype=object)
+
+        popularity = np.asarray(pool.popularity, dtype=np.int16)[t]
+
+        data = {
+            "source_type": categorical(self._source_type, pool.sources),
+            "source_id": categorical(self._source_id, pool.sources),
+            "track_id": gather(pool.track_id),
+            "name": gather(pool.name),
+            "album_name": categorical(np.asarray(pool.album_name)[t], pool.albums),
+            "album_id": categorical(np.asarray(pool.album_id)[t], pool.albums),
+            "artist_name": categorical(np.asarray(pool.artist_name)[t], pool.artists),
+            "artist_ids": categorical(np.asarray(pool.artist_ids)[t], pool.artists),
+            "popularity": pd.array(np.where(popularity < 0, None, popularity), dtype="Int16"),
+            "duration_ms": np.asarray(pool.duration_ms, dtype=np.int64)[t],
+            "explicit": np.asarray(pool.explicit, dtype=bool)[t],
+            "preview_url": gather(pool.preview_url),
+            "isrc": gather(pool.isrc),
+        }
+
+        df = pd.DataFrame(data)
+        if include_uri:
+            df["uri"] = "spotify:track:" + df["track_id"]
+        return df[[c for c in self.COLUMNS if c in df.columns]]
@@ -0,0 +1,182 @@
+"""
+Shared HTTP transport for every outbound call (Spotify Web API and MusicBrainz).
+
+Sessions keep connections alive, size their pools to the worker count,
+ask for gzip, apply default timeouts and retry transient errors.
+
+Example:
+sp = spotify_client(auth_manager=SpotifyOAuth(...))
+sp = oauth_client()                   # SpotifyDB scopes, credentials from env / cred.py
+fn.get_genre_tags("Adele", "Hello")   # uses musicbrainz_session()
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_WORKERS = int(os.environ.get("SPOTIFYDB_WORKERS", 8))
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 20)
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# methods safe to resend after a read error or any RETRY_STATUS response
+IDEMPOTENT_METHODS = frozenset(["GET", "PUT", "DELETE"])
+
+USER_AGENT = "SpotifyDB/1.0 ( https://github.com/jgarza9788/SpotifyDB )"
+
+REDIRECT_URI = "http://127.0.0.1:8000/callback"
+SCOPE = (
+    "user-library-read user-read-recently-played user-top-read user-read-playback-state user-follow-read playlist-read-private playlist-modify-private playlist-modify-public"
+)
+
+_musicbrainz = None
+_musicbrainz_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout when the caller passes none.
+    """
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class SafeRetry(Retry):
+    """
+    Retry that resends a POST only when the server cannot have acted on it:
+    connection errors and 429 (rejected before processing). A POST that
+    timed out or got a 5xx may have been applied, e.g. tracks already added.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST" and status_code == 429:
+            return super().is_retry("GET", status_code, has_retry_after)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def make_session(workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, retries=3,
+                 backoff_factor=0.3, headers=None):
+    """
+    Build a keep-alive requests.Session with a connection pool of `workers`
+    connections per host, gzip, default timeouts and transient-error retries
+    (429s honour Retry-After). GET/PUT/DELETE are retried on any transient
+    error, POST only on connection errors and 429s (see SafeRetry).
+
+    Example:
+    session = make_session(workers=16)
+    session.get("https://musicbrainz.org/ws/2/...")
+    """
+    retry = SafeRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout,
+        pool_connections=max(4, workers),
+        pool_maxsize=max(1, workers),
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+        "User-Agent": USER_AGENT,
+    })
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+def spotify_client(auth_manager=None, auth=None, workers=DEFAULT_WORKERS,
+                   timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Build a spotipy client on a pooled keep-alive session.
+
+    Example:
+    sp = spotify_client(auth_manager=SpotifyOAuth(scope="user-library-read"))
+    """
+    import spotipy
+
+    return spotipy.Spotify(
+        auth=auth,
+        auth_manager=auth_manager,
+        requests_session=make_session(workers=workers, timeout=timeout),
+        requests_timeout=timeout,
+        **kwargs
+    )
+
+
+def spotify_credentials():
+    """
+    Return (client_id, client_secret) from SPOTIPY_CLIENT_ID /
+    SPOTIPY_CLIENT_SECRET, falling back to cred.py.
+    """
+    client_id = os.environ.get("SPOTIPY_CLIENT_ID")
+    client_secret = os.environ.get("SPOTIPY_CLIENT_SECRET")
+    if client_id and client_secret:
+        return client_id, client_secret
+
+    from cred import spotify_client_id, spotify_client_secret
+    return spotify_client_id, spotify_client_secret
+
+
+def oauth_client(client_id=None, client_secret=None, cache_path=".cache-spotifydb", open_browser=True):
+    """
+    Spotify client with the SpotifyDB scopes on pooled keep-alive sessions.
+    Credentials default to spotify_credentials().
+
+    Example:
+    sp = oauth_client(open_browser=False)
+    """
+    from spotipy.oauth2 import SpotifyOAuth
+
+    if not (client_id and client_secret):
+        client_id, client_secret = spotify_credentials()
+
+    return spotify_client(
+        auth_manager=SpotifyOAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=REDIRECT_URI,
+            scope=SCOPE,
+            open_browser=open_browser,
+            cache_path=cache_path,
+            requests_session=make_session(workers=1),
+        )
+    )
+
+
+def musicbrainz_session():
+    """
+    Return the process-wide MusicBrainz session (created on first use).
+    """
+    global _musicbrainz
+
+    with _musicbrainz_lock:
+        if _musicbrainz is None:
+            _musicbrainz = make_session(headers={"Accept": "application/json"})
+        return _musicbrainz
@@ -0,0 +1,353 @@
+"""
+Background DuckDB writer: one thread owns a cursor on the database and
+persists DataFrame chunks from a bounded queue while loaders keep fetching.
+
+- write_chunk() blocks once max_pending chunks are queued (backpressure),
+  so memory stays bounded however far fetching runs ahead.
+- Chunks (DataFrames, or pages of row dicts from a loader's on_page) are
+  buffered per table up to stage_rows and staged in temp
+  tables; finish() swaps the staged rows into the real table in one
+  transaction (readers never see a half-written table) and updates the
+  sync catalog.
+- Staging only touches temp tables; the swaps of every finish() already
+  queued (up to group_size) are committed together in one transaction.
+  If that transaction fails, each table in the group is retried on its
+  own, so one bad table does not fail the others.
+- A finish() with no rows still empties the table (e.g. an emptied playlist).
+  With no table to empty, nothing is created and no sync is recorded, so
+  the source is not marked fresh without a table behind it.
+- If the writer thread dies, pending and later finish() Futures raise.
+
+Once a finish() Future resolves, new statements on con see the table.
+(A relation bound on top of a still-open result, e.g. after a bare
+con.execute(...).fetchone(), keeps the older snapshot.)
+
+Example:
+with DuckDBWriter(con) as writer:
+    fn.load_my_saved_tracks(sp, on_page=writer.chunk_callback("my_liked_songs"))
+    writer.finish("my_liked_songs", api_calls=42).result()
+    writer.write("followed_artist", followed_df)  # whole frame, returns a Future
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+import pandas as pd
+
+import functions as fn
+from profiling import span
+
+
+class DuckDBWriter:
+
+    def __init__(self, con, max_pending=8, stage_rows=5000, group_size=16):
+        self._con = con.cursor()
+        # cursors start in main; write where con is (e.g. a per-account schema)
+        database, schema = con.execute("SELECT current_database(), current_schema()").fetchall()[0]
+        self._con.execute(f'USE "{database}"."{schema}";')
+        # swaps record into the catalog inside a transaction, where creating it would be too late
+        fn.duckdb_init_catalog(self._con)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.stage_rows = stage_rows
+        self.group_size = group_size
+
+        self._buffers = {}      # table_name -> [DataFrame]
+        self._stages = {}       # table_name -> [temp table name]
+        self._rows = {}         # table_name -> rows written
+        self._seconds = {}      # table_name -> time spent writing
+        self._errors = {}       # table_name -> staging error
+        self._n_stages = 0
+        self._died = None       # exception that stopped the writer thread
+        self._inflight = []     # finishes being committed
+
+        self._thread = threading.Thread(target=self._run, name="duckdb-writer", daemon=True)
+        self._thread.start()
+
+    # ---- producer side (any thread) ----
+
+    def write_chunk(self, table_name, rows):
+        """
+        Queue a chunk for table_name: a DataFrame or a list of row dicts
+        (frames are built on the writer thread). Blocks while the queue is full.
+        """
+        # an empty DataFrame still carries the table's columns
+        if rows is not None and (len(rows) or isinstance(rows, pd.DataFrame) and len(rows.columns)):
+            self._put(("chunk", table_name, rows))
+
+    def chunk_callback(self, table_name):
+        """
+        Return an on_page callback that queues pages for table_name.
+        """
+        return lambda df: self.write_chunk(table_name, df)
+
+    def finish(self, table_name, **sync_stats):
+        """
+        Replace table_name with every chunk queued for it so far.
+        Returns a Future resolving to the row count (or the write error).
+        """
+        future = Future()
+        try:
+            self._put(("finish", table_name, (sync_stats, future)))
+        except RuntimeError as e:
+            future.set_exception(e)
+            return future
+        if not self._alive():
+            # the thread died after the put: nobody will resolve the Future
+            self._fail_pending()
+        return future
+
+    def discard(self, table_name):
+        """
+        Drop every chunk queued for table_name so far (e.g. after a failed fetch).
+        """
+        self._put(("discard", table_name, None))
+
+    def write(self, table_name, df, **sync_stats):
+        """
+        Queue a whole DataFrame as table_name. Returns finish()'s Future.
+        """
+        for key in ("snapshot_id", "etag", "cursor"):
+            if key in df.attrs:
+                sync_stats.setdefault(key, df.attrs[key])
+        self.write_chunk(table_name, df)
+        return self.finish(table_name, **sync_stats)
+
+    def close(self):
+        """
+        Write everything queued, then stop the thread and close the cursor.
+        """
+        if self._thread.is_alive():
+            try:
+                self._put(("stop", None, None))
+            except RuntimeError:
+                pass
+            self._thread.join()
+        self._fail_pending()
+        self._con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, op):
+        """
+        Queue op, blocking while the queue is full; raises RuntimeError
+        instead of blocking forever once the writer thread has stopped.
+        """
+        while True:
+            if not self._alive():
+                raise RuntimeError("DuckDB writer is closed") from self._died
+            try:
+                self._queue.put(op, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _alive(self):
+        return self._died is None and self._thread.is_alive()
+
+    def _fail_pending(self):
+        """
+        Fail the Future of every finish() still queued behind a dead thread.
+        """
+        error = RuntimeError("DuckDB writer is closed")
+        error.__cause__ = self._died
+        futures = [future for _, (_, future) in self._inflight]
+        while True:
+            try:
+                kind, _, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "finish":
+                futures.append(payload[1])
+        for future in futures:
+            try:
+                future.set_exception(error)
+            except InvalidStateError:
+                pass  # already resolved
+
+    # ---- writer thread ----
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException as e:
+            self._died = e
+            raise
+        finally:
+            if self._died is not None:
+                self._fail_pending()
+
+    def _loop(self):
+        op = None
+        while True:
+            if op is None:
+                op = self._queue.get()
+            kind, table_name, payload = op
+            op = None
+
+            if kind == "stop":
+                break
+
+            if kind == "discard":
+                self._discard(table_name, None)
+                self._errors.pop(table_name, None)
+                continue
+
+            if kind == "chunk":
+                start = time.perf_counter()
+                try:
+                    self._buffer(table_name, payload)
+                except Exception as e:
+                    self._discard(table_name, e)
+                self._seconds[table_name] = self._seconds.get(table_name, 0.0) + time.perf_counter() - start
+                continue
+
+            # group commit: every finish already queued goes into one transaction
+            finishes = [(table_name, payload)]
+            while len(finishes) < self.group_size:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op[0] != "finish":
+                    break
+                finishes.append((op[1], op[2]))
+                op = None
+
+            self._inflight = finishes
+            self._commit(finishes)
+            self._inflight = []
+
+    def _commit(self, finishes):
+        # stage the rest of the buffers first: temp tables created inside the
+        # transaction would vanish on a rollback, and a retry needs them
+        for table_name, _ in finishes:
+            if table_name in self._errors:
+                continue
+            start = time.perf_counter()
+            try:
+                self._stage(table_name)
+            except Exception as e:
+                self._discard(table_name, e)
+            self._seconds[table_name] = self._seconds.get(table_name, 0.0) + time.perf_counter() - start
+
+        self._con.execute("BEGIN TRANSACTION;")
+        try:
+            for table_name, (sync_stats, _) in finishes:
+                self._swap(table_name, sync_stats)
+            self._con.execute("COMMIT;")
+        except Exception as e:
+            self._con.execute("ROLLBACK;")
+            if len(finishes) > 1:
+                # isolate the failing table: every other one still commits
+                for finish in finishes:
+                    self._commit([finish])
+                return
+            table_name, (_, future) = finishes[0]
+            self._discard(table_name, e)
+            self._fail(table_name, future)
+            return
+
+        for table_name, (_, future) in finishes:
+            if table_name in self._errors:
+                self._reset(table_name)
+                self._fail(table_name, future)
+                continue
+            for stage in self._stages.pop(table_name, []):
+                self._con.execute(f"DROP TABLE IF EXISTS {stage}")
+            future.set_result(self._rows.get(table_name, 0))
+            self._reset(table_name)
+
+    def _buffer(self, table_name, rows):
+        if table_name in self._errors:
+            return
+        buffer = self._buffers.setdefault(table_name, [])
+        buffer.append(rows)
+        if sum(len(b) for b in buffer) >= self.stage_rows:
+            self._stage(table_name)
+
+    def _stage(self, table_name):
+        buffer = self._buffers.pop(table_name, [])
+        if not buffer:
+            return
+
+        with span("frame_build"):
+            frames = []
+            records = []
+            for chunk in buffer:
+                if isinstance(chunk, pd.DataFrame):
+                    if records:
+                        frames.append(pd.DataFrame(records))
+                        records = []
+                    frames.append(chunk)
+                else:
+                    records.extend(chunk)
+            if records:
+                frames.append(pd.DataFrame(records))
+            df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+        self._n_stages += 1
+        stage = f"_stage_{self._n_stages}"
+        with span("duckdb_stage", table=table_name, rows=len(df)):
+            self._con.register("_temp_chunk", df)
+            self._con.execute(f"CREATE TEMP TABLE {stage} AS SELECT * FROM _temp_chunk")
+            self._con.unregister("_temp_chunk")
+
+        self._stages.setdefault(table_name, []).append(stage)
+        self._rows[table_name] = self._rows.get(table_name, 0) + len(df)
+
+    def _swap(self, table_name, sync_stats):
+        """
+        Replace table_name with its staged rows inside the open transaction.
+        Leaves the stages in place, so a rolled-back swap can be retried.
+        """
+        if table_name in self._errors:
+            return
+
+        stages = self._stages.get(table_name, [])
+        rows = self._rows.get(table_name, 0)
+        if stages:
+            query = "\nUNION ALL BY NAME\n".join(f"SELECT * FROM {s}" for s in stages)
+        elif self._table_exists(table_name):
+            # nothing was written (e.g. the playlist was emptied): keep the columns, drop the rows
+            query = f"SELECT * FROM {table_name} LIMIT 0"
+        else:
+            # no rows and no table to take the columns from
+            return
+
+        start = time.perf_counter()
+        with span("duckdb_write", table=table_name, rows=rows):
+            self._con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {query}")
+            fn.duckdb_table_updated(
+                self._con, table_name,
+                row_count=rows,
+                write_seconds=self._seconds.get(table_name, 0.0) + time.perf_counter() - start,
+                **sync_stats
+            )
+
+    def _table_exists(self, table_name):
+        return self._con.execute("""
+            SELECT count(*) FROM information_schema.tables
+            WHERE table_schema = current_schema() AND table_name = ?;
+        """, [table_name]).fetchall()[0][0] > 0
+
+    def _discard(self, table_name, error):
+        """
+        Drop everything staged for table_name; its finish() will raise error.
+        """
+        self._errors.setdefault(table_name, error)
+        for stage in self._stages.pop(table_name, []):
+            self._con.execute(f"DROP TABLE IF EXISTS {stage}")
+        self._reset(table_name)
+
+    def _reset(self, table_name):
+        self._buffers.pop(table_name, None)
+        self._rows.pop(table_name, None)
+        self._seconds.pop(table_name, None)
+
+    def _fail(self, table_name, future):
+        future.set_exception(self._errors.pop(table_name))